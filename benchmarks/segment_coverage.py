@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Compares the vectorized per-asset coverage computation against the plain
+# Python loop on synthetic FIND_MATCHES results with many segments.
+#
+#   python benchmarks/segment_coverage.py --assets 200 --segments 5000
+
+import argparse
+import random
+import time
+
+from pex.analytics import segment_coverage
+from pex.export import ResultBatch
+
+
+def make_result(assets, segments, duration):
+    matches = []
+    for asset_id in range(assets):
+        audio = []
+        for _ in range(segments):
+            start = random.uniform(0, duration)
+            audio.append({
+                "query_start": start,
+                "query_end": start + random.uniform(1, 30),
+                "asset_start": start,
+                "asset_end": start + random.uniform(1, 30),
+            })
+        matches.append({"asset": {"id": asset_id}, "match_details": {"audio": {"segments": audio}}})
+    return {"lookup_ids": ["benchmark"], "matches": matches}
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--segments", type=int, default=2000, help="segments per asset")
+    parser.add_argument("--duration", type=float, default=3 * 3600, help="query duration in seconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    batch = ResultBatch.from_results([make_result(args.assets, args.segments, args.duration)])
+    print("{} assets, {} segments".format(args.assets, batch.num_rows))
+
+    naive, expected = timed(lambda: segment_coverage(batch, vectorized=False), args.repeat)
+    vectorized, actual = timed(lambda: segment_coverage(batch, vectorized=True), args.repeat)
+
+    for asset_id, cov in expected.items():
+        assert abs(cov.matched_seconds - actual[asset_id].matched_seconds) < 1e-6
+        assert len(cov.segments) == len(actual[asset_id].segments)
+
+    print("python loop: {:.4f}s".format(naive))
+    print("vectorized:  {:.4f}s ({:.1f}x)".format(vectorized, naive / vectorized))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,3 +4,27 @@ from pex.fingerprint import *
 from pex.private_search import *
 from pex.pex_search import *
 from pex.errors import *
+from pex.deadline import *
+from pex.cache import *
+from pex.singleflight import *
+from pex.reconcile import *
+from pex.pipeline import *
+from pex.export import *
+from pex.analytics import *
+from pex.stream import *
+from pex.scheduler import *
+from pex.limiter import *
+from pex.journal import *
+from pex.ratelimit import *
+from pex.probe import *
+from pex.workqueue import *
+from pex.spill import *
+from pex.breaker import *
+from pex.client import client_init_stats
+from pex.lib import (
+    track_native_objects,
+    native_objects,
+    native_object_sites,
+    reset_native_objects,
+    check_native_leaks,
+)
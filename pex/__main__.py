@@ -0,0 +1,241 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+"""
+Batch search runner.
+
+Reads a manifest with one item per line and searches every item. An item is
+either a path to a media file or an ISRC prefixed with "isrc:" (ISRC searches
+are only available with the pex search client). Empty lines and lines starting
+with "#" are ignored. Results are streamed as JSON lines in completion order.
+
+Usage:
+
+    python -m pex --output results.jsonl manifest.txt
+
+Credentials are read from the PEX_CLIENT_ID and PEX_CLIENT_SECRET environment
+variables unless passed on the command line.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import pex
+from pex.pipeline import SearchPipeline
+from pex.stats import LatencyRecorder
+
+ISRC_PREFIX = "isrc:"
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m pex",
+        description="Fingerprint and search every item listed in a manifest.",
+    )
+    parser.add_argument("manifest", help="file with one media path or isrc:<ISRC> per line")
+    parser.add_argument("-o", "--output", help="JSONL output file (default: stdout)")
+    parser.add_argument(
+        "--checkpoint",
+        help="file recording completed items; items found in it are skipped "
+             "(default: <output>.checkpoint when --output is set)",
+    )
+    parser.add_argument("--client", choices=["pex", "private"], default="pex")
+    parser.add_argument("--client-id", default=os.getenv("PEX_CLIENT_ID"))
+    parser.add_argument("--client-secret", default=os.getenv("PEX_CLIENT_SECRET"))
+    parser.add_argument(
+        "--type",
+        choices=[t.name.lower() for t in pex.PexSearchType],
+        default=pex.PexSearchType.IDENTIFY_MUSIC.name.lower(),
+        help="pex search type",
+    )
+    parser.add_argument(
+        "--ft-types",
+        default="all",
+        help="comma separated fingerprint types, e.g. audio,melody (default: all)",
+    )
+    parser.add_argument(
+        "--validate", action="store_true",
+        help="reject unsupported or too short media before fingerprinting",
+    )
+    parser.add_argument("--fingerprint-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--start-workers", type=int, default=8)
+    parser.add_argument("--collect-workers", type=int, default=16)
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=0,
+        help="capacity of the queues between the stages "
+             "(default: twice the number of workers of the next stage)",
+    )
+    return parser.parse_args(argv)
+
+
+def _parse_ft_types(value):
+    ft_types = 0
+    for name in value.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        try:
+            ft_types |= pex.FingerprintType[name.upper()]
+        except KeyError:
+            raise SystemExit("unknown fingerprint type: {}".format(name))
+    return pex.FingerprintType(ft_types)
+
+
+def _read_manifest(path):
+    with open(path) as f:
+        for line in f:
+            item = line.strip()
+            if item and not item.startswith("#"):
+                yield item
+
+
+def _read_checkpoint(path):
+    if path is None or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(line.rstrip("\n") for line in f if line.strip())
+
+
+def _error_dict(err):
+    if isinstance(err, pex.Error):
+        return {
+            "code": err.code.name,
+            "message": err.message,
+            "is_retryable": err.is_retryable,
+        }
+    return {"code": type(err).__name__, "message": str(err), "is_retryable": False}
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if not args.client_id or not args.client_secret:
+        raise SystemExit("missing credentials: set PEX_CLIENT_ID and PEX_CLIENT_SECRET")
+
+    checkpoint_path = args.checkpoint
+    if checkpoint_path is None and args.output:
+        checkpoint_path = args.output + ".checkpoint"
+    completed = _read_checkpoint(checkpoint_path)
+
+    validator = pex.MediaValidator() if args.validate else None
+    if args.client == "pex":
+        client = pex.PexSearchClient(args.client_id, args.client_secret, validator=validator)
+    else:
+        client = pex.PrivateSearchClient(args.client_id, args.client_secret, validator=validator)
+
+    out = open(args.output, "a") if args.output else sys.stdout
+    checkpoint = open(checkpoint_path, "a") if checkpoint_path else None
+    ft_types = _parse_ft_types(args.ft_types)
+    search_type = pex.PexSearchType[args.type.upper()]
+    pipeline = SearchPipeline(
+        client,
+        fingerprint_workers=args.fingerprint_workers,
+        start_workers=args.start_workers,
+        collect_workers=args.collect_workers,
+        queue_size=args.queue_size or None,
+        ft_types=ft_types,
+        type=search_type,
+    )
+    latency = LatencyRecorder()
+    counts = {"ok": 0, "failed": 0, "skipped": 0}
+    keys = {}
+
+    def items():
+        # Runs on the pipeline's feeder thread, the keys are remembered by
+        # the index the pipeline gives the items (their position among the
+        # yielded ones) because the pipeline sees ISRC items as requests.
+        # ISRC items given to the private client fail individually in the
+        # pipeline.
+        index = 0
+        for item in _read_manifest(args.manifest):
+            if item in completed:
+                counts["skipped"] += 1
+                continue
+            keys[index] = item
+            index += 1
+            if item.startswith(ISRC_PREFIX):
+                yield pex.ISRCSearchRequest(item[len(ISRC_PREFIX):], ft_types, search_type)
+            else:
+                yield item
+
+    started = time.monotonic()
+    try:
+        for res in pipeline.run(items()):
+            item = keys.pop(res.index)
+            error = res.error
+            latency.record(res.latency)
+            record = {"item": item, "latency": round(res.latency, 6)}
+            if error is None:
+                counts["ok"] += 1
+                record["result"] = res.result
+            else:
+                counts["failed"] += 1
+                record["error"] = _error_dict(error)
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+
+            # Items that failed with a retryable error are not checkpointed
+            # so that they're retried on the next run.
+            if checkpoint is not None and (error is None or not getattr(error, "is_retryable", False)):
+                checkpoint.write(item + "\n")
+                checkpoint.flush()
+    except KeyboardInterrupt:
+        print("interrupted, progress has been checkpointed", file=sys.stderr)
+        return 130
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if checkpoint is not None:
+            checkpoint.close()
+
+    elapsed = time.monotonic() - started
+    _print_summary(counts, elapsed, latency, pipeline.stats, validator)
+    return 0 if counts["failed"] == 0 else 1
+
+
+def _print_summary(counts, elapsed, latency, stages, validator=None):
+    processed = counts["ok"] + counts["failed"]
+    summary = latency.summary()
+    print(
+        "processed: {} (ok: {}, failed: {}, skipped: {})".format(
+            processed, counts["ok"], counts["failed"], counts["skipped"]
+        ),
+        file=sys.stderr,
+    )
+    print(
+        "elapsed: {:.2f}s, throughput: {:.2f} items/s".format(
+            elapsed, processed / elapsed if elapsed > 0 else 0.0
+        ),
+        file=sys.stderr,
+    )
+    if processed:
+        print(
+            "latency: p50={:.3f}s p90={:.3f}s p99={:.3f}s max={:.3f}s".format(
+                summary["p50"], summary["p90"], summary["p99"], summary["max"]
+            ),
+            file=sys.stderr,
+        )
+    for name, stats in stages.items():
+        print(
+            "stage {}: workers={} processed={} failed={} utilization={:.0%} blocked={:.2f}s".format(
+                name, stats.workers, stats.processed, stats.failed,
+                stats.utilization, stats.blocked_seconds,
+            ),
+            file=sys.stderr,
+        )
+    if validator is not None:
+        stats = validator.stats()
+        print(
+            "pre-check: checked={} rejected={} {} cpu_saved={:.2f}s".format(
+                stats["checked"], stats["rejected"], stats["rejected_by_reason"],
+                stats["cpu_saved_seconds"],
+            ),
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+from array import array
+from collections import namedtuple
+
+from pex.export import MATCH_TYPES, NO_MATCH, ResultBatch, np
+
+
+AssetCoverage = namedtuple(
+    "AssetCoverage", ["asset_id", "matched_seconds", "longest_match", "segments"]
+)
+AssetCoverage.__doc__ = """
+Coverage of a single asset computed by :func:`segment_coverage`. The segments
+are the merged, non-overlapping (start, end) intervals sorted by start,
+matched_seconds is their total length and longest_match is the length of the
+longest one.
+"""
+
+
+def _to_batch(results):
+    if isinstance(results, ResultBatch):
+        return results
+    if isinstance(results, dict):
+        results = [results]
+    return ResultBatch.from_results(results)
+
+
+def _columns(batch, side, match_types):
+    assets = batch.column("asset_id")
+    starts = batch.column(side + "_start")
+    ends = batch.column(side + "_end")
+    match_type = batch.column("match_type")
+    if match_types is None:
+        # Rows recording searches without matches have no segment.
+        if NO_MATCH not in match_type:
+            return assets, starts, ends
+        match_types = MATCH_TYPES
+    codes = set(MATCH_TYPES.index(t) for t in match_types)
+    keep = [i for i, c in enumerate(match_type) if c in codes]
+    return [assets[i] for i in keep], [starts[i] for i in keep], [ends[i] for i in keep]
+
+
+def _coverage_python(assets, starts, ends):
+    by_asset = {}
+    for asset, start, end in zip(assets, starts, ends):
+        by_asset.setdefault(asset, []).append((start, max(start, end)))
+
+    res = {}
+    for asset, segments in by_asset.items():
+        merged = []
+        for start, end in sorted(segments):
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        lengths = [end - start for start, end in merged]
+        res[asset] = AssetCoverage(asset, sum(lengths), max(lengths), merged)
+    return res
+
+
+def _float_array(values):
+    # Batch columns are typed arrays that can be wrapped without copying.
+    if isinstance(values, array) and values.typecode == "d":
+        return np.frombuffer(values, dtype=np.float64)
+    return np.asarray(values, dtype=np.float64)
+
+
+def _coverage_numpy(assets, starts, ends):
+    if len(assets) == 0:
+        return {}
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(a, len(index)) for a in assets), dtype=np.int64, count=len(assets)
+    )
+    names = list(index)
+    starts = _float_array(starts)
+    ends = _float_array(ends)
+
+    # Shift every asset into its own disjoint range of the number line, so a
+    # single sort and running maximum handle all the assets at once.
+    base = min(starts.min(), ends.min())
+    span = max(starts.max(), ends.max()) - base + 1.0
+    shifted_starts = starts - base + codes * span
+    shifted_ends = np.maximum(ends, starts) - base + codes * span
+
+    order = np.lexsort((shifted_starts, codes))
+    shifted_starts = shifted_starts[order]
+    shifted_ends = shifted_ends[order]
+    codes = codes[order]
+
+    # A merged segment starts wherever a segment begins after every segment
+    # before it (of the same asset) has ended.
+    reach = np.maximum.accumulate(shifted_ends)
+    new = np.empty(len(order), dtype=bool)
+    new[0] = True
+    new[1:] = shifted_starts[1:] > reach[:-1]
+    first = np.flatnonzero(new)
+
+    merged_codes = codes[first]
+    offsets = merged_codes * span - base
+    merged_starts = shifted_starts[first] - offsets
+    merged_ends = np.maximum.reduceat(shifted_ends, first) - offsets
+    lengths = merged_ends - merged_starts
+
+    totals = np.bincount(merged_codes, weights=lengths, minlength=len(names))
+    longest = np.zeros(len(names))
+    np.maximum.at(longest, merged_codes, lengths)
+    bounds = np.searchsorted(merged_codes, np.arange(len(names) + 1))
+
+    res = {}
+    for code, asset in enumerate(names):
+        lo, hi = bounds[code], bounds[code + 1]
+        segments = list(zip(merged_starts[lo:hi].tolist(), merged_ends[lo:hi].tolist()))
+        res[asset] = AssetCoverage(asset, float(totals[code]), float(longest[code]), segments)
+    return res
+
+
+def _coverage(assets, starts, ends, vectorized):
+    if vectorized is None:
+        vectorized = np is not None
+    if not vectorized:
+        return _coverage_python(assets, starts, ends)
+    if np is None:
+        raise RuntimeError("numpy is required for vectorized coverage")
+    return _coverage_numpy(assets, starts, ends)
+
+
+def segment_coverage(results, side="query", match_types=None, vectorized=None):
+    """
+    Computes per-asset coverage of one or more search results: overlapping
+    matched segments are merged and for every asset the total matched time
+    and the longest contiguous match are computed. The work is done with
+    vectorized NumPy operations over all the segments at once when NumPy is
+    installed, otherwise it falls back to plain Python.
+
+    :param results: a search result dict, a list of them or a :class:`ResultBatch`.
+    :param str side: "query" to measure the coverage of the searched media, "asset" to measure the coverage of the matched assets.
+    :param match_types: optional subset of :data:`MATCH_TYPES` to consider, e.g. ["audio"].
+    :param bool vectorized: force (True) or disable (False) the NumPy implementation.
+    :rtype: Dict[str, AssetCoverage]
+    """
+    if side not in ("query", "asset"):
+        raise ValueError("side must be either 'query' or 'asset'")
+    assets, starts, ends = _columns(_to_batch(results), side, match_types)
+    return _coverage(assets, starts, ends, vectorized)
+
+
+def merge_segments(segments, vectorized=None):
+    """
+    Merges overlapping (start, end) segments and returns them sorted by start.
+
+    :param segments: iterable of (start, end) tuples.
+    :param bool vectorized: force (True) or disable (False) the NumPy implementation.
+    :rtype: List[Tuple[float, float]]
+    """
+    segments = list(segments)
+    assets = [""] * len(segments)
+    starts = [s for s, _ in segments]
+    ends = [e for _, e in segments]
+    res = _coverage(assets, starts, ends, vectorized)
+    return res[""].segments if res else []
@@ -0,0 +1,223 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import threading
+import time
+from collections import deque
+from enum import Enum
+
+from pex.errors import Error, Code
+
+
+class BreakerState(Enum):
+    """
+    States of a :class:`CircuitBreaker`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker(object):
+    """
+    CircuitBreaker makes the network calls of a client fail fast while the
+    backend is unavailable, instead of every call waiting out its timeout.
+    Calls failing with one of the failure codes (CONNECTION_ERROR and
+    DEADLINE_EXCEEDED by default) count as failures, any other outcome as a
+    success; deadlines passing while a call waits in the client (e.g. for the
+    rate limiter) are not counted. Once at least min_calls calls were made in the last window
+    seconds and the failure rate reaches failure_rate, the circuit opens and
+    calls fail immediately with a retryable :attr:`Code.CONNECTION_ERROR`.
+    After open_seconds the circuit is half-open: up to half_open_calls
+    concurrent probe calls go through, and the circuit closes once that many
+    succeeded, or opens again on the first failure. Pass it to the client
+    constructor to enable it:
+
+        breaker = pex.CircuitBreaker(on_state_change=lambda old, new: log.warning("%s -> %s", old, new))
+        client = pex.PexSearchClient(CLIENT_ID, CLIENT_SECRET, breaker=breaker)
+    """
+
+    def __init__(
+        self,
+        failure_codes=(Code.CONNECTION_ERROR, Code.DEADLINE_EXCEEDED),
+        failure_rate=0.5,
+        min_calls=20,
+        window=30,
+        open_seconds=10,
+        half_open_calls=3,
+        on_state_change=None,
+        history=1000,
+    ):
+        """
+        Constructor.
+
+        :param failure_codes: error codes counted as failures.
+        :param float failure_rate: failure rate (0-1) that opens the circuit.
+        :param int min_calls: number of calls in the window below which the circuit stays closed.
+        :param float window: number of seconds the failure rate is computed over.
+        :param float open_seconds: number of seconds the circuit stays open before probing.
+        :param int half_open_calls: number of probe calls while half-open.
+        :param on_state_change: optional callable receiving the old and the new
+                                :class:`BreakerState`, called outside of the breaker's lock.
+        :param int history: number of state changes kept in :attr:`events`.
+        """
+        if not 0 < failure_rate <= 1:
+            raise ValueError("failure_rate must be in (0, 1]")
+        self._failure_codes = frozenset(failure_codes)
+        self._failure_rate = failure_rate
+        self._min_calls = min_calls
+        self._window = window
+        self._open_seconds = open_seconds
+        self._half_open_calls = half_open_calls
+        self._on_state_change = on_state_change
+        self._lock = threading.Lock()
+        self._state = BreakerState.CLOSED
+        self._opened_at = 0.0
+        self._generation = 0
+        self._buckets = deque()  # [second, calls, failures]
+        self._probes = 0
+        self._probe_successes = 0
+        self._events = deque(maxlen=history)
+        self._rejected = 0
+        self._opened = 0
+        self._failures = 0
+        self._calls = 0
+
+    @property
+    def state(self):
+        """
+        Current state of the circuit.
+
+        :type: BreakerState
+        """
+        changes = []
+        with self._lock:
+            self._update(time.monotonic(), changes)
+            state = self._state
+        self._notify(changes)
+        return state
+
+    @property
+    def events(self):
+        """
+        Recent state changes as (time.time(), old state, new state) tuples.
+
+        :type: List[tuple]
+        """
+        return list(self._events)
+
+    def _run(self, fn, *args):
+        admitted = self._admit()
+        # Other exceptions are neither a success nor a failure of the backend.
+        failed = None
+        try:
+            res = fn(*args)
+            failed = False
+            return res
+        except Error as err:
+            # Deadlines passing while the call waits on the client side
+            # (rate limiter, scheduler, concurrency limiter, native lock)
+            # don't tell anything about the backend.
+            if not getattr(err, "_local", False):
+                failed = err.code in self._failure_codes
+            raise
+        finally:
+            self._record(admitted, failed)
+
+    def _admit(self):
+        # Returns the generation and the state the call was admitted in, or
+        # raises if the circuit is open.
+        changes = []
+        with self._lock:
+            self._update(time.monotonic(), changes)
+            state = self._state
+            if state == BreakerState.HALF_OPEN:
+                if self._probes >= self._half_open_calls:
+                    state = BreakerState.OPEN
+                else:
+                    self._probes += 1
+            if state == BreakerState.OPEN:
+                self._rejected += 1
+            admitted = (self._generation, state)
+        self._notify(changes)
+        if state == BreakerState.OPEN:
+            raise Error(Code.CONNECTION_ERROR, "circuit breaker open", True)
+        return admitted
+
+    def _record(self, admitted, failed):
+        generation, state = admitted
+        changes = []
+        now = time.monotonic()
+        with self._lock:
+            if failed is not None:
+                self._calls += 1
+                self._failures += failed
+            if generation != self._generation:
+                # Admitted before the last state change, its outcome is stale.
+                pass
+            elif state == BreakerState.HALF_OPEN:
+                self._probes -= 1
+                if failed:
+                    self._open(now, changes)
+                elif failed is not None:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self._half_open_calls:
+                        self._set(BreakerState.CLOSED, changes)
+            elif failed is not None:
+                second = int(now)
+                if not self._buckets or self._buckets[-1][0] != second:
+                    self._buckets.append([second, 0, 0])
+                self._buckets[-1][1] += 1
+                self._buckets[-1][2] += failed
+                self._update(now, changes)
+                calls = sum(b[1] for b in self._buckets)
+                failures = sum(b[2] for b in self._buckets)
+                if calls >= self._min_calls and failures >= self._failure_rate * calls:
+                    self._open(now, changes)
+        self._notify(changes)
+
+    def _update(self, now, changes):
+        # Drops the expired buckets and moves an open circuit to half-open.
+        while self._buckets and self._buckets[0][0] <= now - self._window:
+            self._buckets.popleft()
+        if self._state == BreakerState.OPEN and now - self._opened_at >= self._open_seconds:
+            self._probes = 0
+            self._probe_successes = 0
+            self._set(BreakerState.HALF_OPEN, changes)
+
+    def _open(self, now, changes):
+        self._opened_at = now
+        self._opened += 1
+        self._set(BreakerState.OPEN, changes)
+
+    def _set(self, state, changes):
+        old = self._state
+        self._state = state
+        self._generation += 1
+        self._buckets.clear()
+        self._events.append((time.time(), old, state))
+        changes.append((old, state))
+
+    def _notify(self, changes):
+        if self._on_state_change is not None:
+            for old, new in changes:
+                self._on_state_change(old, new)
+
+    def stats(self):
+        """
+        Returns the current state, the number of calls and failures counted
+        since the breaker was created, the number of calls rejected while
+        open and the number of times the circuit opened.
+
+        :rtype: dict
+        """
+        return {
+            "state": self.state.value,
+            "calls": self._calls,
+            "failures": self._failures,
+            "rejected": self._rejected,
+            "opened": self._opened,
+        }
+
+    def __repr__(self):
+        return "CircuitBreaker(state={})".format(self._state.value)
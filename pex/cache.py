@@ -0,0 +1,237 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryCacheBackend(object):
+    """
+    Stores cached search results in memory. Once the backend holds
+    max_entries results, the least recently used one is evicted.
+    """
+
+    def __init__(self, max_entries=10000):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCacheBackend(object):
+    """
+    Stores cached search results in an SQLite database on a local disk, so
+    they survive process restarts and can be shared by processes on the same
+    host. Once the database holds max_entries results, the least recently
+    used ones are evicted.
+    """
+
+    def __init__(self, path, max_entries=100000):
+        self._max_entries = max_entries
+        self._evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " used_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_used_at ON results (used_at)")
+            # The number of results is maintained by triggers, so that it's
+            # exact for all the processes sharing the database and a put
+            # doesn't have to count the table.
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results_count ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " n INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "INSERT OR IGNORE INTO results_count (id, n) SELECT 0, COUNT(*) FROM results"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results"
+                " BEGIN UPDATE results_count SET n = n + 1; END"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results"
+                " BEGIN UPDATE results_count SET n = n - 1; END"
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE results SET used_at = ? WHERE key = ?", (time.time(), key)
+                )
+            return row
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE: replacing deletes the
+            # row without firing the delete trigger.
+            self._db.execute(
+                "INSERT INTO results (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET"
+                " value = excluded.value, expires_at = excluded.expires_at, used_at = excluded.used_at",
+                (key, value, expires_at, time.time()),
+            )
+            count = self._count()
+            if count > self._max_entries:
+                cur = self._db.execute(
+                    "DELETE FROM results WHERE key IN ("
+                    " SELECT key FROM results ORDER BY used_at LIMIT ?)",
+                    (count - self._max_entries,),
+                )
+                self._evictions += cur.rowcount
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+    def _count(self):
+        return self._db.execute("SELECT n FROM results_count").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._count()
+
+
+class SearchCache(object):
+    """
+    SearchCache stores search results so that searching the same content again
+    doesn't start a new search on the backend service. Results are keyed by a
+    hash of the fingerprint (or by the ISRC and fingerprint types) and the
+    search type. Pass it to the client constructor to enable it:
+
+        cache = pex.SearchCache(ttl=3600)
+        client = pex.PexSearchClient(CLIENT_ID, CLIENT_SECRET, cache=cache)
+
+    Only successful results are cached. Since the results depend on the
+    catalog of the account, a cache backend should not be shared by clients
+    using different credentials.
+    """
+
+    def __init__(self, ttl=3600, backend=None):
+        """
+        Constructor.
+
+        :param float ttl: number of seconds a result stays valid.
+        :param backend: where the results are stored, :class:`MemoryCacheBackend` by default.
+        """
+        self._ttl = ttl
+        self._backend = backend if backend is not None else MemoryCacheBackend()
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached result for the key or None if there's no valid one.
+
+        :rtype: dict
+        """
+        entry = self._backend.get(key)
+        if entry is not None and entry[1] < time.time():
+            self._backend.delete(key)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return json.loads(entry[0])
+
+    def put(self, key, result):
+        self._backend.set(key, json.dumps(result), time.time() + self._ttl)
+
+    def clear(self):
+        self._backend.clear()
+
+    @property
+    def hits(self):
+        """
+        Number of lookups that returned a cached result.
+
+        :type: int
+        """
+        return self._hits
+
+    @property
+    def misses(self):
+        """
+        Number of lookups that didn't find a valid cached result.
+
+        :type: int
+        """
+        return self._misses
+
+    @property
+    def hit_rate(self):
+        """
+        Fraction of lookups that returned a cached result.
+
+        :type: float
+        """
+        total = self._hits + self._misses
+        return self._hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._backend)
+
+    def __repr__(self):
+        return "SearchCache(entries={}, hits={}, misses={})".format(
+            len(self), self._hits, self._misses
+        )
@@ -1,10 +1,28 @@
 # Copyright 2023 Pexeso Inc. All rights reserved.
 
 import ctypes
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from enum import IntEnum
 
-from .lib import _lib, _Pex_Client, _Pex_Status, _Pex_Lock
+from .lib import (
+    _lib,
+    _Pex_Client,
+    _Pex_Status,
+    _Pex_Lock,
+    _Pex_Buffer,
+    _Pex_StartSearchRequest,
+    _Pex_StartSearchResult,
+    _Pex_CheckSearchRequest,
+    _Pex_CheckSearchResult,
+)
 from pex.errors import Error, Code
+from pex.fingerprint import _Fingerprinter
+from pex.deadline import Deadline, _check, _with_deadline
+from pex.singleflight import _Call
+from pex.stats import LatencyRecorder
 
 
 class _ClientType(IntEnum):
@@ -35,3 +53,421 @@ def _init_client(client_type, client_id, client_secret):
         if status.code != Code.OK:
             raise status
         return c_client
+
+
+class _NativeClient(object):
+    # Holds the native client, initialized either right away or on a
+    # background thread. get() waits for the initialization and raises its
+    # error, if any.
+    def __init__(self, client_type, client_id, client_secret, background=False, key=None):
+        self._c_client = None
+        self._error = None
+        self._key = key
+        self._done = threading.Event()
+        self.init_seconds = None
+        args = (client_type, client_id, client_secret)
+        if background:
+            threading.Thread(target=self._init, args=args, daemon=True).start()
+        else:
+            self._init(*args)
+            if self._error is not None:
+                raise self._error
+
+    def _init(self, *args):
+        started = time.monotonic()
+        try:
+            self._c_client = _init_client(*args)
+        except Exception as err:
+            self._error = err
+        self.init_seconds = time.monotonic() - started
+        _registry._initialized(self)
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            return False
+        if self._error is not None:
+            raise self._error
+        return True
+
+    def get(self):
+        self.wait()
+        return self._c_client.get()
+
+
+class _Registry(object):
+    # Process-wide registry of the native clients shared by the clients
+    # created with shared=True, keyed by client type and credentials.
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._inits = 0
+        self._failures = 0
+        self._reused = 0
+        self._init_seconds = LatencyRecorder()
+
+    def get(self, client_type, client_id, client_secret, background, shared):
+        if not shared:
+            return _NativeClient(client_type, client_id, client_secret, background)
+        key = (client_type, client_id, client_secret)
+        with self._lock:
+            native = self._clients.get(key)
+            if native is not None:
+                self._reused += 1
+                return native
+            if background:
+                native = self._clients[key] = _NativeClient(*key, background=True, key=key)
+                return native
+        # Initialized outside of the lock, concurrent first uses of the same
+        # credentials may initialize more than one client, only one is kept.
+        native = _NativeClient(*key, key=key)
+        with self._lock:
+            return self._clients.setdefault(key, native)
+
+    def _initialized(self, native):
+        with self._lock:
+            self._inits += 1
+            if native._error is not None:
+                self._failures += 1
+                # Don't share a client that failed to initialize.
+                if self._clients.get(native._key) is native:
+                    del self._clients[native._key]
+        self._init_seconds.record(native.init_seconds)
+
+    def stats(self, ps):
+        with self._lock:
+            return {
+                "inits": self._inits,
+                "failures": self._failures,
+                "shared": len(self._clients),
+                "reused": self._reused,
+                "init_seconds": self._init_seconds.summary(ps),
+            }
+
+
+_registry = _Registry()
+
+
+def client_init_stats(ps=(50, 90, 99)):
+    """
+    Returns the number of native client initializations in this process
+    (Pex_Init and Pex_Client_Init, including authentication) and of failed
+    ones, the percentiles of their duration in seconds, the number of
+    shared clients in the registry and the number of times a shared client
+    was reused instead of initializing a new one.
+
+    :rtype: dict
+    """
+    return _registry.stats(ps)
+
+
+def _start_search(c_client, ft=None, isrc=None, ft_types=None, type=None, deadline=None):
+    with (
+        _Pex_Lock.new(_lib) as c_lock,
+        _Pex_Status.new(_lib) as c_status,
+        _Pex_Buffer.new(_lib) as c_ft,
+        _Pex_StartSearchRequest.new(_lib) as c_req,
+        _Pex_StartSearchResult.new(_lib) as c_res,
+    ):
+        _check(deadline)
+
+        if isrc is not None:
+            _lib.Pex_StartSearchRequest_SetISRC(
+                c_req.get(), isrc.encode(), int(ft_types)
+            )
+        else:
+            _lib.Pex_Buffer_Set(c_ft.get(), ft._ft, len(ft._ft))
+            _lib.Pex_StartSearchRequest_SetFingerprint(
+                c_req.get(), c_ft.get(), c_status.get()
+            )
+            Error.check_status(c_status)
+
+        if type is not None:
+            _lib.Pex_StartSearchRequest_SetType(c_req.get(), type)
+
+        _lib.Pex_StartSearch(
+            c_client.get(), c_req.get(), c_res.get(), c_status.get()
+        )
+        Error.check_status(c_status)
+
+        lookup_ids = list()
+        c_lookup_id_pos = ctypes.c_size_t(0)
+        c_lookup_id = ctypes.c_char_p()
+
+        while _lib.Pex_StartSearchResult_NextLookupID(
+            c_res.get(),
+            ctypes.byref(c_lookup_id_pos),
+            ctypes.byref(c_lookup_id)
+        ):
+            lookup_ids.append(c_lookup_id.value.decode())
+
+        return lookup_ids
+
+
+def _check_search(raw_c_client, lookup_ids, deadline=None):
+    with (
+        _Pex_Lock.new(_lib) as c_lock,
+        _Pex_Status.new(_lib) as c_status,
+        _Pex_CheckSearchRequest.new(_lib) as c_req,
+        _Pex_CheckSearchResult.new(_lib) as c_res,
+    ):
+        _check(deadline)
+
+        for lookup_id in lookup_ids:
+            _lib.Pex_CheckSearchRequest_AddLookupID(
+                c_req.get(), lookup_id.encode()
+            )
+
+        _lib.Pex_CheckSearch(
+            raw_c_client, c_req.get(), c_res.get(), c_status.get()
+        )
+        Error.check_status(c_status)
+
+        res = _lib.Pex_CheckSearchResult_GetJSON(c_res.get())
+        j = json.loads(res)
+        j['lookup_ids'] = lookup_ids
+        return j
+
+
+def _map_unordered(fn, items, max_workers):
+    # Applies fn to the items on a pool of max_workers threads and yields
+    # the results as they finish. At most max_workers items are submitted at
+    # once, so the items are consumed lazily.
+    pending = set()
+    with ThreadPoolExecutor(max_workers) as executor:
+        for item in items:
+            pending.add(executor.submit(fn, item))
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    yield f.result()
+
+        for f in as_completed(pending):
+            yield f.result()
+
+
+class _Guard(object):
+    # Bundles the optional policies the network calls of a client go
+    # through: the circuit breaker, the host rate limiter, the priority
+    # scheduler and the concurrency limiter. The op is the operation class
+    # of the call (see pex.ratelimit.OPERATION_CLASSES).
+    def __init__(self, scheduler=None, limiter=None, rate_limiter=None, breaker=None):
+        self.scheduler = scheduler
+        self.limiter = limiter
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker
+
+    def priority(self):
+        # The priority class is taken from the calling thread, so it has to
+        # be captured before the call moves to another thread.
+        if self.scheduler is None:
+            return None
+        return self.scheduler._current()
+
+    def run(self, op, priority, deadline, fn, *args):
+        # An open circuit fails before waiting for anything.
+        if self.breaker is not None:
+            return self.breaker._run(self._run, op, priority, deadline, fn, *args)
+        return self._run(op, priority, deadline, fn, *args)
+
+    def _run(self, op, priority, deadline, fn, *args):
+        # Waiting for a token doesn't hold a scheduler or limiter slot.
+        if self.rate_limiter is not None:
+            self.rate_limiter._acquire(op, deadline)
+        if self.limiter is not None:
+            fn, args = self.limiter._run, (deadline, fn) + args
+        if self.scheduler is not None:
+            return self.scheduler._run(priority, deadline, fn, *args)
+        return fn(*args)
+
+
+class _SearchFuture(object):
+    _kind = None
+
+    def __init__(
+        self, c_client, lookup_ids, cache=None, cache_key=None, guard=None, priority=None,
+    ):
+        self._raw_c_client = c_client.get()
+        self._lookup_ids = lookup_ids
+        self._cache = cache
+        self._cache_key = cache_key
+        self._guard = guard if guard is not None else _Guard()
+        self._priority = priority
+        self._result = None
+        self._pending = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _from_result(cls, c_client, result):
+        future = cls(c_client, result.get('lookup_ids', []))
+        future._result = result
+        return future
+
+    @classmethod
+    def _from_json(cls, client, data):
+        if isinstance(data, (str, bytes)):
+            data = json.loads(data)
+        if data.get("kind") != cls._kind:
+            raise ValueError("not a {} search: {}".format(cls._kind, data.get("kind")))
+        return cls(
+            client._c_client, list(data["lookup_ids"]), client._cache, data.get("key"),
+            client._guard, client._guard.priority(),
+        )
+
+    def _add_done_callback(self, fn):
+        self._callbacks.append(fn)
+
+    def to_json(self):
+        """
+        Serializes the future, e.g. to store it in a journal. Restore it
+        with the resume_search method of a client of the same type, in this
+        or another process, to retrieve the result of the search without
+        starting it again.
+
+        :rtype: str
+        """
+        return json.dumps({
+            "kind": self._kind,
+            "lookup_ids": self._lookup_ids,
+            "key": self._cache_key,
+        })
+
+    def get(self, deadline=None):
+        """
+        Blocks until the search result is ready and then returns it. Once
+        retrieved, the result is kept and returned by subsequent calls.
+        Concurrent calls share a single retrieval.
+
+        :param deadline: optional :class:`Deadline` or number of seconds
+                         after which the call fails with DEADLINE_EXCEEDED.
+        :raise: :class:`Error` if the search couldn't be performed, e.g.
+                because of network issues.
+        :rtype: dict
+        """
+        deadline = Deadline._from(deadline)
+        with self._lock:
+            if self._result is not None:
+                return self._result
+            leader = self._pending is None
+            if leader:
+                self._pending = _Call()
+            call = self._pending
+
+        if leader:
+            if deadline is None:
+                self._retrieve(call, None)
+            else:
+                deadline.check()
+                threading.Thread(target=self._retrieve, args=(call, deadline), daemon=True).start()
+        return call.wait(deadline)
+
+    def _retrieve(self, call, deadline):
+        try:
+            call.result = self._guard.run(
+                "check", self._priority, deadline, _check_search, self._raw_c_client,
+                self._lookup_ids, deadline,
+            )
+        except Exception as err:
+            call.error = err
+        with self._lock:
+            self._pending = None
+            self._result = call.result
+        call.done.set()
+
+        if call.error is None and self._cache is not None:
+            self._cache.put(self._cache_key, call.result)
+        for fn in self._callbacks:
+            fn()
+
+    @property
+    def lookup_ids(self):
+        """
+        A list of IDs that uniquely identify a particular search. Can be
+        used for diagnostics.
+
+        :type: List[str]
+        """
+        return self._lookup_ids
+
+
+class _SearchClient(_Fingerprinter):
+    _future_cls = None
+
+    def __init__(
+        self, client_type, client_id, client_secret, cache=None, single_flight=None,
+        scheduler=None, limiter=None, rate_limiter=None, validator=None,
+        background_init=False, shared=False, breaker=None,
+    ):
+        self._c_client = _registry.get(client_type, client_id, client_secret, background_init, shared)
+        self._cache = cache
+        self._single_flight = single_flight
+        self._guard = _Guard(scheduler, limiter, rate_limiter, breaker)
+        super().__init__(self._c_client, scheduler, validator)
+
+    def wait_ready(self, timeout=None):
+        """
+        Waits for the client initialization started with background_init to
+        finish. Calls made before that wait for it too, so calling this
+        method is only needed to report initialization errors early.
+
+        :param float timeout: maximum number of seconds to wait.
+        :raise: :class:`Error` if the initialization failed.
+        :rtype: bool
+        :return: whether the initialization finished within the timeout.
+        """
+        return self._c_client.wait(timeout)
+
+    @property
+    def init_seconds(self):
+        """
+        Number of seconds the initialization of the native client took, None
+        while it's in progress. For shared clients it's the duration of the
+        initialization of the first client.
+
+        :type: float
+        """
+        return self._c_client.init_seconds
+
+    def resume_search(self, data):
+        """
+        Restores a future serialized with its to_json method. The search
+        isn't started again, only its result is retrieved.
+
+        :param str data: serialized future.
+        :raise: ValueError if the future belongs to a different type of client.
+        :rtype: PexSearchFuture or PrivateSearchFuture
+        """
+        return self._future_cls._from_json(self, data)
+
+    def _needs_key(self):
+        return self._cache is not None or self._single_flight is not None
+
+    def _start(self, future_cls, key, start, deadline=None):
+        # The key identifies the search for the cache and single flight, it's
+        # None when neither of them is enabled. The start function receives
+        # the deadline and returns the lookup IDs.
+        deadline = Deadline._from(deadline)
+
+        def start_future():
+            priority = self._guard.priority()
+            lookup_ids = self._call("search", deadline, start, deadline)
+            return future_cls(
+                self._c_client, lookup_ids, self._cache, key, self._guard, priority
+            )
+
+        if key is None:
+            return start_future()
+        if self._cache is not None:
+            result = self._cache.get(key)
+            if result is not None:
+                return future_cls._from_result(self._c_client, result)
+        if self._single_flight is not None:
+            return self._single_flight._do(key, start_future, deadline)
+        return start_future()
+
+    def _call(self, op, deadline, fn, *args):
+        # Runs a network call through the guard, on its own thread if there's
+        # a deadline.
+        priority = self._guard.priority()
+        return _with_deadline(deadline, self._guard.run, op, priority, deadline, fn, *args)
@@ -0,0 +1,108 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import threading
+import time
+
+from pex.errors import Error, Code
+
+
+class Deadline(object):
+    """
+    Deadline is a point in time after which an operation is abandoned and
+    fails with :attr:`Code.DEADLINE_EXCEEDED`. Methods that accept a deadline
+    take either a Deadline or a number of seconds; pass the same Deadline to
+    several calls to give them a shared time budget.
+
+    The native calls can't be interrupted: a call with a deadline runs on a
+    separate thread, and when the deadline passes the caller stops waiting
+    but the thread keeps running until the native call returns. Each
+    abandoned call thus holds a thread (and its native objects) for up to
+    the native timeout, which adds up when many calls time out during an
+    outage; combine deadlines with a :class:`CircuitBreaker` or an
+    :class:`AdaptiveLimiter` to bound the number of calls in flight.
+    """
+
+    def __init__(self, timeout):
+        """
+        Constructor.
+
+        :param float timeout: number of seconds from now.
+        """
+        self._expires_at = time.monotonic() + timeout
+
+    @staticmethod
+    def _from(deadline):
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+        return Deadline(deadline)
+
+    def remaining(self):
+        """
+        Number of seconds left, never negative.
+
+        :rtype: float
+        """
+        return max(0.0, self._expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        """
+        True if the deadline has passed.
+
+        :type: bool
+        """
+        return time.monotonic() >= self._expires_at
+
+    def check(self):
+        """
+        :raise: :class:`Error` with :attr:`Code.DEADLINE_EXCEEDED` if the deadline has passed.
+        """
+        if self.expired:
+            raise _deadline_exceeded()
+
+    def __repr__(self):
+        return "Deadline(remaining={:.3f})".format(self.remaining())
+
+
+def _deadline_exceeded():
+    # Raised by the SDK itself rather than by the backend, the circuit
+    # breaker doesn't count it as a failure of the backend.
+    err = Error(Code.DEADLINE_EXCEEDED, "deadline exceeded", True)
+    err._local = True
+    return err
+
+
+def _check(deadline):
+    # Called by the operations once they hold the native lock, so that calls
+    # abandoned while waiting for it release their native objects without
+    # doing any work.
+    if deadline is not None:
+        deadline.check()
+
+
+def _with_deadline(deadline, fn, *args):
+    # The native calls can't be interrupted, so with a deadline the call runs
+    # on its own thread and the caller stops waiting for it once the deadline
+    # passes. The abandoned call frees its native objects as soon as it
+    # returns. Its result is dropped, so fn must not update shared state
+    # itself, the caller applies the returned value.
+    if deadline is None:
+        return fn(*args)
+    deadline.check()
+
+    done = threading.Event()
+    res = [None, None]
+
+    def run():
+        try:
+            res[0] = fn(*args)
+        except BaseException as err:
+            res[1] = err
+        done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    if not done.wait(deadline.remaining()):
+        raise _deadline_exceeded()
+    if res[1] is not None:
+        raise res[1]
+    return res[0]
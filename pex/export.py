@@ -0,0 +1,363 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import json
+import os
+import queue
+import sys
+import threading
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Match types in the order they're encoded in the match_type column.
+MATCH_TYPES = ("audio", "melody", "phonetic", "video")
+
+# match_type of the row recording a search without any matched segment.
+NO_MATCH = -1
+
+_MAGIC = b"PEXCOL1\n"
+
+# Column names and their types: "str" columns are stored Arrow-style as an
+# offsets buffer followed by the UTF-8 data, the other types are array type
+# codes.
+_SCHEMA = (
+    ("lookup_id", "str"),
+    ("asset_id", "str"),
+    ("match_type", "b"),
+    ("query_start", "d"),
+    ("query_end", "d"),
+    ("asset_start", "d"),
+    ("asset_end", "d"),
+)
+
+
+def _interval(segment, name):
+    # Segments carry the offsets either as flat "query_start" fields or as
+    # nested {"query": {"start": .., "end": ..}} objects.
+    nested = segment.get(name)
+    if isinstance(nested, dict):
+        return float(nested.get("start", 0)), float(nested.get("end", 0))
+    return float(segment.get(name + "_start", 0)), float(segment.get(name + "_end", 0))
+
+
+def _asset_id(match):
+    asset = match.get("asset")
+    if isinstance(asset, dict) and asset.get("id") is not None:
+        return str(asset["id"])
+    return str(match.get("provided_id", ""))
+
+
+def _iter_segments(result):
+    # Yields (lookup_id, asset_id, match_type, query_start, query_end,
+    # asset_start, asset_end) for every matched segment of a search result,
+    # or a single row with null asset and offset fields if there's none, so
+    # that every lookup is recorded. Pex search identifies assets by
+    # asset.id, private search by provided_id.
+    lookup_id = ",".join(result.get("lookup_ids") or [])
+    matched = False
+    for match in result.get("matches") or []:
+        asset_id = _asset_id(match)
+        details = match.get("match_details") or {}
+        for code, match_type in enumerate(MATCH_TYPES):
+            segments = (details.get(match_type) or {}).get("segments") or []
+            for segment in segments:
+                query_start, query_end = _interval(segment, "query")
+                asset_start, asset_end = _interval(segment, "asset")
+                matched = True
+                yield lookup_id, asset_id, code, query_start, query_end, asset_start, asset_end
+    if not matched:
+        nan = float("nan")
+        yield lookup_id, "", NO_MATCH, nan, nan, nan, nan
+
+
+class ResultBatch(object):
+    """
+    A batch of flattened search results stored column by column. Every row is
+    one matched segment: the lookup IDs of the search (comma separated), the
+    asset ID (or provided ID for private search), the match type (an index
+    into :data:`MATCH_TYPES`) and the query and asset segment offsets. A
+    search without any matched segment is recorded as a single row with an
+    empty asset ID, :data:`NO_MATCH` as match type and NaN offsets.
+    """
+
+    def __init__(self, columns):
+        self._columns = columns
+
+    @staticmethod
+    def from_results(results):
+        """
+        Flattens search results (dicts returned by the futures' get()) into a
+        batch.
+
+        :rtype: ResultBatch
+        """
+        builder = _BatchBuilder()
+        for result in results:
+            builder.append(result)
+        return builder.build()
+
+    @property
+    def num_rows(self):
+        return len(self._columns["match_type"])
+
+    @property
+    def column_names(self):
+        return [name for name, _ in _SCHEMA]
+
+    def column(self, name):
+        """
+        Returns a column, numeric columns are :class:`array.array` objects,
+        string columns are lists of str.
+        """
+        return self._columns[name]
+
+    def to_numpy(self):
+        """
+        Converts the batch to a NumPy structured array with one field per
+        column. Requires NumPy to be installed.
+
+        :rtype: numpy.ndarray
+        """
+        if np is None:
+            raise RuntimeError("numpy is required to convert batches to arrays")
+        fields = []
+        for name, typ in _SCHEMA:
+            if typ == "str":
+                width = max((len(s) for s in self._columns[name]), default=1)
+                fields.append((name, "U{}".format(max(width, 1))))
+            else:
+                fields.append((name, np.dtype(typ)))
+        out = np.empty(self.num_rows, dtype=fields)
+        for name, typ in _SCHEMA:
+            col = self._columns[name]
+            out[name] = col if typ == "str" else np.frombuffer(col, dtype=typ)
+        return out
+
+    def __len__(self):
+        return self.num_rows
+
+    def __repr__(self):
+        return "ResultBatch(num_rows={})".format(self.num_rows)
+
+
+class _BatchBuilder(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._columns = {
+            name: [] if typ == "str" else array(typ) for name, typ in _SCHEMA
+        }
+        self._appenders = [self._columns[name].append for name, _ in _SCHEMA]
+
+    def append(self, result):
+        appenders = self._appenders
+        for row in _iter_segments(result):
+            for append, value in zip(appenders, row):
+                append(value)
+
+    def __len__(self):
+        return len(self._columns["match_type"])
+
+    def build(self):
+        batch = ResultBatch(self._columns)
+        self.reset()
+        return batch
+
+
+def _write_batch(f, batch):
+    header = {"rows": batch.num_rows, "byteorder": sys.byteorder, "columns": []}
+    buffers = []
+    for name, typ in _SCHEMA:
+        col = batch.column(name)
+        if typ == "str":
+            data = bytearray()
+            offsets = array("Q", [0])
+            for s in col:
+                data += s.encode()
+                offsets.append(len(data))
+            buffers += [offsets.tobytes(), bytes(data)]
+            header["columns"].append({"name": name, "type": typ, "sizes": [len(buffers[-2]), len(data)]})
+        else:
+            buffers.append(col.tobytes())
+            header["columns"].append({"name": name, "type": typ, "sizes": [len(buffers[-1])]})
+    f.write(_MAGIC)
+    f.write(json.dumps(header).encode() + b"\n")
+    for buf in buffers:
+        f.write(buf)
+
+
+def _read_batch(f):
+    magic = f.read(len(_MAGIC))
+    if not magic:
+        return None
+    if magic != _MAGIC:
+        raise ValueError("not a columnar result batch")
+    header = json.loads(f.readline())
+    swap = header["byteorder"] != sys.byteorder
+    columns = {}
+    for col in header["columns"]:
+        if col["type"] == "str":
+            offsets = array("Q")
+            offsets.frombytes(f.read(col["sizes"][0]))
+            if swap:
+                offsets.byteswap()
+            data = f.read(col["sizes"][1])
+            columns[col["name"]] = [
+                data[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)
+            ]
+        else:
+            values = array(col["type"])
+            values.frombytes(f.read(col["sizes"][0]))
+            if swap:
+                values.byteswap()
+            columns[col["name"]] = values
+    return ResultBatch(columns)
+
+
+def read_batches(path):
+    """
+    Reads the batches written by a :class:`ColumnarResultSink`, either from
+    a single chunk file or from all chunk files in a directory.
+
+    :rtype: Iterator[ResultBatch]
+    """
+    if os.path.isdir(path):
+        paths = sorted(
+            os.path.join(path, name) for name in os.listdir(path) if name.endswith(".pexcol")
+        )
+    else:
+        paths = [path]
+    for p in paths:
+        with open(p, "rb") as f:
+            while True:
+                batch = _read_batch(f)
+                if batch is None:
+                    break
+                yield batch
+
+
+class ColumnarResultSink(object):
+    """
+    ColumnarResultSink stores search results in a compact columnar format
+    (see :class:`ResultBatch`) in chunk files in a directory. The results are
+    flattened and written by a background thread, write() only hands them
+    over through a bounded queue, so the collecting threads don't wait for
+    serialization unless the writer falls behind by more than max_pending
+    results.
+
+        with pex.ColumnarResultSink("/path/to/results") as sink:
+            sink.write(future.get())
+
+    Use :func:`read_batches` to load the data back.
+    """
+
+    def __init__(self, directory, batch_size=65536, max_pending=10000):
+        """
+        Constructor.
+
+        :param str directory: directory the chunk files are written to, created if missing.
+        :param int batch_size: number of rows flushed to disk at once.
+        :param int max_pending: number of results that can be queued before write() blocks.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._batch_size = batch_size
+        self._queue = queue.Queue(max_pending)
+        self._builder = _BatchBuilder()
+        self._results = 0
+        self._rows = 0
+        self._batches = 0
+        self._chunk = len([n for n in os.listdir(directory) if n.endswith(".pexcol")])
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, result):
+        """
+        Queues a search result to be written.
+
+        :param dict result: result returned by a search future.
+        """
+        if self._closed:
+            raise RuntimeError("sink is closed")
+        if self._error is not None:
+            raise self._error
+        self._queue.put(result)
+
+    def flush(self):
+        """
+        Blocks until all queued results are written to disk.
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """
+        Writes all queued results and stops the writer thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    @property
+    def results_written(self):
+        return self._results
+
+    @property
+    def rows_written(self):
+        return self._rows
+
+    @property
+    def batches_written(self):
+        return self._batches
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None or isinstance(item, threading.Event):
+                    self._flush()
+                    if item is None:
+                        return
+                    item.set()
+                    continue
+                self._builder.append(item)
+                self._results += 1
+                if len(self._builder) >= self._batch_size:
+                    self._flush()
+            except Exception as err:
+                self._error = err
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is None:
+                    return
+
+    def _flush(self):
+        if len(self._builder) == 0:
+            return
+        batch = self._builder.build()
+        path = os.path.join(self._directory, "{:08d}.pexcol".format(self._chunk))
+        with open(path + ".tmp", "wb") as f:
+            _write_batch(f, batch)
+        os.replace(path + ".tmp", path)
+        self._chunk += 1
+        self._batches += 1
+        self._rows += batch.num_rows
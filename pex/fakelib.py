@@ -0,0 +1,359 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import ctypes
+import hashlib
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import namedtuple
+
+from pex import lib as _pexlib
+from pex.errors import Code
+
+
+def constant(seconds):
+    """
+    Latency distribution that always returns the same value.
+    """
+    return lambda: seconds
+
+
+def uniform(low, high):
+    """
+    Latency distribution uniformly distributed between low and high seconds.
+    """
+    return lambda: random.uniform(low, high)
+
+
+def lognormal(median, sigma):
+    """
+    Log-normal latency distribution with the given median (in seconds) and
+    shape. Heavy tailed, like most network latencies.
+    """
+    mu = math.log(median) if median > 0 else 0.0
+    return lambda: random.lognormvariate(mu, sigma)
+
+
+FakeError = namedtuple("FakeError", ["rate", "code", "is_retryable"])
+FakeError.__doc__ = """
+An error injected by :class:`FakeLib` into a fraction (rate, 0 to 1) of the
+calls of an operation.
+"""
+
+
+# Operations the latencies and errors can be configured for.
+OPERATIONS = ("init", "fingerprint", "start", "check", "ingest", "archive", "list", "get")
+
+
+class FakeLib(object):
+    """
+    FakeLib is a local stand-in for the native library. It implements the
+    functions used by the clients, so the real Python clients can be driven
+    against it without network access or credentials, e.g. to load test them.
+    Every operation sleeps for a duration drawn from its latency distribution
+    while holding the emulated global lock, and can fail with injected errors.
+
+        fake = pex.fakelib.FakeLib(latency={"check": pex.fakelib.lognormal(0.05, 0.5)})
+        with fake.installed():
+            client = pex.PexSearchClient("id", "secret")
+
+    If the native library isn't installed, import the SDK with the
+    PEX_SDK_NO_CORE_LIB environment variable set.
+    """
+
+    def __init__(
+        self,
+        latency=None,
+        errors=None,
+        matches=(0, 5),
+        segments=(1, 10),
+        fingerprint_size=4096,
+        lookup_ids=1,
+        global_lock=True,
+        seed=None,
+    ):
+        """
+        Constructor.
+
+        :param dict latency: operation name -> latency distribution (a callable returning seconds).
+        :param dict errors: operation name -> list of :class:`FakeError`.
+        :param tuple matches: (min, max) number of matches in a search result.
+        :param tuple segments: (min, max) number of segments per match.
+        :param int fingerprint_size: size of the generated fingerprints in bytes.
+        :param int lookup_ids: number of lookup IDs returned by a started search.
+        :param bool global_lock: emulate the global lock of the native library.
+        :param int seed: seed for the generated results and injected errors.
+        """
+        self._latency = dict(latency or {})
+        self._errors = dict(errors or {})
+        self._matches = matches
+        self._segments = segments
+        self._fingerprint_size = fingerprint_size
+        self._lookup_ids = lookup_ids
+        self._random = random.Random(seed)
+        self._global_lock = threading.Lock() if global_lock else None
+        self._objects = {}
+        self._catalog = {}
+        self._ids = itertools.count(1)
+        self._calls = dict.fromkeys(OPERATIONS, 0)
+        self._failures = dict.fromkeys(OPERATIONS, 0)
+        self._state_lock = threading.Lock()
+
+    def installed(self):
+        """
+        Returns a context manager that makes the SDK use this library until
+        the block exits.
+        """
+        return _Installed(self)
+
+    @property
+    def calls(self):
+        """
+        Number of calls per operation.
+
+        :type: Dict[str, int]
+        """
+        return dict(self._calls)
+
+    @property
+    def failures(self):
+        """
+        Number of injected errors per operation.
+
+        :type: Dict[str, int]
+        """
+        return dict(self._failures)
+
+    @property
+    def live_objects(self):
+        """
+        Number of native objects currently allocated.
+
+        :type: int
+        """
+        return len(self._objects)
+
+    # Helpers
+
+    def _new(self, cls):
+        buf = ctypes.create_string_buffer(8)
+        ptr = ctypes.cast(buf, ctypes.POINTER(cls))
+        with self._state_lock:
+            self._objects[ctypes.addressof(buf)] = {"_buf": buf}
+        return ptr
+
+    def _delete(self, ref):
+        ptr = ref._obj
+        if ptr:
+            with self._state_lock:
+                self._objects.pop(ctypes.cast(ptr, ctypes.c_void_p).value, None)
+
+    def _state(self, ptr):
+        return self._objects[ctypes.cast(ptr, ctypes.c_void_p).value]
+
+    def _operation(self, op, c_status):
+        # Accounts for the call, sleeps and returns False if an error was
+        # injected into the status.
+        with self._state_lock:
+            self._calls[op] += 1
+        latency = self._latency.get(op)
+        if latency is not None:
+            time.sleep(max(0.0, latency()))
+        for err in self._errors.get(op, ()):
+            if self._random.random() < err.rate:
+                with self._state_lock:
+                    self._failures[op] += 1
+                self._fail(c_status, err.code, "injected error", err.is_retryable)
+                return False
+        self._fail(c_status, Code.OK, "", False)
+        return True
+
+    def _fail(self, c_status, code, message, is_retryable):
+        st = self._state(c_status)
+        st["code"] = Code(code).value
+        st["message"] = message.encode()
+        st["retryable"] = is_retryable
+
+    def _result(self):
+        r = self._random
+        matches = []
+        for _ in range(r.randint(*self._matches)):
+            segments = []
+            for _ in range(r.randint(*self._segments)):
+                start = r.randint(0, 600)
+                length = r.randint(1, 60)
+                segments.append({
+                    "query_start": start,
+                    "query_end": start + length,
+                    "asset_start": start,
+                    "asset_end": start + length,
+                })
+            matches.append({
+                "asset": {"id": r.randint(1, 10 ** 9), "title": "Fake asset"},
+                "match_details": {"audio": {"segments": segments}},
+            })
+        return {"matches": matches}
+
+    # Library
+
+    def __getattr__(self, name):
+        if name.endswith("_New"):
+            cls = getattr(_pexlib, "_" + name[:-len("_New")])
+            return lambda: self._new(cls)
+        if name.endswith("_Delete"):
+            return self._delete
+        raise AttributeError(name)
+
+    def Pex_Version_IsCompatible(self, major, minor):
+        return True
+
+    def Pex_Init(self, client_id, client_secret, c_code, c_message, size):
+        c_code._obj.value = Code.OK.value
+
+    def Pex_Cleanup(self):
+        pass
+
+    def Pex_Lock(self):
+        if self._global_lock is not None:
+            self._global_lock.acquire()
+
+    def Pex_Unlock(self):
+        if self._global_lock is not None:
+            self._global_lock.release()
+
+    def Pex_Status_OK(self, c_status):
+        return self._state(c_status).get("code", 0) == Code.OK.value
+
+    def Pex_Status_GetCode(self, c_status):
+        return self._state(c_status).get("code", 0)
+
+    def Pex_Status_GetMessage(self, c_status):
+        return self._state(c_status).get("message", b"")
+
+    def Pex_Status_IsRetryable(self, c_status):
+        return self._state(c_status).get("retryable", False)
+
+    def Pex_Buffer_Set(self, c_buf, data, size):
+        self._state(c_buf)["data"] = bytes(data[:size])
+
+    def Pex_Buffer_GetData(self, c_buf):
+        st = self._state(c_buf)
+        data = st.get("data", b"")
+        st["_data"] = ctypes.create_string_buffer(data, len(data) + 1)
+        return ctypes.addressof(st["_data"])
+
+    def Pex_Buffer_GetSize(self, c_buf):
+        return len(self._state(c_buf).get("data", b""))
+
+    def _fingerprint(self, source, c_ft, c_status):
+        if self._operation("fingerprint", c_status):
+            digest = hashlib.sha256(source).digest()
+            size = self._fingerprint_size
+            self._state(c_ft)["data"] = (digest * (size // len(digest) + 1))[:size]
+
+    def Pex_FingerprintFile(self, c_client, path, c_ft, c_status, ft_types):
+        self._fingerprint(path, c_ft, c_status)
+
+    def Pex_FingerprintBuffer(self, c_client, c_buf, c_ft, c_status, ft_types):
+        self._fingerprint(self._state(c_buf).get("data", b""), c_ft, c_status)
+
+    def Pex_Fingerprint_File(self, path, c_ft, c_status, ft_types):
+        self._fingerprint(path, c_ft, c_status)
+
+    def Pex_Fingerprint_Buffer(self, c_buf, c_ft, c_status, ft_types):
+        self._fingerprint(self._state(c_buf).get("data", b""), c_ft, c_status)
+
+    def Pex_Client_Init(self, c_client, client_type, client_id, client_secret, c_status):
+        self._operation("init", c_status)
+
+    def Pex_StartSearchRequest_SetType(self, c_req, type):
+        self._state(c_req)["type"] = type
+
+    def Pex_StartSearchRequest_SetFingerprint(self, c_req, c_buf, c_status):
+        self._state(c_req)["ft"] = self._state(c_buf).get("data", b"")
+        self._fail(c_status, Code.OK, "", False)
+
+    def Pex_StartSearchRequest_SetISRC(self, c_req, isrc, ft_types):
+        self._state(c_req)["isrc"] = isrc
+
+    def Pex_StartSearch(self, c_client, c_req, c_res, c_status):
+        if self._operation("start", c_status):
+            ids = ["fake-{}".format(next(self._ids)) for _ in range(self._lookup_ids)]
+            self._state(c_res)["lookup_ids"] = ids
+
+    def Pex_StartSearchResult_NextLookupID(self, c_res, c_pos, c_lookup_id):
+        ids = self._state(c_res).get("lookup_ids", [])
+        pos = c_pos._obj.value
+        if pos >= len(ids):
+            return False
+        c_lookup_id._obj.value = ids[pos].encode()
+        c_pos._obj.value = pos + 1
+        return True
+
+    def Pex_CheckSearchRequest_AddLookupID(self, c_req, lookup_id):
+        self._state(c_req).setdefault("lookup_ids", []).append(lookup_id.decode())
+
+    def Pex_CheckSearch(self, c_client, c_req, c_res, c_status):
+        if self._operation("check", c_status):
+            res = self._result()
+            self._state(c_res)["json"] = json.dumps(res).encode()
+
+    def Pex_CheckSearchResult_GetJSON(self, c_res):
+        return self._state(c_res).get("json")
+
+    def Pex_ListRequest_SetAfter(self, c_req, after):
+        self._state(c_req)["after"] = after.decode()
+
+    def Pex_ListRequest_SetLimit(self, c_req, limit):
+        self._state(c_req)["limit"] = limit
+
+    def Pex_List(self, c_client, c_req, c_res, c_status):
+        if self._operation("list", c_status):
+            req = self._state(c_req)
+            limit = req.get("limit") or 100
+            with self._state_lock:
+                ids = sorted(i for i in self._catalog if i > req.get("after", ""))
+            page = ids[:limit]
+            self._state(c_res)["json"] = json.dumps({
+                "entries": [{"provided_id": i} for i in page],
+                "end_cursor": page[-1] if page else req.get("after", ""),
+                "has_next_page": len(ids) > limit,
+            }).encode()
+
+    def Pex_ListResult_GetJSON(self, c_res):
+        return self._state(c_res).get("json")
+
+    def Pex_Ingest(self, c_client, provided_id, c_ft, c_status):
+        if self._operation("ingest", c_status):
+            with self._state_lock:
+                self._catalog[provided_id.decode()] = len(self._state(c_ft).get("data", b""))
+
+    def Pex_Archive(self, c_client, provided_id, ft_types, c_status):
+        if self._operation("archive", c_status):
+            with self._state_lock:
+                self._catalog.pop(provided_id.decode(), None)
+
+    def Pex_Get(self, c_client, provided_id, c_buf, c_status):
+        if self._operation("get", c_status):
+            provided_id = provided_id.decode()
+            if provided_id not in self._catalog:
+                self._fail(c_status, Code.NOT_FOUND, "entry not found", False)
+                return
+            entry = {"provided_id": provided_id}
+            self._state(c_buf)["data"] = json.dumps(entry).encode()
+
+
+class _Installed(object):
+    def __init__(self, lib):
+        self._lib = lib
+        self._prev = None
+
+    def __enter__(self):
+        self._prev = _pexlib._set_lib(self._lib)
+        return self._lib
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _pexlib._set_lib(self._prev)
@@ -1,7 +1,11 @@
 # Copyright 2023 Pexeso Inc. All rights reserved.
 
+from array import array
 from enum import IntEnum
 import ctypes
+import hashlib
+import struct
+import sys
 
 from pex.lib import _lib, _Pex_Status, _Pex_Buffer, _Pex_Lock
 from pex.errors import Error
@@ -27,13 +31,210 @@ class Fingerprint(object):
     encoded in one of the supported formats and must be longer than 1 second.
     """
 
-    def __init__(self, ft):
+    __slots__ = ("_ft", "_ft_types", "_digest")
+
+    def __init__(self, ft, ft_types=None):
         self._ft = ft
+        self._ft_types = ft_types
+        self._digest = None
+
+    @property
+    def ft_types(self):
+        """
+        The :class:`FingerprintType` bit flags the fingerprint was generated
+        with, or None if unknown (e.g. for fingerprints loaded from storage).
+
+        :type: int
+        """
+        return self._ft_types
+
+    @property
+    def size(self):
+        """
+        Size of the fingerprint in bytes.
+
+        :type: int
+        """
+        return len(self._ft)
+
+    @property
+    def digest(self):
+        """
+        SHA-256 digest of the fingerprint as a hex string, computed once.
+        Fingerprints compare equal and hash by their digest.
+
+        :type: str
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha256(self._ft).hexdigest()
+        return self._digest
+
+    def __eq__(self, other):
+        if not isinstance(other, Fingerprint):
+            return NotImplemented
+        return self is other or self.digest == other.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return "Fingerprint(size={}, digest={})".format(len(self._ft), self.digest[:16])
+
+
+# Header of a serialized FingerprintBatch: magic and number of fingerprints.
+_BATCH_HEADER = struct.Struct("<4sQ")
+_BATCH_MAGIC = b"PXFB"
+
+
+class FingerprintBatch(object):
+    """
+    FingerprintBatch stores many fingerprints in a single contiguous buffer
+    with an array of offsets, instead of one Python object per fingerprint,
+    so that jobs holding millions of fingerprints use a fraction of the
+    memory. Fingerprints are copied in when appended and materialized as
+    :class:`Fingerprint` objects when accessed:
+
+        batch = pex.FingerprintBatch()
+        for path in paths:
+            batch.append(client.fingerprint_file(path))
+        for ft in batch:
+            client.ingest(..., ft)
+
+    A batch can be serialized with :meth:`to_bytes` and loaded with
+    :meth:`from_bytes`.
+    """
+
+    def __init__(self, fingerprints=()):
+        """
+        Constructor.
+
+        :param fingerprints: optional iterable of :class:`Fingerprint` to append.
+        """
+        self._data = bytearray()
+        self._offsets = array("Q", [0])
+        self._ft_types = array("i")
+        self.extend(fingerprints)
+
+    def append(self, ft):
+        """
+        Appends a fingerprint to the batch.
+
+        :param Fingerprint ft: fingerprint to append.
+        """
+        self._data += ft._ft
+        self._offsets.append(len(self._data))
+        self._ft_types.append(-1 if ft._ft_types is None else int(ft._ft_types))
+
+    def extend(self, fingerprints):
+        """
+        Appends fingerprints to the batch.
+
+        :param fingerprints: iterable of :class:`Fingerprint`.
+        """
+        for ft in fingerprints:
+            self.append(ft)
+
+    def __len__(self):
+        return len(self._ft_types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FingerprintBatch(self[i] for i in range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("fingerprint batch index out of range")
+        ft_types = self._ft_types[index]
+        data = bytes(self._data[self._offsets[index]:self._offsets[index + 1]])
+        return Fingerprint(data, None if ft_types < 0 else ft_types)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the fingerprint data and the offsets, in bytes.
+
+        :type: int
+        """
+        return (
+            len(self._data)
+            + len(self._offsets) * self._offsets.itemsize
+            + len(self._ft_types) * self._ft_types.itemsize
+        )
+
+    def to_bytes(self):
+        """
+        Serializes the batch.
+
+        :rtype: bytes
+        """
+        offsets = array("Q", self._offsets)
+        ft_types = array("i", self._ft_types)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+            ft_types.byteswap()
+        return b"".join((
+            _BATCH_HEADER.pack(_BATCH_MAGIC, len(self)),
+            offsets.tobytes(),
+            ft_types.tobytes(),
+            bytes(self._data),
+        ))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Loads a batch serialized with :meth:`to_bytes`.
+
+        :param bytes data: serialized batch.
+        :raise: ValueError if the data isn't a serialized batch.
+        :rtype: FingerprintBatch
+        """
+        data = memoryview(data).cast("B")
+        if len(data) < _BATCH_HEADER.size:
+            raise ValueError("not a fingerprint batch")
+        magic, count = _BATCH_HEADER.unpack_from(data)
+        if magic != _BATCH_MAGIC:
+            raise ValueError("not a fingerprint batch")
+        pos = _BATCH_HEADER.size
+        offsets = array("Q")
+        ft_types = array("i")
+        end = pos + (count + 1) * offsets.itemsize
+        offsets.frombytes(data[pos:end])
+        pos, end = end, end + count * ft_types.itemsize
+        ft_types.frombytes(data[pos:end])
+        if sys.byteorder == "big":
+            offsets.byteswap()
+            ft_types.byteswap()
+        if len(ft_types) != count or len(data) - end != offsets[-1]:
+            raise ValueError("truncated fingerprint batch")
+        batch = cls()
+        batch._offsets = offsets
+        batch._ft_types = ft_types
+        batch._data = bytearray(data[end:])
+        return batch
+
+    def __repr__(self):
+        return "FingerprintBatch(len={}, nbytes={})".format(len(self), self.nbytes)
 
 
 class _Fingerprinter(object):
-    def __init__(self, c_client):
+    def __init__(self, c_client, scheduler=None, validator=None):
         self._c_client = c_client
+        self._scheduler = scheduler
+        self._validator = validator
+
+    def _scheduled(self, fn, *args):
+        if self._scheduler is None:
+            return fn(*args)
+        return self._scheduler._run(self._scheduler._current(), None, fn, *args)
+
+    def _validated(self, info, fn, *args):
+        if info is None:
+            return self._scheduled(fn, *args)
+        return self._scheduled(self._validator._run, info.size, fn, *args)
 
     def fingerprint_file(self, path, ft_types=FingerprintType.ALL):
         """
@@ -44,6 +245,12 @@ class _Fingerprinter(object):
         :raise: :class:`Error` if the media file is missing or invalid.
         :rtype: Fingerprint
         """
+        info = None
+        if self._validator is not None:
+            info = self._validator.check_file(path)
+        return self._validated(info, self._fingerprint_file, path, ft_types)
+
+    def _fingerprint_file(self, path, ft_types):
         with (
             _Pex_Lock.new(_lib) as c_lock,
             _Pex_Buffer.new(_lib) as c_ft,
@@ -61,7 +268,7 @@ class _Fingerprinter(object):
             data = _lib.Pex_Buffer_GetData(c_ft.get())
             size = _lib.Pex_Buffer_GetSize(c_ft.get())
             ft = ctypes.string_at(data, size)
-            return Fingerprint(ft)
+            return Fingerprint(ft, int(ft_types))
 
     def fingerprint_buffer(self, buf, ft_types=FingerprintType.ALL):
         """
@@ -72,6 +279,12 @@ class _Fingerprinter(object):
         :raise: :class:`Error` if the buffer holds invalid data.
         :rtype: Fingerprint
         """
+        info = None
+        if self._validator is not None:
+            info = self._validator.check_buffer(buf)
+        return self._validated(info, self._fingerprint_buffer, buf, ft_types)
+
+    def _fingerprint_buffer(self, buf, ft_types):
         with (
             _Pex_Lock.new(_lib) as c_lock,
             _Pex_Buffer.new(_lib) as c_ft,
@@ -92,4 +305,4 @@ class _Fingerprinter(object):
             data = _lib.Pex_Buffer_GetData(c_ft.get())
             size = _lib.Pex_Buffer_GetSize(c_ft.get())
             ft = ctypes.string_at(data, size)
-            return Fingerprint(ft)
+            return Fingerprint(ft, int(ft_types))
@@ -0,0 +1,169 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import json
+import os
+import threading
+from collections import namedtuple
+
+from pex.pipeline import SearchPipeline
+
+
+JournalResult = namedtuple("JournalResult", ["key", "result", "error", "resumed", "latency"])
+JournalResult.__doc__ = """
+A single result yielded by :meth:`SearchJournal.run`. Exactly one of result
+and error is set, resumed tells whether the search was started by a previous
+run and latency is the number of seconds the item spent in this run.
+"""
+
+
+class SearchJournal(object):
+    """
+    SearchJournal runs a batch of searches and keeps track of them in an
+    append-only journal file, so that a batch interrupted by a crash or a
+    redeploy can be resumed: items whose result was already consumed are
+    skipped, and the results of searches started by the previous run are
+    retrieved without fingerprinting and searching again.
+
+        journal = pex.SearchJournal("backfill.journal")
+        for res in journal.run(client, ((path, path) for path in paths)):
+            store(res.key, res.result)
+
+    The items are (key, item) pairs, where the key is a unique, stable
+    string identifying the item across runs (e.g. a file path or an asset
+    ID) and the item is anything :class:`SearchPipeline` accepts. A result
+    is marked done once the consumer asks for the next one, so a result is
+    delivered again after a crash rather than lost. Failed items aren't
+    marked done and are searched again by the next run; a failed search
+    started by a previous run is started from scratch next time.
+    """
+
+    def __init__(self, path, sync=False):
+        """
+        Constructor.
+
+        :param str path: path of the journal file, created if it doesn't exist.
+        :param bool sync: fsync the journal after every write.
+        """
+        self._path = path
+        self._sync = sync
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Replays the journal into the set of done keys and the started
+        # futures of the keys that aren't done.
+        done, started = set(), {}
+        if not os.path.exists(self._path):
+            return done, started
+        with open(self._path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # A torn last line after a crash.
+                    continue
+                key = rec["k"]
+                if "f" in rec:
+                    started[key] = rec["f"]
+                elif rec.get("d"):
+                    done.add(key)
+                    started.pop(key, None)
+                else:
+                    started.pop(key, None)
+        return done, started
+
+    def _drop_torn_tail(self):
+        # A crash can leave the last line incomplete; it's cut off so that
+        # the next record doesn't get appended to it.
+        if not os.path.exists(self._path):
+            return
+        with open(self._path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            while end > 0:
+                start = max(0, end - 65536)
+                f.seek(start)
+                chunk = f.read(end - start)
+                i = chunk.rfind(b"\n")
+                if i >= 0:
+                    f.truncate(start + i + 1)
+                    return
+                end = start
+            f.truncate(0)
+
+    def _write(self, f, rec):
+        with self._lock:
+            f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+            f.flush()
+            if self._sync:
+                os.fsync(f.fileno())
+
+    def pending(self):
+        """
+        Returns the keys of the searches started but not done yet.
+
+        :rtype: List[str]
+        """
+        return list(self._load()[1])
+
+    def run(self, client, items, **kwargs):
+        """
+        Searches the items that aren't done yet and yields a
+        :class:`JournalResult` for each one as soon as it's finished. The
+        remaining keyword arguments are passed to :class:`SearchPipeline`.
+
+        :param client: either a PexSearchClient or a PrivateSearchClient.
+        :param items: iterable of (key, item) pairs.
+        :rtype: Iterator[JournalResult]
+        """
+        done, started = self._load()
+        keys = []
+        resumed = set()
+
+        def feed():
+            for key, item in items:
+                if key in done:
+                    continue
+                if key in started:
+                    item = client.resume_search(started[key])
+                    resumed.add(len(keys))
+                keys.append(key)
+                yield item
+
+        self._drop_torn_tail()
+        with open(self._path, "a", encoding="utf-8") as f:
+            def on_started(index, item, future):
+                self._write(f, {"k": keys[index], "f": future.to_json()})
+
+            pipeline = SearchPipeline(client, on_started=on_started, **kwargs)
+            try:
+                for res in pipeline.run(feed()):
+                    key = keys[res.index]
+                    was_resumed = res.index in resumed
+                    yield JournalResult(key, res.result, res.error, was_resumed, res.latency)
+                    if res.error is None:
+                        self._write(f, {"k": key, "d": 1})
+                    elif was_resumed:
+                        # The lookup may have expired, start over next time.
+                        self._write(f, {"k": key, "d": 0})
+            finally:
+                # Searches started while the iteration stops are still
+                # recorded before the journal is closed.
+                pipeline.close(wait=True)
+
+    def compact(self):
+        """
+        Rewrites the journal without the history of the finished items,
+        keeping only the done keys and the pending searches.
+        """
+        done, started = self._load()
+        tmp = self._path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for key in done:
+                f.write(json.dumps({"k": key, "d": 1}, separators=(",", ":")) + "\n")
+            for key, future in started.items():
+                f.write(json.dumps({"k": key, "f": future}, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
+
+    def __repr__(self):
+        return "SearchJournal(path={})".format(self._path)
@@ -1,19 +1,169 @@
 # Copyright 2023 Pexeso Inc. All rights reserved.
 
+import contextlib
 import ctypes
 import ctypes.util
+import gc
+import itertools
 import os
+import threading
+import time
+import traceback
 
 MAJOR_VERSION = 4
 MINOR_VERSION = 6
 
 
+class _Accounting(object):
+    # Counts the native objects allocated through _SafeObject by type. In
+    # debug mode it also remembers the allocation site of every live object.
+    # A garbage collection may run while the lock is held and free objects
+    # from __del__ on the same thread, hence the reentrant lock.
+    def __init__(self):
+        self.enabled = False
+        self.debug = False
+        self._lock = threading.RLock()
+        self._seq = itertools.count(1)
+        self._stats = {}
+        self._sites = {}
+
+    def allocated(self, obj):
+        site = traceback.format_stack(limit=16)[:-2] if self.debug else None
+        with self._lock:
+            stats = self._stats.get(obj._name)
+            if stats is None:
+                stats = self._stats[obj._name] = dict.fromkeys(("live", "high_water", "allocated", "freed"), 0)
+            stats["live"] += 1
+            stats["allocated"] += 1
+            stats["high_water"] = max(stats["high_water"], stats["live"])
+            obj._seq = next(self._seq)
+            if site is not None:
+                self._sites[obj._seq] = (obj._name, site)
+
+    def freed(self, obj):
+        with self._lock:
+            stats = self._stats[obj._name]
+            stats["live"] -= 1
+            stats["freed"] += 1
+            self._sites.pop(obj._seq, None)
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def sites(self, after=0):
+        with self._lock:
+            return [(seq, name, site) for seq, (name, site) in sorted(self._sites.items()) if seq > after]
+
+    def mark(self):
+        with self._lock:
+            seq = next(self._seq)
+        return seq
+
+    def reset(self):
+        with self._lock:
+            for stats in self._stats.values():
+                stats["high_water"] = stats["live"]
+                stats["allocated"] = stats["freed"] = 0
+
+
+_accounting = _Accounting()
+
+
+def track_native_objects(enabled=True, debug=False):
+    """
+    Enables or disables the accounting of native objects. While enabled,
+    every native object the SDK allocates is counted by type, see
+    :func:`native_objects`. In debug mode the stack trace of every
+    allocation is kept until the object is freed, see
+    :func:`native_object_sites`, which is considerably slower. Setting the
+    PEX_SDK_TRACK_OBJECTS environment variable to 1 (or to debug) enables
+    the accounting at import time.
+
+    Objects allocated while the accounting is disabled aren't counted when
+    they're freed.
+
+    :param bool enabled: whether to count the native objects.
+    :param bool debug: whether to record the allocation sites.
+    """
+    _accounting.enabled = enabled
+    _accounting.debug = enabled and debug
+
+
+def native_objects():
+    """
+    Returns, for every type of native object (e.g. "Pex_Buffer"), the
+    number of live objects, the highest number of live objects, and the
+    number of objects allocated and freed since the accounting was enabled
+    or reset.
+
+    :rtype: dict
+    """
+    return _accounting.stats()
+
+
+def native_object_sites():
+    """
+    Returns the live native objects allocated in debug mode as (type,
+    stack) tuples, where stack is the allocation's stack trace as a list
+    of formatted lines, oldest allocation first.
+
+    :rtype: List[tuple]
+    """
+    return [(name, site) for _, name, site in _accounting.sites()]
+
+
+def reset_native_objects():
+    """
+    Resets the allocation and free counters and the high-water marks to the
+    current number of live objects.
+    """
+    _accounting.reset()
+
+
+@contextlib.contextmanager
+def check_native_leaks(ignore=()):
+    """
+    Context manager that fails if native objects allocated in its block are
+    still alive at its end, after a garbage collection. It enables the
+    accounting in debug mode for the duration of the block, and the error
+    lists the allocation sites of the leaked objects:
+
+        with pex.check_native_leaks():
+            for _ in range(1000):
+                client.fingerprint_file(path)
+
+    Long-lived objects created in the block, such as clients, must be
+    deleted before its end or their types listed in ignore.
+
+    :param ignore: types of native objects allowed to outlive the block.
+    :raise: RuntimeError if native objects leaked.
+    """
+    prev = (_accounting.enabled, _accounting.debug)
+    track_native_objects(True, True)
+    start = _accounting.mark()
+    try:
+        yield
+        gc.collect()
+        leaked = [(name, site) for _, name, site in _accounting.sites(start) if name not in ignore]
+    finally:
+        track_native_objects(*prev)
+    if leaked:
+        lines = ["{} native objects leaked:".format(len(leaked))]
+        for name, site in leaked[:10]:
+            lines.append("{} allocated at:".format(name))
+            lines.append("".join(site).rstrip())
+        raise RuntimeError("\n".join(lines))
+
+
 class _SafeObject(object):
-    def __init__(self, new, delete, args=None):
+    def __init__(self, new, delete, args=None, name=None):
         self._new = new
         self._delete = delete
         self._args = args
+        self._name = name
         self._obj = None
+        self._tracked = False
 
     def __del__(self):
         self.free()
@@ -32,12 +182,18 @@ class _SafeObject(object):
         self._obj = self._new(*args)
         if not self._obj:
             raise MemoryError("out of memory")
+        if _accounting.enabled:
+            self._tracked = True
+            _accounting.allocated(self)
 
     def free(self):
         if not self._obj:
             return
         self._delete(ctypes.byref(self._obj))
         self._obj = None
+        if self._tracked:
+            self._tracked = False
+            _accounting.freed(self)
 
     def get(self):
         if not self._obj:
@@ -45,6 +201,10 @@ class _SafeObject(object):
         return self._obj
 
 
+# When the current thread last held the native lock, see _lock_held_seconds.
+_lock_times = threading.local()
+
+
 class _Pex_Lock(object):
     @staticmethod
     def new(lib):
@@ -52,37 +212,58 @@ class _Pex_Lock(object):
 
     def __init__(self, lib):
         self._lib = lib
+        self._acquired_at = None
 
     def __enter__(self):
         self._lib.Pex_Lock()
+        self._acquired_at = time.monotonic()
 
     def __exit__(self, exc_type, exc_value, traceback):
         self._lib.Pex_Unlock()
+        _lock_times.acquired_at = self._acquired_at
+        _lock_times.released_at = time.monotonic()
+
+
+def _lock_held_seconds(since):
+    # Returns how long the current thread held the native lock the last time
+    # it took it, i.e. the duration of the native call without the time spent
+    # waiting for the lock, or None if it didn't take it after since.
+    acquired_at = getattr(_lock_times, "acquired_at", None)
+    if acquired_at is None or acquired_at < since:
+        return None
+    return _lock_times.released_at - acquired_at
 
 
 class _Pex_Status(ctypes.Structure):
     @staticmethod
     def new(lib):
-        return _SafeObject(lib.Pex_Status_New, lib.Pex_Status_Delete)
+        return _SafeObject(lib.Pex_Status_New, lib.Pex_Status_Delete, name="Pex_Status")
 
 
 class _Pex_Buffer(ctypes.Structure):
     @staticmethod
     def new(lib):
-        return _SafeObject(lib.Pex_Buffer_New, lib.Pex_Buffer_Delete)
+        return _SafeObject(lib.Pex_Buffer_New, lib.Pex_Buffer_Delete, name="Pex_Buffer")
 
 
 class _Pex_Client(ctypes.Structure):
     @staticmethod
     def new(lib):
-        return _SafeObject(lib.Pex_Client_New, _Pex_Client.delete)
+        # The client is deleted with the library it was created with, even
+        # if the library has been swapped in the meantime.
+        lib = getattr(lib, "_target", lib)
+        return _SafeObject(
+            lib.Pex_Client_New, lambda obj: _Pex_Client.delete(obj, lib), name="Pex_Client"
+        )
 
     @staticmethod
-    def delete(obj):
-        lock = _Pex_Lock.new(_lib)
-        _lib.Pex_Client_Delete(obj)
+    def delete(obj, lib=None):
+        if lib is None:
+            lib = _lib
+        lock = _Pex_Lock.new(lib)
+        lib.Pex_Client_Delete(obj)
         del lock
-        _lib.Pex_Cleanup()
+        lib.Pex_Cleanup()
 
 
 class _Pex_StartSearchRequest(ctypes.Structure):
@@ -91,6 +272,7 @@ class _Pex_StartSearchRequest(ctypes.Structure):
         return _SafeObject(
             lib.Pex_StartSearchRequest_New,
             lib.Pex_StartSearchRequest_Delete,
+            name="Pex_StartSearchRequest",
         )
 
 
@@ -98,7 +280,9 @@ class _Pex_StartSearchResult(ctypes.Structure):
     @staticmethod
     def new(lib):
         return _SafeObject(
-            lib.Pex_StartSearchResult_New, lib.Pex_StartSearchResult_Delete
+            lib.Pex_StartSearchResult_New,
+            lib.Pex_StartSearchResult_Delete,
+            name="Pex_StartSearchResult",
         )
 
 
@@ -108,6 +292,7 @@ class _Pex_CheckSearchRequest(ctypes.Structure):
         return _SafeObject(
             lib.Pex_CheckSearchRequest_New,
             lib.Pex_CheckSearchRequest_Delete,
+            name="Pex_CheckSearchRequest",
         )
 
 
@@ -115,7 +300,9 @@ class _Pex_CheckSearchResult(ctypes.Structure):
     @staticmethod
     def new(lib):
         return _SafeObject(
-            lib.Pex_CheckSearchResult_New, lib.Pex_CheckSearchResult_Delete
+            lib.Pex_CheckSearchResult_New,
+            lib.Pex_CheckSearchResult_Delete,
+            name="Pex_CheckSearchResult",
         )
 
 
@@ -125,13 +312,14 @@ class _Pex_ListRequest(ctypes.Structure):
         return _SafeObject(
             lib.Pex_ListRequest_New,
             lib.Pex_ListRequest_Delete,
+            name="Pex_ListRequest",
         )
 
 
 class _Pex_ListResult(ctypes.Structure):
     @staticmethod
     def new(lib):
-        return _SafeObject(lib.Pex_ListResult_New, lib.Pex_ListResult_Delete)
+        return _SafeObject(lib.Pex_ListResult_New, lib.Pex_ListResult_Delete, name="Pex_ListResult")
 
 
 def _load_lib():
@@ -442,4 +630,37 @@ def _load_lib():
     return lib
 
 
-_lib = _load_lib()
+class _Lib(object):
+    # Forwards the calls to the loaded library. The indirection allows
+    # swapping the library at runtime, e.g. for a stand-in used by load tests
+    # (see pex.fakelib). Functions are cached on the instance the first time
+    # they're looked up, so later calls don't go through __getattr__.
+    def __init__(self, lib):
+        self._target = lib
+
+    def __getattr__(self, name):
+        # The lookup and caching happen under the lock so that a function
+        # of the previous library can't be cached after a swap.
+        with _lib_lock:
+            target = self.__dict__["_target"]
+            value = getattr(target, name)
+            self.__dict__[name] = value
+        return value
+
+
+_lib_lock = threading.Lock()
+
+
+def _set_lib(lib):
+    # The cache is replaced in a single assignment, so concurrent lookups
+    # see either the old or the new library, never an empty instance.
+    with _lib_lock:
+        prev = _lib._target
+        _lib.__dict__ = {"_target": lib}
+    return prev
+
+
+_lib = _Lib(_load_lib())
+
+if os.getenv("PEX_SDK_TRACK_OBJECTS"):
+    track_native_objects(True, os.getenv("PEX_SDK_TRACK_OBJECTS") == "debug")
@@ -0,0 +1,191 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import threading
+import time
+from collections import deque
+
+from pex.deadline import _deadline_exceeded
+from pex.errors import Error, Code
+from pex.lib import _lock_held_seconds
+from pex.stats import LatencyRecorder
+
+
+class AdaptiveLimiter(object):
+    """
+    AdaptiveLimiter limits the number of concurrent network calls of a client
+    (starting searches, retrieving results, ingesting, archiving, getting and
+    listing entries) and adapts the limit to what the backend can handle.
+    The limit grows additively while calls succeed with a latency close to
+    the lowest recently observed one, and is cut multiplicatively when a
+    call fails with an overload error (RESOURCE_EXHAUSTED or
+    LOOKUP_TIMED_OUT by default) or its latency exceeds the lowest one by
+    more than the tolerance factor. The latency of a call is the time it
+    spends in the native library once it holds the SDK's native lock, so
+    calls queuing for the lock inside the process don't read as a slow
+    backend. Calls over the limit wait for a free slot. Pass it to the
+    client constructor to enable it:
+
+        limiter = pex.AdaptiveLimiter(initial=8, max_limit=128)
+        client = pex.PexSearchClient(CLIENT_ID, CLIENT_SECRET, limiter=limiter)
+
+    Run many workers (more than the expected limit) and let the limiter
+    decide how many of them talk to the backend at once.
+    """
+
+    def __init__(
+        self,
+        initial=8,
+        min_limit=1,
+        max_limit=256,
+        backoff=0.5,
+        tolerance=2.0,
+        overload_codes=(Code.RESOURCE_EXHAUSTED, Code.LOOKUP_TIMED_OUT),
+        window=100,
+        history=1000,
+    ):
+        """
+        Constructor.
+
+        :param int initial: initial limit.
+        :param int min_limit: lowest limit.
+        :param int max_limit: highest limit.
+        :param float backoff: factor the limit is multiplied by on overload.
+        :param float tolerance: latency, relative to the lowest recent one, considered overload.
+        :param overload_codes: error codes considered overload.
+        :param int window: number of recent latencies the lowest one is taken from.
+        :param int history: number of limit changes kept in :attr:`limit_history`.
+        """
+        self._limit = float(initial)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._backoff = backoff
+        self._tolerance = tolerance
+        self._overload_codes = frozenset(overload_codes)
+        self._window = window
+        self._recent = {}
+        self._history = deque(maxlen=history)
+        self._in_flight = 0
+        self._decreased_at = 0.0
+        self._increases = 0
+        self._decreases = 0
+        self._overloads = 0
+        self._wait = LatencyRecorder()
+        self._latency = LatencyRecorder()
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        """
+        Current concurrency limit.
+
+        :type: int
+        """
+        return max(self._min_limit, int(self._limit))
+
+    @property
+    def in_flight(self):
+        """
+        Number of calls currently running.
+
+        :type: int
+        """
+        return self._in_flight
+
+    @property
+    def limit_history(self):
+        """
+        Recent limit changes as (time.time(), limit) tuples.
+
+        :type: List[tuple]
+        """
+        return list(self._history)
+
+    def _run(self, deadline, fn, *args):
+        # The lowest latency is tracked per kind of call, a search start is
+        # much faster than a result retrieval.
+        op = getattr(fn, "__qualname__", None)
+        started = self._acquire(deadline)
+        overload = False
+        measured = True
+        try:
+            return fn(*args)
+        except Error as err:
+            overload = err.code in self._overload_codes
+            # A deadline that passed before the native call tells nothing
+            # about the backend's latency.
+            measured = not getattr(err, "_local", False)
+            raise
+        finally:
+            self._release(op, started, overload, measured)
+
+    def _acquire(self, deadline=None):
+        enqueued = time.monotonic()
+        with self._cond:
+            while self._in_flight >= self.limit:
+                timeout = None if deadline is None else deadline.remaining()
+                if timeout is not None and timeout <= 0:
+                    raise _deadline_exceeded()
+                self._cond.wait(timeout)
+            self._in_flight += 1
+            started = time.monotonic()
+        self._wait.record(started - enqueued)
+        return started
+
+    def _release(self, op, started, overload, measured=True):
+        latency = _lock_held_seconds(started)
+        if latency is None:
+            latency = time.monotonic() - started
+        with self._cond:
+            self._in_flight -= 1
+            recent = self._recent.get(op)
+            if recent is None:
+                recent = self._recent[op] = deque(maxlen=self._window)
+            if overload:
+                self._overloads += 1
+            elif measured:
+                recent.append(latency)
+                self._latency.record(latency)
+            slow = measured and len(recent) > 1 and latency > self._tolerance * min(recent)
+
+            if overload or slow:
+                # Calls started before the last decrease were running at the
+                # old limit, only the first of them backs off.
+                if started >= self._decreased_at:
+                    self._decreased_at = time.monotonic()
+                    self._set(max(float(self._min_limit), self._limit * self._backoff))
+                    self._decreases += 1
+            elif measured and self._in_flight + 1 >= self.limit:
+                # Grow by one per limit's worth of successful calls, but only
+                # while the limit is actually used.
+                prev = self.limit
+                self._limit = min(float(self._max_limit), self._limit + 1.0 / self._limit)
+                if self.limit != prev:
+                    self._increases += 1
+                    self._history.append((time.time(), self.limit))
+            self._cond.notify_all()
+
+    def _set(self, limit):
+        self._limit = limit
+        self._history.append((time.time(), self.limit))
+
+    def stats(self, ps=(50, 90, 99)):
+        """
+        Returns the current limit and number of calls in flight, the number
+        of limit increases and decreases, of overload errors, and the
+        percentiles of the time spent waiting for a slot and of the call
+        latencies.
+
+        :rtype: dict
+        """
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "increases": self._increases,
+            "decreases": self._decreases,
+            "overloads": self._overloads,
+            "wait": self._wait.summary(ps),
+            "latency": self._latency.summary(ps),
+        }
+
+    def __repr__(self):
+        return "AdaptiveLimiter(limit={}, in_flight={})".format(self.limit, self._in_flight)
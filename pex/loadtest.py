@@ -0,0 +1,323 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+"""
+Load and soak test harness.
+
+Drives the real PexSearchClient or PrivateSearchClient from many worker
+threads against a :class:`pex.fakelib.FakeLib` stand-in for the native
+library, with configurable latencies, injected errors and result sizes, and
+reports throughput, latency percentiles, errors and RSS over time:
+
+    PEX_SDK_NO_CORE_LIB=1 python -m pex.loadtest --workers 500 --duration 3600 \\
+        --latency check=lognormal:0.05:0.8 --error check=0.01:RESOURCE_EXHAUSTED:retryable
+
+PEX_SDK_NO_CORE_LIB is only needed when the native library isn't installed.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import pex
+from pex import fakelib
+from pex.stats import LatencyRecorder
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss is the peak, in kilobytes on Linux and bytes on macOS.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+class LoadReport(object):
+    """
+    Results of a :class:`LoadTest` run: the number of completed operations,
+    per-operation latencies and errors, and samples of throughput, RSS and
+    live native objects taken at regular intervals.
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.completed = 0
+        self.retries = 0
+        self.errors = {}
+        self.latency = {}
+        self.samples = []
+
+    @property
+    def throughput(self):
+        return self.completed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "elapsed": self.elapsed,
+            "completed": self.completed,
+            "throughput": self.throughput,
+            "retries": self.retries,
+            "errors": self.errors,
+            "latency": {op: rec.summary() for op, rec in self.latency.items()},
+            "samples": self.samples,
+        }
+
+    def __repr__(self):
+        return "LoadReport(completed={}, throughput={:.1f}/s, errors={})".format(
+            self.completed, self.throughput, sum(self.errors.values())
+        )
+
+
+class LoadTest(object):
+    """
+    LoadTest runs a mix of operations on a client from many worker threads
+    for a given duration. The operations are "search" (start a search and
+    retrieve its result), "fingerprint", "ingest" and "list"; the last two
+    are only available with the private search client. Calls failing with a
+    retryable error are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        client,
+        workers=100,
+        duration=60,
+        mix=None,
+        retries=3,
+        backoff=0.1,
+        sample_interval=10,
+        on_sample=None,
+        fake=None,
+    ):
+        """
+        Constructor.
+
+        :param client: PexSearchClient or PrivateSearchClient to drive.
+        :param int workers: number of worker threads.
+        :param float duration: number of seconds to run for.
+        :param dict mix: operation name -> relative weight, {"search": 1} by default.
+        :param int retries: number of retries of calls failing with a retryable error.
+        :param float backoff: initial backoff between retries in seconds.
+        :param float sample_interval: number of seconds between samples.
+        :param on_sample: optional callable invoked with every sample dict.
+        :param FakeLib fake: the stand-in library, used to sample live native objects.
+        """
+        self._client = client
+        self._workers = workers
+        self._duration = duration
+        self._ops = list((mix or {"search": 1}).items())
+        self._retries = retries
+        self._backoff = backoff
+        self._sample_interval = sample_interval
+        self._on_sample = on_sample
+        self._fake = fake
+        self._report = LoadReport()
+        self._ft = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self):
+        """
+        Runs the test and blocks until it finishes.
+
+        :rtype: LoadReport
+        """
+        report = self._report
+        for op, _ in self._ops:
+            report.latency[op] = LatencyRecorder()
+        self._ft = self._client.fingerprint_buffer(b"load test")
+
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=self._work, args=(i,), daemon=True) for i in range(self._workers)
+        ]
+        for t in threads:
+            t.start()
+
+        last = (started, 0)
+        deadline = started + self._duration
+        while time.monotonic() < deadline:
+            time.sleep(max(0.0, min(self._sample_interval, deadline - time.monotonic())))
+            now = time.monotonic()
+            last = self._sample(started, now, last)
+
+        self._stop.set()
+        for t in threads:
+            t.join()
+        report.elapsed = time.monotonic() - started
+        return report
+
+    def _sample(self, started, now, last):
+        completed = self._report.completed
+        sample = {
+            "elapsed": round(now - started, 3),
+            "completed": completed,
+            "throughput": (completed - last[1]) / (now - last[0]) if now > last[0] else 0.0,
+            "rss_bytes": _rss_bytes(),
+        }
+        if self._fake is not None:
+            sample["live_objects"] = self._fake.live_objects
+        self._report.samples.append(sample)
+        if self._on_sample is not None:
+            self._on_sample(sample)
+        return now, completed
+
+    def _work(self, worker):
+        r = random.Random(worker)
+        ops = [op for op, _ in self._ops]
+        weights = [w for _, w in self._ops]
+        n = 0
+        while not self._stop.is_set():
+            op = r.choices(ops, weights)[0]
+            n += 1
+            t0 = time.monotonic()
+            try:
+                self._with_retries(getattr(self, "_op_" + op), worker, n)
+            except Exception as err:
+                code = err.code.name if isinstance(err, pex.Error) else type(err).__name__
+                with self._lock:
+                    self._report.errors[code] = self._report.errors.get(code, 0) + 1
+                continue
+            self._report.latency[op].record(time.monotonic() - t0)
+            with self._lock:
+                self._report.completed += 1
+
+    def _with_retries(self, fn, worker, n):
+        backoff = self._backoff
+        for attempt in range(self._retries + 1):
+            try:
+                return fn(worker, n)
+            except pex.Error as err:
+                if not err.is_retryable or attempt == self._retries or self._stop.is_set():
+                    raise
+            with self._lock:
+                self._report.retries += 1
+            time.sleep(backoff * random.uniform(0.5, 1.5))
+            backoff *= 2
+
+    def _op_search(self, worker, n):
+        if isinstance(self._client, pex.PexSearchClient):
+            future = self._client.start_search(pex.PexSearchRequest(self._ft))
+        else:
+            future = self._client.start_search(pex.PrivateSearchRequest(self._ft))
+        future.get()
+
+    def _op_fingerprint(self, worker, n):
+        self._client.fingerprint_buffer("{}-{}".format(worker, n).encode())
+
+    def _op_ingest(self, worker, n):
+        self._client.ingest("load-{}-{}".format(worker, n % 1000), self._ft)
+
+    def _op_list(self, worker, n):
+        self._client.list_entries(pex.ListEntriesRequest(limit=100)).list()
+
+
+def _parse_latency(value):
+    # op=constant:SECONDS, op=uniform:LOW:HIGH or op=lognormal:MEDIAN:SIGMA
+    op, spec = value.split("=", 1)
+    kind, *params = spec.split(":")
+    dist = {"constant": fakelib.constant, "uniform": fakelib.uniform, "lognormal": fakelib.lognormal}
+    if op not in fakelib.OPERATIONS or kind not in dist:
+        raise argparse.ArgumentTypeError("invalid latency: {}".format(value))
+    return op, dist[kind](*[float(p) for p in params])
+
+
+def _parse_error(value):
+    # op=RATE:CODE[:retryable]
+    op, spec = value.split("=", 1)
+    rate, code, *flags = spec.split(":")
+    if op not in fakelib.OPERATIONS:
+        raise argparse.ArgumentTypeError("invalid error: {}".format(value))
+    return op, fakelib.FakeError(float(rate), pex.Code[code.upper()], "retryable" in flags)
+
+
+def _parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        op, _, weight = part.partition("=")
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m pex.loadtest",
+        description="Load test the SDK clients against a fake native library.",
+    )
+    parser.add_argument("--client", choices=["pex", "private"], default="pex")
+    parser.add_argument("--workers", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--mix", type=_parse_mix, default={"search": 1},
+                        help="operation weights, e.g. search=8,ingest=1,list=1")
+    parser.add_argument("--latency", type=_parse_latency, action="append", default=[],
+                        help="op=constant:S, op=uniform:LOW:HIGH or op=lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error", type=_parse_error, action="append", default=[],
+                        help="op=RATE:CODE[:retryable], e.g. check=0.01:RESOURCE_EXHAUSTED:retryable")
+    parser.add_argument("--matches", type=int, nargs=2, default=(0, 5), metavar=("MIN", "MAX"))
+    parser.add_argument("--segments", type=int, nargs=2, default=(1, 10), metavar=("MIN", "MAX"))
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--sample-interval", type=float, default=10, help="seconds")
+    parser.add_argument("--no-global-lock", action="store_true",
+                        help="don't emulate the global lock of the native library")
+    parser.add_argument("--json", action="store_true", help="print the final report as JSON")
+    args = parser.parse_args(argv)
+
+    errors = {}
+    for op, err in args.error:
+        errors.setdefault(op, []).append(err)
+    fake = fakelib.FakeLib(
+        latency=dict(args.latency),
+        errors=errors,
+        matches=tuple(args.matches),
+        segments=tuple(args.segments),
+        global_lock=not args.no_global_lock,
+    )
+
+    def on_sample(s):
+        print(
+            "t={elapsed:.0f}s completed={completed} throughput={throughput:.1f}/s "
+            "rss={rss:.1f}MB live_objects={live_objects}".format(rss=s["rss_bytes"] / 2 ** 20, **s),
+            file=sys.stderr,
+        )
+
+    with fake.installed():
+        if args.client == "pex":
+            client = pex.PexSearchClient("load-test", "load-test")
+        else:
+            client = pex.PrivateSearchClient("load-test", "load-test")
+        test = LoadTest(
+            client,
+            workers=args.workers,
+            duration=args.duration,
+            mix=args.mix,
+            retries=args.retries,
+            sample_interval=args.sample_interval,
+            on_sample=on_sample,
+            fake=fake,
+        )
+        report = test.run()
+
+    if args.json:
+        print(json.dumps(report.as_dict(), indent=2))
+        return 0
+
+    print("completed: {} in {:.1f}s ({:.1f}/s), retries: {}".format(
+        report.completed, report.elapsed, report.throughput, report.retries))
+    for code, count in sorted(report.errors.items()):
+        print("errors {}: {}".format(code, count))
+    for op, rec in report.latency.items():
+        s = rec.summary()
+        if s["count"]:
+            print("latency {}: p50={:.4f}s p90={:.4f}s p99={:.4f}s max={:.4f}s".format(
+                op, s["p50"], s["p90"], s["p99"], s["max"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,9 @@
 # Copyright 2023 Pexeso Inc. All rights reserved.
 
-import ctypes
-import json
-from datetime import datetime
-from collections import namedtuple
 from enum import IntEnum
 
-from pex.lib import (
-    _lib,
-    _Pex_Status,
-    _Pex_Lock,
-    _Pex_Buffer,
-    _Pex_StartSearchRequest,
-    _Pex_StartSearchResult,
-    _Pex_CheckSearchRequest,
-    _Pex_CheckSearchResult,
-)
-from pex.errors import Error
-from pex.client import _ClientType, _init_client
-from pex.fingerprint import _Fingerprinter, FingerprintType
+from pex.client import _ClientType, _map_unordered, _start_search, _SearchClient, _SearchFuture
+from pex.fingerprint import FingerprintType
 
 
 class PexSearchType(IntEnum):
@@ -80,125 +65,130 @@ class ISRCSearchRequest(object):
         return f"ISRCSearchRequest(isrc={self._isrc},type={self._type.name})"
 
 
-class PexSearchFuture(object):
+class PexSearchFuture(_SearchFuture):
     """
     This object is returned by the :meth:`PexSearch.start` method
     and is used to retrieve a search result.
     """
 
-    def __init__(self, client, lookup_ids):
-        self._raw_c_client = client.get()
-        self._lookup_ids = lookup_ids
+    _kind = "pex"
 
-    def get(self):
-        """
-        Blocks until the search result is ready and then returns it.
+    def __repr__(self):
+        return f"PexSearchFuture(lookup_ids={self._lookup_ids})"
 
-        :raise: :class:`Error` if the search couldn't be performed, e.g.
-                because of network issues.
-        :rtype: dict
-        """
-        with (
-            _Pex_Lock.new(_lib) as c_lock,
-            _Pex_Status.new(_lib) as c_status,
-            _Pex_CheckSearchRequest.new(_lib) as c_req,
-            _Pex_CheckSearchResult.new(_lib) as c_res,
-        ):
-            for lookup_id in self._lookup_ids:
-                _lib.Pex_CheckSearchRequest_AddLookupID(
-                    c_req.get(), lookup_id.encode()
-                )
-
-            _lib.Pex_CheckSearch(
-                self._raw_c_client, c_req.get(), c_res.get(), c_status.get()
-            )
-            Error.check_status(c_status)
-
-            res = _lib.Pex_CheckSearchResult_GetJSON(c_res.get())
-            j = json.loads(res)
-            j['lookup_ids'] = self._lookup_ids
-            return j
-
-    @property
-    def lookup_ids(self):
-        """
-        A list of IDs that uniquely identify a particular search. Can be
-        used for diagnostics.
 
-        :type: List[str]
-        """
-        return self._lookup_ids
+def _search_key(req):
+    if isinstance(req, ISRCSearchRequest):
+        return "pex:isrc:{}:{}:{}".format(req._isrc, int(req._ft_types), int(req._type))
+    return "pex:ft:{}:{}".format(req._fingerprint.digest, int(req._type))
 
-    def __repr__(self):
-        return f"PexSearchFuture(lookup_ids={self._lookup_ids})"
 
+class PexSearchClient(_SearchClient):
+    _future_cls = PexSearchFuture
+
+    def __init__(
+        self, client_id, client_secret, cache=None, single_flight=None,
+        scheduler=None, limiter=None, rate_limiter=None, validator=None,
+        background_init=False, shared=False, breaker=None,
+    ):
+        """
+        Constructor.
 
-class PexSearchClient(_Fingerprinter):
-    def __init__(self, client_id, client_secret):
-        self._c_client = _init_client(_ClientType.PEX_SEARCH, client_id, client_secret)
-        super().__init__(self._c_client)
+        :param str client_id: client ID of the account.
+        :param str client_secret: client secret of the account.
+        :param SearchCache cache: optional cache of search results.
+        :param SingleFlight single_flight: optional deduplication of concurrent identical searches.
+        :param Scheduler scheduler: optional priority scheduling of the calls.
+        :param AdaptiveLimiter limiter: optional adaptive limit of concurrent network calls.
+        :param HostRateLimiter rate_limiter: optional host-wide rate limit of the network calls.
+        :param MediaValidator validator: optional pre-check of the media before fingerprinting.
+        :param bool background_init: initialize the client on a background thread, the first
+                                     call waits for the initialization to finish.
+        :param bool shared: reuse the native client of another shared client of the same type
+                            and credentials in this process.
+        :param CircuitBreaker breaker: optional fail-fast of the network calls during outages.
+        """
+        super().__init__(
+            _ClientType.PEX_SEARCH, client_id, client_secret, cache, single_flight,
+            scheduler, limiter, rate_limiter, validator, background_init, shared,
+            breaker,
+        )
 
-    def start_search(self, req: PexSearchRequest) -> PexSearchFuture:
+    def start_search(self, req: PexSearchRequest, deadline=None) -> PexSearchFuture:
         """
         Starts a Pex search. This operation does not block until the
         search is finished, it does however perform a network operation to
         initiate the search on the backend service.
 
         :param PexSearchRequest req: search parameters.
+        :param deadline: optional :class:`Deadline` or number of seconds
+                         after which the call fails with DEADLINE_EXCEEDED.
         :raise: :class:`Error` if the search couldn’t be initiated, e.g.
                 because of network issues.
         :rtype: PexSearchFuture
         """
-        return self._start_search(req)
+        return self._start_search(req, deadline)
     
-    def start_isrc_search(self, req: ISRCSearchRequest) -> PexSearchFuture:
+    def start_isrc_search(self, req: ISRCSearchRequest, deadline=None) -> PexSearchFuture:
         """
         Starts a Pex search using an ISRC. This operation does not block until the
         search is finished, it does however perform a network operation to
         initiate the search on the backend service.
 
         :param ISRCSearchRequest req: search parameters.
+        :param deadline: optional :class:`Deadline` or number of seconds
+                         after which the call fails with DEADLINE_EXCEEDED.
         :raise: :class:`Error` if the search couldn’t be initiated, e.g.
                 because of network issues.
         :rtype: PexSearchFuture
         """
-        return self._start_search(req)
-
-    def _start_search(self, req) -> PexSearchFuture:
-        with (
-            _Pex_Lock.new(_lib) as c_lock,
-            _Pex_Status.new(_lib) as c_status,
-            _Pex_Buffer.new(_lib) as c_ft,
-            _Pex_StartSearchRequest.new(_lib) as c_req,
-            _Pex_StartSearchResult.new(_lib) as c_res,
-        ):
-            if isinstance(req, ISRCSearchRequest):
-                _lib.Pex_StartSearchRequest_SetISRC(
-                    c_req.get(), req._isrc.encode(), int(req._ft_types)
-                )
-            else:
-                _lib.Pex_Buffer_Set(c_ft.get(), req._fingerprint._ft, len(req._fingerprint._ft))
-                _lib.Pex_StartSearchRequest_SetFingerprint(
-                    c_req.get(), c_ft.get(), c_status.get()
-                )
-                Error.check_status(c_status)
-
-            _lib.Pex_StartSearchRequest_SetType(c_req.get(), req._type)
-
-            _lib.Pex_StartSearch(
-                self._c_client.get(), c_req.get(), c_res.get(), c_status.get()
-            )
-            Error.check_status(c_status)
-
-            lookup_ids = list()
-            c_lookup_id_pos = ctypes.c_size_t(0)
-            c_lookup_id = ctypes.c_char_p()
-
-            while _lib.Pex_StartSearchResult_NextLookupID(
-                c_res.get(),
-                ctypes.byref(c_lookup_id_pos),
-                ctypes.byref(c_lookup_id)
-            ):
-                lookup_ids.append(c_lookup_id.value.decode())
-
-            return PexSearchFuture(self._c_client, lookup_ids)
+        return self._start_search(req, deadline)
+
+    def start_isrc_searches(
+        self, isrcs, ft_types=FingerprintType.ALL, type=PexSearchType.IDENTIFY_MUSIC, max_workers=8
+    ):
+        """
+        Searches many ISRCs. Duplicate ISRCs are searched only once and at
+        most max_workers searches are in progress at the same time.
+
+        Every ISRC still costs one StartSearch and one CheckSearch round
+        trip, the calls of different ISRCs only run concurrently. They can't
+        share a CheckSearch: its response merges the matches of all the
+        lookup IDs in the request without telling which lookup ID a match
+        belongs to, so the result couldn't be split back per ISRC.
+
+        The returned iterator yields an (isrc, result) tuple for every unique
+        ISRC in the order the searches finish. The result is either the search
+        result or the :class:`Error` (or other exception) raised while
+        searching that ISRC; errors of individual ISRCs don't stop the others.
+
+        :param isrcs: iterable of ISRCs, consumed lazily.
+        :param int ft_types: Fingerprint types to be used in the search.
+        :param PexSearchType type: A type of the pex search performed.
+        :param int max_workers: maximum number of concurrent searches.
+        :rtype: Iterator[Tuple[str, Union[dict, Exception]]]
+        """
+        def search(isrc):
+            try:
+                return isrc, self._start_search(ISRCSearchRequest(isrc, ft_types, type)).get()
+            except Exception as err:
+                return isrc, err
+
+        def unique():
+            seen = set()
+            for isrc in isrcs:
+                if isrc not in seen:
+                    seen.add(isrc)
+                    yield isrc
+
+        return _map_unordered(search, unique(), max_workers)
+
+    def _start_search(self, req, deadline=None) -> PexSearchFuture:
+        key = _search_key(req) if self._needs_key() else None
+        if isinstance(req, ISRCSearchRequest):
+            return self._start(PexSearchFuture, key, lambda d: _start_search(
+                self._c_client, isrc=req._isrc, ft_types=req._ft_types, type=req._type, deadline=d
+            ), deadline)
+        return self._start(PexSearchFuture, key, lambda d: _start_search(
+            self._c_client, ft=req._fingerprint, type=req._type, deadline=d
+        ), deadline)
@@ -0,0 +1,378 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from pex.fingerprint import Fingerprint, FingerprintType
+from pex.pex_search import PexSearchClient, PexSearchRequest, ISRCSearchRequest, PexSearchType
+from pex.private_search import PrivateSearchRequest
+from pex.client import _SearchFuture
+from pex.errors import Error, Code
+
+
+PipelineResult = namedtuple("PipelineResult", ["index", "item", "result", "error", "latency"])
+PipelineResult.__doc__ = """
+A single result yielded by :meth:`SearchPipeline.run`. The index is the
+position of the item in the input iterable, exactly one of result and error is
+set and latency is the number of seconds since the item was read from the
+input.
+"""
+
+_STOP = object()
+
+
+class StageStats(object):
+    """
+    Counters of a single :class:`SearchPipeline` stage. Use them to tune the
+    size of the stage pools: a stage with utilization close to 1 is the
+    bottleneck, while a stage that spends a lot of time blocked on its output
+    queue is waiting for the next stage.
+    """
+
+    def __init__(self, name, workers):
+        self._name = name
+        self._workers = workers
+        self._processed = 0
+        self._failed = 0
+        self._busy = 0.0
+        self._blocked = 0.0
+        self._started = None
+        self._stopped = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._started = time.monotonic()
+
+    def _stop(self):
+        self._stopped = time.monotonic()
+
+    def _record(self, busy, blocked, failed):
+        with self._lock:
+            self._processed += 1
+            self._failed += int(failed)
+            self._busy += busy
+            self._blocked += blocked
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def processed(self):
+        """
+        Number of items that went through this stage.
+
+        :type: int
+        """
+        return self._processed
+
+    @property
+    def failed(self):
+        """
+        Number of items that failed in this stage.
+
+        :type: int
+        """
+        return self._failed
+
+    @property
+    def busy_seconds(self):
+        """
+        Total time the workers of this stage spent processing items.
+
+        :type: float
+        """
+        return self._busy
+
+    @property
+    def blocked_seconds(self):
+        """
+        Total time the workers of this stage spent waiting for room in the
+        queue of the next stage (backpressure).
+
+        :type: float
+        """
+        return self._blocked
+
+    @property
+    def utilization(self):
+        """
+        Fraction (0 to 1) of the available worker time spent processing items.
+
+        :type: float
+        """
+        if self._started is None:
+            return 0.0
+        elapsed = (self._stopped or time.monotonic()) - self._started
+        if elapsed <= 0:
+            return 0.0
+        return min(1.0, self._busy / (elapsed * self._workers))
+
+    def as_dict(self):
+        return {
+            "workers": self._workers,
+            "processed": self._processed,
+            "failed": self._failed,
+            "busy_seconds": round(self._busy, 6),
+            "blocked_seconds": round(self._blocked, 6),
+            "utilization": round(self.utilization, 4),
+        }
+
+    def __repr__(self):
+        return "StageStats(name={}, processed={}, utilization={:.2f})".format(
+            self._name, self._processed, self.utilization
+        )
+
+
+class _Stage(object):
+    def __init__(self, name, workers, queue_size, fn):
+        self.stats = StageStats(name, workers)
+        self.input = queue.Queue(queue_size)
+        self.fn = fn
+        self.workers = workers
+        self.running = workers
+        self.lock = threading.Lock()
+
+
+class SearchPipeline(object):
+    """
+    SearchPipeline runs searches for many items at once in three stages:
+    fingerprinting (CPU bound), starting the search and collecting the result
+    (both network bound). Every stage has its own pool of workers and the
+    stages are connected by bounded queues, so a slow stage applies
+    backpressure to the previous ones instead of letting the work pile up in
+    memory.
+
+    The items can be paths to media files, byte buffers holding media files,
+    already generated :class:`Fingerprint` objects, search requests
+    (:class:`ISRCSearchRequest`, :class:`PexSearchRequest` or
+    :class:`PrivateSearchRequest`) or already started search futures.
+    Fingerprints and requests skip the fingerprinting stage, futures only go
+    through the collecting stage.
+    """
+
+    def __init__(
+        self,
+        client,
+        fingerprint_workers=None,
+        start_workers=8,
+        collect_workers=16,
+        queue_size=None,
+        ft_types=FingerprintType.ALL,
+        type=PexSearchType.IDENTIFY_MUSIC,
+        on_started=None,
+    ):
+        """
+        Constructor.
+
+        :param client: either a PexSearchClient or a PrivateSearchClient.
+        :param int fingerprint_workers: size of the fingerprinting pool, defaults to the number of CPUs.
+        :param int start_workers: size of the pool starting the searches.
+        :param int collect_workers: size of the pool retrieving the results.
+        :param int queue_size: capacity of the queues between the stages, defaults to twice the size of the next stage.
+        :param int ft_types: fingerprint types to generate and search with.
+        :param PexSearchType type: type of the pex search, ignored for private search.
+        :param on_started: optional callable invoked with the index, the item and the
+                           future of every started search, e.g. to journal it.
+        """
+        self._client = client
+        self._is_pex = isinstance(client, PexSearchClient)
+        self._ft_types = ft_types
+        self._type = type
+        self._on_started = on_started
+
+        fingerprint_workers = fingerprint_workers or os.cpu_count() or 1
+        self._fingerprint = _Stage(
+            "fingerprint", fingerprint_workers,
+            queue_size or 2 * fingerprint_workers, self._do_fingerprint,
+        )
+        self._start = _Stage(
+            "start", start_workers,
+            queue_size or 2 * start_workers, self._do_start,
+        )
+        self._collect = _Stage(
+            "collect", collect_workers,
+            queue_size or 2 * collect_workers, self._do_collect,
+        )
+        self._stages = [self._fingerprint, self._start, self._collect]
+        self._output = queue.Queue(queue_size or 2 * collect_workers)
+        self._closed = threading.Event()
+        self._threads = []
+
+    @property
+    def stats(self):
+        """
+        Per-stage counters keyed by the stage name ("fingerprint", "start" and
+        "collect").
+
+        :type: Dict[str, StageStats]
+        """
+        return {stage.stats.name: stage.stats for stage in self._stages}
+
+    def run(self, items):
+        """
+        Processes the items and yields a :class:`PipelineResult` for each one
+        as soon as it's finished, i.e. not necessarily in the input order. The
+        input iterable is consumed lazily on a background thread. A pipeline
+        can only be run once. If the iteration stops early (break or an
+        exception in the caller), the pipeline is closed once the iterator is
+        closed or garbage collected, see :meth:`close`.
+
+        :param items: iterable of paths, byte buffers, fingerprints or requests.
+        :rtype: Iterator[PipelineResult]
+        """
+        threads = [threading.Thread(target=self._feed, args=(items,), daemon=True)]
+        for idx, stage in enumerate(self._stages):
+            stage.stats._start()
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, args=(idx,), daemon=True))
+        self._threads = threads
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                res = self._output.get()
+                if res is _STOP:
+                    return
+                if isinstance(res, BaseException):
+                    raise res
+                yield res
+        finally:
+            self.close()
+
+    def close(self, wait=False):
+        """
+        Stops the pipeline: the items not finished yet are dropped and the
+        workers exit once their current call returns. Called automatically
+        when the iterator returned by :meth:`run` is exhausted or closed.
+
+        :param bool wait: whether to wait for the calls in progress to return.
+        """
+        self._closed.set()
+        # Wakes up the workers waiting for input.
+        for stage in self._stages:
+            _drain(stage.input)
+            for _ in range(stage.workers):
+                try:
+                    stage.input.put_nowait(_STOP)
+                except queue.Full:
+                    break
+        _drain(self._output)
+        if wait:
+            # The feeder thread makes no calls and may be blocked reading the
+            # input, only the workers are waited for.
+            current = threading.current_thread()
+            for t in self._threads[1:]:
+                if t is not current:
+                    t.join()
+
+    def _feed(self, items):
+        try:
+            for index, item in enumerate(items):
+                job = [index, item, None, None, time.monotonic()]
+                if isinstance(item, (str, bytes, bytearray, memoryview)):
+                    self._put(self._fingerprint.input, job)
+                elif isinstance(item, _SearchFuture):
+                    job[2] = item
+                    self._put(self._collect.input, job)
+                else:
+                    job[2] = item
+                    self._put(self._start.input, job)
+        except Exception as err:
+            # Failing to read the input is not an error of any particular
+            # item, so it's re-raised from run().
+            self._put(self._output, err)
+        finally:
+            for _ in range(self._fingerprint.workers):
+                self._put(self._fingerprint.input, _STOP)
+
+    def _work(self, idx):
+        stage = self._stages[idx]
+        nxt = self._stages[idx + 1].input if idx + 1 < len(self._stages) else self._output
+        while not self._closed.is_set():
+            try:
+                job = stage.input.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if job is _STOP or self._closed.is_set():
+                break
+
+            t0 = time.monotonic()
+            try:
+                job[2] = stage.fn(job[2] if job[2] is not None else job[1])
+                if stage is self._start and self._on_started is not None:
+                    self._on_started(job[0], job[1], job[2])
+            except Exception as err:
+                job[3] = err
+            t1 = time.monotonic()
+
+            if job[3] is not None:
+                self._put(self._output, self._result(job))
+            elif nxt is self._output:
+                self._put(self._output, self._result(job))
+            else:
+                self._put(nxt, job)
+            stage.stats._record(t1 - t0, time.monotonic() - t1, job[3] is not None)
+
+        with stage.lock:
+            stage.running -= 1
+            last = stage.running == 0
+        if last:
+            stage.stats._stop()
+            if nxt is self._output:
+                self._put(self._output, _STOP)
+            else:
+                for _ in range(self._stages[idx + 1].workers):
+                    self._put(nxt, _STOP)
+
+    def _put(self, q, job):
+        while not self._closed.is_set():
+            try:
+                q.put(job, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    @staticmethod
+    def _result(job):
+        index, item, value, error, started = job
+        latency = time.monotonic() - started
+        if error is not None:
+            return PipelineResult(index, item, None, error, latency)
+        return PipelineResult(index, item, value, None, latency)
+
+    def _do_fingerprint(self, item):
+        if isinstance(item, str):
+            return self._client.fingerprint_file(item, self._ft_types)
+        return self._client.fingerprint_buffer(bytes(item), self._ft_types)
+
+    def _do_start(self, value):
+        if isinstance(value, Fingerprint):
+            if self._is_pex:
+                value = PexSearchRequest(value, self._type)
+            else:
+                value = PrivateSearchRequest(value)
+        if isinstance(value, ISRCSearchRequest):
+            if not self._is_pex:
+                raise Error(Code.INVALID_INPUT, "ISRC search requires the pex search client", False)
+            return self._client.start_isrc_search(value)
+        return self._client.start_search(value)
+
+    def _do_collect(self, future):
+        return future.get()
+
+
+def _drain(q):
+    try:
+        while True:
+            q.get_nowait()
+    except queue.Empty:
+        pass
@@ -11,16 +11,14 @@ from pex.lib import (
     _Pex_Status,
     _Pex_Lock,
     _Pex_Buffer,
-    _Pex_StartSearchRequest,
-    _Pex_StartSearchResult,
-    _Pex_CheckSearchRequest,
-    _Pex_CheckSearchResult,
     _Pex_ListRequest,
     _Pex_ListResult,
 )
 from pex.errors import Error
-from pex.client import _ClientType, _init_client
-from pex.fingerprint import _Fingerprinter, FingerprintType
+from pex.deadline import Deadline, _check, _with_deadline
+from pex.client import _ClientType, _start_search, _Guard, _SearchClient, _SearchFuture
+from pex.fingerprint import FingerprintType
+from pex.reconcile import _reconcile
 
 
 class PrivateSearchRequest(object):
@@ -46,54 +44,13 @@ class PrivateSearchRequest(object):
         return "PrivateSearchRequest(fingerprint=...)"
 
 
-class PrivateSearchFuture(object):
+class PrivateSearchFuture(_SearchFuture):
     """
     This object is returned by the :meth:`PrivateSearchClient.start` method
     and is used to retrieve a search result.
     """
 
-    def __init__(self, c_client, lookup_ids):
-        self._raw_c_client = c_client.get()
-        self._lookup_ids = lookup_ids
-
-    def get(self):
-        """
-        Blocks until the search result is ready and then returns it.
-
-        :raise: :class:`Error` if the search couldn't be performed, e.g.
-                because of network issues.
-        :rtype: PrivateSearchResult
-        """
-        with (
-            _Pex_Lock.new(_lib) as c_lock,
-            _Pex_Status.new(_lib) as c_status,
-            _Pex_CheckSearchRequest.new(_lib) as c_req,
-            _Pex_CheckSearchResult.new(_lib) as c_res,
-        ):
-            for lookup_id in self._lookup_ids:
-                _lib.Pex_CheckSearchRequest_AddLookupID(
-                    c_req.get(), lookup_id.encode()
-                )
-
-            _lib.Pex_CheckSearch(
-                self._raw_c_client, c_req.get(), c_res.get(), c_status.get()
-            )
-            Error.check_status(c_status)
-
-            res = _lib.Pex_CheckSearchResult_GetJSON(c_res.get())
-            j = json.loads(res)
-            j['lookup_ids'] = self._lookup_ids
-            return j
-
-    @property
-    def lookup_ids(self):
-        """
-        A list of IDs that uniquely identify a particular search. Can be
-        used for diagnostics.
-
-        :type: List[str]
-        """
-        return self._lookup_ids
+    _kind = "private"
 
     def __repr__(self):
         return "PrivateSearchFuture(lookup_ids={})".format(self._lookup_ids)
@@ -123,8 +80,9 @@ class Lister(object):
     contains too many entries.
     """
 
-    def __init__(self, c_client, after, limit):
+    def __init__(self, c_client, after, limit, guard=None):
         self._c_client = c_client
+        self._guard = guard if guard is not None else _Guard()
         self._end_cursor = after
         self._limit = limit
         self._has_next_page = True
@@ -147,21 +105,36 @@ class Lister(object):
         """
         return self._has_next_page
 
-    def list(self):
+    def list(self, deadline=None):
         """
         This method grabs the next "page" and returns entries.
 
+        :param deadline: optional :class:`Deadline` or number of seconds
+                         after which the call fails with DEADLINE_EXCEEDED.
         :raise: :class:`Error` if the request couldn't complete, e.g.
                 because of network issues.
         :rtype: list
         """
+        deadline = Deadline._from(deadline)
+        priority = self._guard.priority()
+        # The cursor is only advanced once the page is returned to the
+        # caller: a call abandoned at its deadline may still complete in the
+        # background and must not skip the page it fetched.
+        entries, self._end_cursor, self._has_next_page = _with_deadline(
+            deadline, self._guard.run, "list", priority, deadline, self._list, self._end_cursor, deadline
+        )
+        return entries
+
+    def _list(self, after, deadline):
         with (
             _Pex_Lock.new(_lib) as c_lock,
             _Pex_Status.new(_lib) as c_status,
             _Pex_ListRequest.new(_lib) as c_req,
             _Pex_ListResult.new(_lib) as c_res,
         ):
-            _lib.Pex_ListRequest_SetAfter(c_req.get(), self._end_cursor.encode())
+            _check(deadline)
+
+            _lib.Pex_ListRequest_SetAfter(c_req.get(), after.encode())
             _lib.Pex_ListRequest_SetLimit(c_req.get(), self._limit)
 
             _lib.Pex_List(self._c_client.get(), c_req.get(), c_res.get(), c_status.get())
@@ -169,65 +142,81 @@ class Lister(object):
 
             res = _lib.Pex_ListResult_GetJSON(c_res.get())
             j = json.loads(res)
-            self._end_cursor = j['end_cursor']
-            self._has_next_page = j['has_next_page']
-            return j['entries']
+            return j['entries'], j['end_cursor'], j['has_next_page']
 
 
-class PrivateSearchClient(_Fingerprinter):
-    def __init__(self, client_id, client_secret):
-        self._c_client = _init_client(_ClientType.PRIVATE_SEARCH, client_id, client_secret)
-        super().__init__(self._c_client)
+class PrivateSearchClient(_SearchClient):
+    _future_cls = PrivateSearchFuture
 
-    def start_search(self, req):
+    def __init__(
+        self, client_id, client_secret, cache=None, single_flight=None,
+        scheduler=None, limiter=None, rate_limiter=None, validator=None,
+        background_init=False, shared=False, breaker=None,
+    ):
+        """
+        Constructor.
+
+        :param str client_id: client ID of the account.
+        :param str client_secret: client secret of the account.
+        :param SearchCache cache: optional cache of search results.
+        :param SingleFlight single_flight: optional deduplication of concurrent identical searches.
+        :param Scheduler scheduler: optional priority scheduling of the calls.
+        :param AdaptiveLimiter limiter: optional adaptive limit of concurrent network calls.
+        :param HostRateLimiter rate_limiter: optional host-wide rate limit of the network calls.
+        :param MediaValidator validator: optional pre-check of the media before fingerprinting.
+        :param bool background_init: initialize the client on a background thread, the first
+                                     call waits for the initialization to finish.
+        :param bool shared: reuse the native client of another shared client of the same type
+                            and credentials in this process.
+        :param CircuitBreaker breaker: optional fail-fast of the network calls during outages.
+        """
+        super().__init__(
+            _ClientType.PRIVATE_SEARCH, client_id, client_secret, cache, single_flight,
+            scheduler, limiter, rate_limiter, validator, background_init, shared,
+            breaker,
+        )
+
+    def start_search(self, req, deadline=None):
         """
         Starts a private search. This operation does not block until the
         search is finished, it does however perform a network operation to
         initiate the search on the backend service.
 
         :param PrivateSearchRequest req: search parameters.
+        :param deadline: optional :class:`Deadline` or number of seconds
+                         after which the call fails with DEADLINE_EXCEEDED.
         :raise: :class:`Error` if the search couldn’t be initiated, e.g.
                 because of network issues.
         :rtype: PrivateSearchFuture
         """
-        with (
-            _Pex_Lock.new(_lib) as c_lock,
-            _Pex_Status.new(_lib) as c_status,
-            _Pex_Buffer.new(_lib) as c_ft,
-            _Pex_StartSearchRequest.new(_lib) as c_req,
-            _Pex_StartSearchResult.new(_lib) as c_res,
-        ):
-            _lib.Pex_Buffer_Set(c_ft.get(), req.fingerprint._ft, len(req.fingerprint._ft))
-
-            _lib.Pex_StartSearchRequest_SetFingerprint(
-                c_req.get(), c_ft.get(), c_status.get()
-            )
-            Error.check_status(c_status)
-
-            _lib.Pex_StartSearch(
-                self._c_client.get(), c_req.get(), c_res.get(), c_status.get()
-            )
-            Error.check_status(c_status)
-
-            lookup_ids = list()
-            c_lookup_id_pos = ctypes.c_size_t(0)
-            c_lookup_id = ctypes.c_char_p()
-
-            while _lib.Pex_StartSearchResult_NextLookupID(
-                c_res.get(),
-                ctypes.byref(c_lookup_id_pos),
-                ctypes.byref(c_lookup_id)
-            ):
-                lookup_ids.append(c_lookup_id.value.decode())
+        key = None
+        if self._needs_key():
+            key = "private:ft:{}".format(req.fingerprint.digest)
+        return self._start(PrivateSearchFuture, key, lambda d: _start_search(
+            self._c_client, ft=req.fingerprint, deadline=d
+        ), deadline)
+
+    def ingest(self, provided_id, ft, deadline=None):
+        """
+        Ingests a fingerprint into the private catalog under the given ID.
 
-            return PrivateSearchFuture(self._c_client, lookup_ids)
+        :param str provided_id: ID of the asset in the catalog.
+        :param Fingerprint ft: fingerprint of the asset.
+        :param deadline: optional :class:`Deadline` or number of seconds
+                         after which the call fails with DEADLINE_EXCEEDED.
+        :raise: :class:`Error` if the fingerprint couldn't be ingested.
+        """
+        deadline = Deadline._from(deadline)
+        return self._call("ingest", deadline, self._ingest, provided_id, ft, deadline)
 
-    def ingest(self, provided_id, ft):
+    def _ingest(self, provided_id, ft, deadline):
         with (
             _Pex_Lock.new(_lib) as c_lock,
             _Pex_Status.new(_lib) as c_status,
             _Pex_Buffer.new(_lib) as c_ft,
         ):
+            _check(deadline)
+
             _lib.Pex_Buffer_Set(c_ft.get(), ft._ft, len(ft._ft))
 
             _lib.Pex_Ingest(
@@ -235,11 +224,27 @@ class PrivateSearchClient(_Fingerprinter):
             )
             Error.check_status(c_status)
 
-    def archive(self, provided_id, ft_types=FingerprintType.ALL):
+    def archive(self, provided_id, ft_types=FingerprintType.ALL, deadline=None):
+        """
+        Archives the given fingerprint types of an asset in the private
+        catalog.
+
+        :param str provided_id: ID of the asset in the catalog.
+        :param int ft_types: fingerprint types to archive.
+        :param deadline: optional :class:`Deadline` or number of seconds
+                         after which the call fails with DEADLINE_EXCEEDED.
+        :raise: :class:`Error` if the asset couldn't be archived.
+        """
+        deadline = Deadline._from(deadline)
+        return self._call("archive", deadline, self._archive, provided_id, ft_types, deadline)
+
+    def _archive(self, provided_id, ft_types, deadline):
         with (
             _Pex_Lock.new(_lib) as c_lock,
             _Pex_Status.new(_lib) as c_status,
         ):
+            _check(deadline)
+
             _lib.Pex_Archive(
                 self._c_client.get(), provided_id.encode(), int(ft_types), c_status.get()
             )
@@ -250,17 +255,59 @@ class PrivateSearchClient(_Fingerprinter):
         This method initiates listing of the catalog and returns a Lister that can
         be used to retrieve the entries.
         """
-        return Lister(self._c_client, req._after, req._limit)
+        return Lister(self._c_client, req._after, req._limit, self._guard)
     
-    def get_entry(self, provided_id):
+    def get_entry(self, provided_id, deadline=None):
+        """
+        Retrieves an asset from the private catalog.
+
+        :param str provided_id: ID of the asset in the catalog.
+        :param deadline: optional :class:`Deadline` or number of seconds
+                         after which the call fails with DEADLINE_EXCEEDED.
+        :raise: :class:`Error` if the asset couldn't be retrieved.
+        :rtype: dict
+        """
+        deadline = Deadline._from(deadline)
+        return self._call("get", deadline, self._get_entry, provided_id, deadline)
+
+    def _get_entry(self, provided_id, deadline):
         with (
             _Pex_Lock.new(_lib) as c_lock,
             _Pex_Status.new(_lib) as c_status,
             _Pex_Buffer.new(_lib) as c_json,
         ):
+            _check(deadline)
+
             _lib.Pex_Get(self._c_client.get(), provided_id.encode(), c_json.get(), c_status.get())
             Error.check_status(c_status)
 
             data = _lib.Pex_Buffer_GetData(c_json.get())
             res = ctypes.string_at(data)
-            return json.loads(res)
\ No newline at end of file
+            return json.loads(res)
+
+    def reconcile(
+        self, desired, fingerprint=None, ft_types=FingerprintType.ALL,
+        dry_run=False, max_workers=8, page_size=1000,
+    ):
+        """
+        Brings the catalog in sync with the desired set of provided IDs. The
+        catalog is listed page by page and compared against the desired IDs
+        using a compact hash-based set (about 9 bytes per ID), then only the
+        missing IDs are ingested and the extra ones archived, with at most
+        max_workers operations running at the same time.
+
+        The desired IDs are iterated twice, so they must be a collection
+        (e.g. a list or a set) or a callable returning a new iterable each
+        time it's called, e.g. a function reading the IDs from a file.
+
+        :param desired: provided IDs that should be in the catalog.
+        :param fingerprint: callable returning the :class:`Fingerprint` to ingest for a provided ID, not needed for a dry run.
+        :param int ft_types: fingerprint types to archive.
+        :param bool dry_run: only compute the differences without applying them.
+        :param int max_workers: maximum number of concurrent ingest and archive calls.
+        :param int page_size: number of entries retrieved by a single list call.
+        :raise: :class:`Error` if the catalog couldn't be listed.
+        :rtype: ReconcileReport
+        """
+        lister = self.list_entries(ListEntriesRequest(limit=page_size))
+        return _reconcile(self, lister, desired, fingerprint, ft_types, dry_run, max_workers)
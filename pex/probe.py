@@ -0,0 +1,352 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from pex.errors import Error, Code
+
+
+MediaInfo = namedtuple("MediaInfo", ["container", "codecs", "duration", "size"])
+MediaInfo.__doc__ = """
+What could be learned about a media file from its headers: the container
+("mp4", "adts", "mpegts", "none" for files that certainly aren't media or None
+if unknown), the codecs of its tracks, its duration in seconds (None if
+unknown) and its size in bytes.
+"""
+
+# Codecs the fingerprinter supports.
+SUPPORTED_CODECS = ("aac", "h264", "h265")
+
+# MP4 sample entry formats and the codecs they carry.
+_MP4_CODECS = {
+    b"mp4a": "aac",
+    b"avc1": "h264",
+    b"avc3": "h264",
+    b"hvc1": "h265",
+    b"hev1": "h265",
+}
+
+# Boxes that contain the boxes the probe is looking for.
+_MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+# Top-level boxes a QuickTime/MP4 file may start with.
+_MP4_TOP_LEVEL = {b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip", b"pnot"}
+
+# Headers of common files that are certainly not media.
+_NOT_MEDIA = (b"%PDF", b"\x89PNG", b"GIF8", b"PK\x03\x04", b"\xff\xd8\xff", b"<!DOCTYPE", b"<html", b"<?xml")
+
+_ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+
+# Maximum size of the moov box read by the probe.
+_MAX_MOOV = 64 << 20
+
+# Number of bytes read from the start of a file to probe it.
+_HEAD = 64 << 10
+
+
+def _mp4_boxes(data, pos, end):
+    # Yields (type, payload start, payload end) of the boxes in data[pos:end].
+    while pos + 8 <= end:
+        size, typ = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield typ, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _parse_moov(data, pos, end, found):
+    for typ, start, stop in _mp4_boxes(data, pos, end):
+        if typ in _MP4_CONTAINERS:
+            _parse_moov(data, start, stop, found)
+        elif typ == b"mvhd" and stop - start >= 20:
+            if data[start] == 1 and stop - start >= 32:
+                timescale, duration = struct.unpack_from(">IQ", data, start + 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", data, start + 12)
+            # Fragmented files leave the duration zero or all ones.
+            if timescale and duration not in (0, 0xffffffff, 0xffffffffffffffff):
+                found["duration"] = duration / timescale
+        elif typ == b"stsd" and stop - start >= 8:
+            count = struct.unpack_from(">I", data, start + 4)[0]
+            for i, (fmt, _, _) in enumerate(_mp4_boxes(data, start + 8, stop)):
+                if i >= count:
+                    break
+                found["codecs"].append(_MP4_CODECS.get(fmt, fmt.decode("latin-1").strip()))
+
+
+def _probe_mp4(read, size):
+    # Walks the top-level boxes reading only their headers, and parses the
+    # moov box.
+    pos = 0
+    while pos + 8 <= size:
+        header = read(pos, 16)
+        if len(header) < 8:
+            break
+        box_size, typ = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if box_size == 1 and len(header) >= 16:
+            box_size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif box_size == 0:
+            box_size = size - pos
+        if box_size < header_size:
+            break
+        if typ == b"moov":
+            if box_size > _MAX_MOOV:
+                break
+            data = read(pos, box_size)
+            found = {"duration": None, "codecs": []}
+            _parse_moov(data, header_size, len(data), found)
+            return MediaInfo("mp4", tuple(found["codecs"]), found["duration"], size)
+        pos += box_size
+    return MediaInfo("mp4", (), None, size)
+
+
+def _skip_id3(head):
+    if head[:3] == b"ID3" and len(head) >= 10:
+        s = head[6:10]
+        return 10 + ((s[0] & 0x7f) << 21 | (s[1] & 0x7f) << 14 | (s[2] & 0x7f) << 7 | (s[3] & 0x7f))
+    return 0
+
+
+def _probe_adts(head, offset, size):
+    # Parses the headers of the ADTS frames at the start and extrapolates
+    # the duration from their average length.
+    pos = offset
+    frames = 0
+    samples = 0
+    sample_rate = None
+    while pos + 7 <= len(head):
+        b = head[pos:pos + 7]
+        if b[0] != 0xff or b[1] & 0xf6 != 0xf0:
+            break
+        sf_index = (b[2] >> 2) & 0x0f
+        if sf_index >= len(_ADTS_SAMPLE_RATES):
+            break
+        length = ((b[3] & 0x03) << 11) | (b[4] << 3) | (b[5] >> 5)
+        if length < 7:
+            break
+        sample_rate = _ADTS_SAMPLE_RATES[sf_index]
+        samples += ((b[6] & 0x03) + 1) * 1024
+        frames += 1
+        pos += length
+    if frames == 0:
+        return None
+    duration = samples / sample_rate * (size - offset) / (pos - offset)
+    return MediaInfo("adts", ("aac",), duration, size)
+
+
+def _probe(head, read, size):
+    if size == 0:
+        return MediaInfo(None, (), 0.0, 0)
+    if head[4:8] in _MP4_TOP_LEVEL:
+        return _probe_mp4(read, size)
+    if len(head) >= 377 and head[0] == head[188] == head[376] == 0x47:
+        return MediaInfo("mpegts", (), None, size)
+    offset = _skip_id3(head)
+    info = _probe_adts(head, offset, size)
+    if info is not None:
+        return info
+    if head.startswith(_NOT_MEDIA):
+        return MediaInfo("none", (), None, size)
+    return MediaInfo(None, (), None, size)
+
+
+def probe_file(path):
+    """
+    Reads the container headers of a media file and returns what could be
+    learned from them. Only the start of the file, the box headers and the
+    moov box of MP4 files are read.
+
+    :param str path: path to the media file.
+    :raise: OSError if the file can't be read.
+    :rtype: MediaInfo
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+
+        def read(pos, n):
+            f.seek(pos)
+            return f.read(n)
+
+        return _probe(read(0, _HEAD), read, size)
+
+
+def probe_buffer(buf):
+    """
+    Same as :func:`probe_file` for a media file loaded in memory.
+
+    :param bytes buf: A byte buffer holding a media file.
+    :rtype: MediaInfo
+    """
+    buf = memoryview(buf).cast("B")
+
+    def read(pos, n):
+        return bytes(buf[pos:pos + n])
+
+    return _probe(read(0, _HEAD), read, len(buf))
+
+
+class MediaValidator(object):
+    """
+    MediaValidator rejects inputs that can't be fingerprinted before the
+    native fingerprinter spends CPU on them. It reads only the container
+    headers to find out the codecs and the duration, and rejects empty
+    inputs, files that are certainly not media, MP4 files without a
+    supported codec and inputs not longer than min_duration. Inputs in a
+    format it doesn't recognize are let through. Pass it to the client
+    constructor to enable it:
+
+        validator = pex.MediaValidator()
+        client = pex.PexSearchClient(CLIENT_ID, CLIENT_SECRET, validator=validator)
+
+    Rejected inputs fail with :attr:`Code.INVALID_INPUT`. The validator
+    measures the CPU time the fingerprinter spends per byte and estimates
+    the CPU time saved by the rejections, see :meth:`stats`.
+    """
+
+    def __init__(self, min_duration=1.0, codecs=SUPPORTED_CODECS):
+        """
+        Constructor.
+
+        :param float min_duration: inputs must be longer than this number of seconds.
+        :param codecs: supported codecs.
+        """
+        self._min_duration = min_duration
+        self._codecs = frozenset(codecs)
+        self._checked = 0
+        self._rejected = {}
+        self._rejected_bytes = 0
+        self._check_seconds = 0.0
+        self._fingerprinted = 0
+        self._fingerprinted_bytes = 0
+        self._fingerprint_cpu = 0.0
+        self._failed = 0
+        self._failed_cpu = 0.0
+        self._lock = threading.Lock()
+
+    def check_file(self, path):
+        """
+        Probes a media file.
+
+        :param str path: path to the media file.
+        :raise: :class:`Error` with :attr:`Code.INVALID_INPUT` if the file can't be fingerprinted.
+        :rtype: MediaInfo
+        """
+        t0 = time.thread_time()
+        try:
+            info = probe_file(path)
+        except OSError:
+            # Let the fingerprinter report missing or unreadable files.
+            return None
+        return self._validate(info, time.thread_time() - t0)
+
+    def check_buffer(self, buf):
+        """
+        Probes a media file loaded in memory.
+
+        :param bytes buf: A byte buffer holding a media file.
+        :raise: :class:`Error` with :attr:`Code.INVALID_INPUT` if the buffer can't be fingerprinted.
+        :rtype: MediaInfo
+        """
+        t0 = time.thread_time()
+        info = probe_buffer(buf)
+        return self._validate(info, time.thread_time() - t0)
+
+    def _validate(self, info, seconds):
+        reason = None
+        if info.size == 0:
+            reason = "empty"
+        elif info.container == "none":
+            reason = "not media"
+        elif info.container is not None and info.codecs and not self._codecs.intersection(info.codecs):
+            reason = "unsupported codec"
+        elif info.duration is not None and info.duration <= self._min_duration:
+            reason = "too short"
+
+        with self._lock:
+            self._checked += 1
+            self._check_seconds += seconds
+            if reason is not None:
+                self._rejected[reason] = self._rejected.get(reason, 0) + 1
+                self._rejected_bytes += info.size
+        if reason is not None:
+            raise Error(Code.INVALID_INPUT, "media pre-check: {} ({})".format(reason, _describe(info)), False)
+        return info
+
+    def _run(self, size, fn, *args):
+        # Runs the native fingerprinter and accounts for its CPU time.
+        t0 = time.thread_time()
+        try:
+            res = fn(*args)
+        except Error:
+            with self._lock:
+                self._failed += 1
+                self._failed_cpu += time.thread_time() - t0
+            raise
+        with self._lock:
+            self._fingerprinted += 1
+            self._fingerprinted_bytes += size
+            self._fingerprint_cpu += time.thread_time() - t0
+        return res
+
+    @property
+    def cpu_saved_seconds(self):
+        """
+        Estimated CPU time the fingerprinter would have spent on the rejected
+        inputs, based on its average CPU time per byte, minus the time spent
+        on the checks.
+
+        :type: float
+        """
+        if not self._fingerprinted_bytes:
+            return 0.0
+        per_byte = self._fingerprint_cpu / self._fingerprinted_bytes
+        return self._rejected_bytes * per_byte - self._check_seconds
+
+    def stats(self):
+        """
+        Returns the number of inputs checked and rejected (by reason), the
+        number of inputs fingerprinted and failing in the fingerprinter
+        despite passing the check, the CPU time spent on the checks, on
+        fingerprinting and on failed fingerprinting, and the estimated CPU
+        time saved.
+
+        :rtype: dict
+        """
+        return {
+            "checked": self._checked,
+            "rejected": sum(self._rejected.values()),
+            "rejected_by_reason": dict(self._rejected),
+            "fingerprinted": self._fingerprinted,
+            "failed": self._failed,
+            "check_cpu_seconds": self._check_seconds,
+            "fingerprint_cpu_seconds": self._fingerprint_cpu,
+            "failed_cpu_seconds": self._failed_cpu,
+            "cpu_saved_seconds": self.cpu_saved_seconds,
+        }
+
+    def __repr__(self):
+        return "MediaValidator(checked={}, rejected={})".format(
+            self._checked, sum(self._rejected.values())
+        )
+
+
+def _describe(info):
+    parts = [info.container or "unknown format"]
+    if info.codecs:
+        parts.append("/".join(info.codecs))
+    if info.duration is not None:
+        parts.append("{:.2f}s".format(info.duration))
+    return ", ".join(parts)
@@ -0,0 +1,168 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import json
+import math
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from pex.deadline import _deadline_exceeded
+from pex.stats import LatencyRecorder
+
+# Operation classes the clients rate limit: starting searches, retrieving
+# results (CheckSearch), ingesting, archiving, getting and listing entries.
+OPERATION_CLASSES = ("search", "check", "ingest", "archive", "get", "list")
+
+
+class HostRateLimiter(object):
+    """
+    HostRateLimiter is a token bucket rate limiter shared by all the
+    processes on a host. The buckets live in a small state file protected by
+    an exclusive file lock, so every process using the same path draws from
+    the same buckets. There is a separate bucket for every operation class
+    given in the rates; operations without a rate aren't limited. Pass it to
+    the client constructor to enable it:
+
+        rate_limiter = pex.HostRateLimiter("/run/pex/quota", {"search": 50, "check": 200})
+        client = pex.PexSearchClient(CLIENT_ID, CLIENT_SECRET, rate_limiter=rate_limiter)
+
+    A call takes a token and, if the bucket is empty, reserves the next one
+    and sleeps until it's due, so the aggregate rate stays at the
+    configured one instead of bursting and backing off. All the processes
+    must be configured with the same rates. Requires a POSIX system.
+
+    An empty or missing state file starts with full buckets. If the state
+    can't be read back, e.g. because it was torn by a crash or overwritten
+    by another program, the unreadable buckets are reset to full and
+    counted in :meth:`stats`, and the file is rewritten.
+    """
+
+    def __init__(self, path, rates, burst=None):
+        """
+        Constructor.
+
+        :param str path: path of the state file shared by the processes.
+        :param dict rates: operation class -> number of calls per second allowed on the host.
+        :param dict burst: operation class -> bucket capacity, one second's worth by default.
+        """
+        if fcntl is None:
+            raise RuntimeError("the host rate limiter requires fcntl")
+        unknown = set(rates) - set(OPERATION_CLASSES)
+        if unknown:
+            raise ValueError("unknown operation classes: {}".format(sorted(unknown)))
+        burst = burst or {}
+        self._path = path
+        self._rates = {op: float(rate) for op, rate in rates.items()}
+        self._burst = {op: float(burst.get(op, max(1.0, rate))) for op, rate in self._rates.items()}
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        self._wait = {op: LatencyRecorder() for op in self._rates}
+        self._throttled = dict.fromkeys(self._rates, 0)
+        self._resets = dict.fromkeys(self._rates, 0)
+        self._lock = threading.Lock()
+
+    def _reserve(self, op, max_wait):
+        # Takes a token of the bucket under the file lock and returns the
+        # number of seconds until it's due, or None if that exceeds max_wait.
+        rate = self._rates[op]
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                state = _parse_state(os.pread(self._fd, 1 << 16, 0))
+                now = time.time()
+                bucket = _parse_bucket(state.get(op))
+                if bucket is None:
+                    if op in state:
+                        self._resets[op] += 1
+                    bucket = (self._burst[op], now)
+                tokens, last = bucket
+                tokens = min(self._burst[op], tokens + max(0.0, now - last) * rate)
+                tokens -= 1.0
+                wait = -tokens / rate if tokens < 0 else 0.0
+                if max_wait is not None and wait > max_wait:
+                    return None
+                state[op] = (tokens, now)
+                data = json.dumps(state).encode()
+                os.pwrite(self._fd, data, 0)
+                os.ftruncate(self._fd, len(data))
+                return wait
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _acquire(self, op, deadline=None):
+        if op not in self._rates:
+            return
+        wait = self._reserve(op, None if deadline is None else deadline.remaining())
+        if wait is None:
+            raise _deadline_exceeded()
+        if wait > 0:
+            with self._lock:
+                self._throttled[op] += 1
+            time.sleep(wait)
+        self._wait[op].record(wait)
+
+    def stats(self, ps=(50, 90, 99)):
+        """
+        Returns, for every operation class, the configured rate, the number
+        of calls of this process that had to wait for a token, the number of
+        times this process found the bucket unreadable and reset it, and the
+        percentiles of the waiting time.
+
+        :rtype: dict
+        """
+        return {
+            op: {
+                "rate": self._rates[op],
+                "throttled": self._throttled[op],
+                "resets": self._resets[op],
+                "wait": self._wait[op].summary(ps),
+            }
+            for op in self._rates
+        }
+
+    def close(self):
+        """
+        Closes the state file.
+        """
+        # The constructor may have failed before opening the file.
+        if getattr(self, "_fd", None) is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        self.close()
+
+    def __repr__(self):
+        return "HostRateLimiter(path={}, rates={})".format(self._path, self._rates)
+
+
+def _parse_state(raw):
+    # Returns the buckets stored in the state file. Unreadable content is
+    # returned as a state with every bucket invalid, so that the buckets get
+    # reset and counted.
+    if not raw.strip():
+        return {}
+    try:
+        state = json.loads(raw)
+    except ValueError:
+        state = None
+    if not isinstance(state, dict):
+        return dict.fromkeys(OPERATION_CLASSES)
+    return state
+
+
+def _parse_bucket(entry):
+    # Returns the (tokens, last refill time) of a bucket, or None if it's
+    # missing or invalid.
+    try:
+        tokens, last = entry
+        tokens, last = float(tokens), float(last)
+    except (TypeError, ValueError):
+        return None
+    if not (math.isfinite(tokens) and math.isfinite(last)):
+        return None
+    return tokens, last
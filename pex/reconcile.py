@@ -0,0 +1,189 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import hashlib
+import itertools
+import json
+import tempfile
+import time
+from array import array
+from bisect import bisect_left
+
+from pex.client import _map_unordered
+
+
+class _IDSet(object):
+    # A compact set of provided IDs that scales to tens of millions of
+    # entries. Only a 64-bit hash of every ID is kept (8 bytes per ID plus a
+    # 1 byte mark), partitioned into 256 sorted arrays by the top byte of the
+    # hash. Hash collisions are possible but extremely unlikely at this scale.
+
+    def __init__(self, ids):
+        self._buckets = [array("Q") for _ in range(256)]
+        for provided_id in ids:
+            h = self._hash(provided_id)
+            self._buckets[h >> 56].append(h)
+        for i, bucket in enumerate(self._buckets):
+            self._buckets[i] = array("Q", sorted(set(bucket)))
+        self._marks = [bytearray(len(bucket)) for bucket in self._buckets]
+
+    @staticmethod
+    def _hash(provided_id):
+        digest = hashlib.blake2b(provided_id.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def _find(self, provided_id):
+        h = self._hash(provided_id)
+        bucket = self._buckets[h >> 56]
+        i = bisect_left(bucket, h)
+        if i < len(bucket) and bucket[i] == h:
+            return h >> 56, i
+        return None
+
+    def mark(self, provided_id):
+        """
+        Marks the ID as seen and returns True if it's in the set.
+        """
+        pos = self._find(provided_id)
+        if pos is None:
+            return False
+        self._marks[pos[0]][pos[1]] = 1
+        return True
+
+    def is_marked(self, provided_id):
+        pos = self._find(provided_id)
+        return pos is not None and self._marks[pos[0]][pos[1]] == 1
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets)
+
+
+class ReconcileReport(object):
+    """
+    Summary of a :meth:`PrivateSearchClient.reconcile` run. In a dry run only
+    the differences are computed and nothing is ingested or archived.
+
+    Only the number of IDs to ingest, to archive and failing is kept, along
+    with the first sample_size of each (in ingest_sample, archive_sample and
+    failures), so that the report stays small for catalogs of any size.
+    """
+
+    def __init__(self, dry_run, sample_size=100):
+        self.dry_run = dry_run
+        self.sample_size = sample_size
+        self.desired = 0
+        self.listed = 0
+        self.to_ingest = 0
+        self.to_archive = 0
+        self.ingest_sample = []
+        self.archive_sample = []
+        self.ingested = 0
+        self.archived = 0
+        self.failed = 0
+        self.failures = []
+        self.diff_seconds = 0.0
+        self.apply_seconds = 0.0
+
+    def _sample(self, sample, item):
+        if len(sample) < self.sample_size:
+            sample.append(item)
+
+    @property
+    def throughput(self):
+        """
+        Number of ingest and archive operations applied per second.
+
+        :type: float
+        """
+        if self.apply_seconds <= 0:
+            return 0.0
+        return (self.ingested + self.archived + self.failed) / self.apply_seconds
+
+    def __repr__(self):
+        return (
+            "ReconcileReport(dry_run={}, desired={}, listed={}, to_ingest={}, to_archive={}, "
+            "ingested={}, archived={}, failed={}, throughput={:.1f}/s)"
+        ).format(
+            self.dry_run, self.desired, self.listed, self.to_ingest, self.to_archive,
+            self.ingested, self.archived, self.failed, self.throughput,
+        )
+
+
+def _iter_desired(desired):
+    if callable(desired):
+        return iter(desired())
+    return iter(desired)
+
+
+def _reconcile(client, lister, desired, fingerprint, ft_types, dry_run, max_workers):
+    if not callable(desired) and iter(desired) is desired:
+        raise ValueError("desired must be a collection or a callable returning an iterable, "
+                         "it's iterated twice")
+    if fingerprint is None and not dry_run:
+        raise ValueError("fingerprint is required unless dry_run is set")
+
+    report = ReconcileReport(dry_run)
+    started = time.monotonic()
+
+    ids = _IDSet(_iter_desired(desired))
+    report.desired = len(ids)
+
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as to_archive:
+        # Stream the remote catalog, anything that's not desired gets
+        # archived. The IDs are spilled to a temporary file rather than
+        # kept in memory, and archived once the listing is done so that the
+        # pagination isn't affected.
+        while lister.has_next_page:
+            for entry in lister.list():
+                report.listed += 1
+                provided_id = entry["provided_id"]
+                if not ids.mark(provided_id):
+                    report.to_archive += 1
+                    report._sample(report.archive_sample, provided_id)
+                    to_archive.write(json.dumps(provided_id) + "\n")
+
+        def archive_ops():
+            to_archive.seek(0)
+            for line in to_archive:
+                yield "archive", json.loads(line)
+
+        def ingest_ops():
+            # Desired IDs that weren't seen in the catalog get ingested.
+            for provided_id in _iter_desired(desired):
+                if not ids.is_marked(provided_id):
+                    ids.mark(provided_id)
+                    report.to_ingest += 1
+                    report._sample(report.ingest_sample, provided_id)
+                    yield "ingest", provided_id
+
+        if dry_run:
+            for _ in ingest_ops():
+                pass
+            report.diff_seconds = time.monotonic() - started
+            return report
+        report.diff_seconds = time.monotonic() - started
+
+        def apply(op):
+            kind, provided_id = op
+            try:
+                if kind == "ingest":
+                    client.ingest(provided_id, fingerprint(provided_id))
+                else:
+                    client.archive(provided_id, ft_types)
+            except Exception as err:
+                return kind, provided_id, err
+            return kind, provided_id, None
+
+        # The ingest operations are computed while they're applied, so
+        # diff_seconds only covers listing the catalog.
+        ops = itertools.chain(archive_ops(), ingest_ops())
+        started = time.monotonic()
+        for kind, provided_id, err in _map_unordered(apply, ops, max_workers):
+            if err is not None:
+                report.failed += 1
+                report._sample(report.failures, (provided_id, err))
+            elif kind == "ingest":
+                report.ingested += 1
+            else:
+                report.archived += 1
+        report.apply_seconds = time.monotonic() - started
+    return report
@@ -0,0 +1,347 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import ctypes
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+
+from pex import lib as _pexlib
+from pex.errors import Code
+from pex.fakelib import FakeLib, _Installed
+
+_FORMAT = "pex-recording"
+_VERSION = 1
+
+# Operations that are recorded and replayed.
+RECORDED_OPERATIONS = ("start", "check", "list", "get", "ingest", "archive")
+
+
+def _addr(ptr):
+    return ctypes.cast(ptr, ctypes.c_void_p).value
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _check_key(lookup_ids):
+    return ",".join(sorted(lookup_ids))
+
+
+class RecordingLib(object):
+    """
+    RecordingLib wraps the native library and records every search, list,
+    get, ingest and archive call made through the clients into a log: the
+    request parameters, the status code, the response JSON and the duration
+    of the call. The log is written as JSON lines, gzip compressed if the
+    path ends with ".gz". Fingerprints are recorded as their SHA-256 digest
+    only.
+
+        with pex.recording.RecordingLib("traffic.jsonl.gz").installed():
+            client = pex.PexSearchClient(CLIENT_ID, CLIENT_SECRET)
+            ...
+
+    Replay the log with :class:`ReplayLib`.
+    """
+
+    def __init__(self, path, lib=None):
+        """
+        Constructor.
+
+        :param str path: path of the log to write.
+        :param lib: library to record, the currently used one by default.
+        """
+        self._target = lib if lib is not None else _pexlib._lib._target
+        self._path = path
+        self._file = _open(path, "w")
+        self._started = time.monotonic()
+        self._requests = {}
+        self._records = 0
+        self._lock = threading.Lock()
+        self._write({"format": _FORMAT, "version": _VERSION, "started": time.time()})
+
+    def installed(self):
+        """
+        Returns a context manager that makes the SDK use this library until
+        the block exits, and closes the log afterwards.
+        """
+        return _RecordingInstalled(self)
+
+    @property
+    def records(self):
+        """
+        Number of calls recorded.
+
+        :type: int
+        """
+        return self._records
+
+    def close(self):
+        """
+        Flushes and closes the log.
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def _write(self, obj):
+        line = json.dumps(obj, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def _status(self, c_status):
+        lib = self._target
+        if lib.Pex_Status_OK(c_status):
+            return Code.OK.value, "", False
+        message = lib.Pex_Status_GetMessage(c_status) or b""
+        return lib.Pex_Status_GetCode(c_status), message.decode(), lib.Pex_Status_IsRetryable(c_status)
+
+    def _record(self, op, req, t0, c_status, res=None):
+        duration = time.monotonic() - t0
+        code, message, is_retryable = self._status(c_status)
+        rec = {"op": op, "t": round(t0 - self._started, 6), "d": round(duration, 6), "req": req, "code": code}
+        if code != Code.OK.value:
+            rec["msg"] = message
+            rec["retry"] = bool(is_retryable)
+        elif res is not None:
+            rec["res"] = res
+        self._write(rec)
+        with self._lock:
+            self._records += 1
+
+    def _request(self, c_req):
+        return self._requests.setdefault(_addr(c_req), {})
+
+    def _buffer_data(self, c_buf):
+        lib = self._target
+        data = lib.Pex_Buffer_GetData(c_buf)
+        return ctypes.string_at(data, lib.Pex_Buffer_GetSize(c_buf)) if data else b""
+
+    # Library
+
+    def __getattr__(self, name):
+        fn = getattr(self._target, name)
+        if name.endswith("Request_New"):
+            # Request objects can be allocated at the address of a deleted
+            # one, forget the parameters recorded for it.
+            def new():
+                c_req = fn()
+                self._requests.pop(_addr(c_req), None)
+                return c_req
+            return new
+        return fn
+
+    def Pex_StartSearchRequest_SetType(self, c_req, type):
+        self._request(c_req)["type"] = type
+        self._target.Pex_StartSearchRequest_SetType(c_req, type)
+
+    def Pex_StartSearchRequest_SetFingerprint(self, c_req, c_buf, c_status):
+        self._request(c_req)["ft"] = hashlib.sha256(self._buffer_data(c_buf)).hexdigest()
+        self._target.Pex_StartSearchRequest_SetFingerprint(c_req, c_buf, c_status)
+
+    def Pex_StartSearchRequest_SetISRC(self, c_req, isrc, ft_types):
+        self._request(c_req)["isrc"] = isrc.decode()
+        self._target.Pex_StartSearchRequest_SetISRC(c_req, isrc, ft_types)
+
+    def Pex_StartSearch(self, c_client, c_req, c_res, c_status):
+        t0 = time.monotonic()
+        self._target.Pex_StartSearch(c_client, c_req, c_res, c_status)
+        lookup_ids = []
+        if self._target.Pex_Status_OK(c_status):
+            c_pos = ctypes.c_size_t(0)
+            c_lookup_id = ctypes.c_char_p()
+            while self._target.Pex_StartSearchResult_NextLookupID(
+                c_res, ctypes.byref(c_pos), ctypes.byref(c_lookup_id)
+            ):
+                lookup_ids.append(c_lookup_id.value.decode())
+        self._record("start", self._requests.pop(_addr(c_req), {}), t0, c_status, lookup_ids)
+
+    def Pex_CheckSearchRequest_AddLookupID(self, c_req, lookup_id):
+        self._request(c_req).setdefault("lookup_ids", []).append(lookup_id.decode())
+        self._target.Pex_CheckSearchRequest_AddLookupID(c_req, lookup_id)
+
+    def Pex_CheckSearch(self, c_client, c_req, c_res, c_status):
+        t0 = time.monotonic()
+        self._target.Pex_CheckSearch(c_client, c_req, c_res, c_status)
+        res = self._target.Pex_CheckSearchResult_GetJSON(c_res)
+        self._record("check", self._requests.pop(_addr(c_req), {}), t0, c_status, res and res.decode())
+
+    def Pex_ListRequest_SetAfter(self, c_req, after):
+        self._request(c_req)["after"] = after.decode()
+        self._target.Pex_ListRequest_SetAfter(c_req, after)
+
+    def Pex_ListRequest_SetLimit(self, c_req, limit):
+        self._request(c_req)["limit"] = limit
+        self._target.Pex_ListRequest_SetLimit(c_req, limit)
+
+    def Pex_List(self, c_client, c_req, c_res, c_status):
+        t0 = time.monotonic()
+        self._target.Pex_List(c_client, c_req, c_res, c_status)
+        res = self._target.Pex_ListResult_GetJSON(c_res)
+        self._record("list", self._requests.pop(_addr(c_req), {}), t0, c_status, res and res.decode())
+
+    def Pex_Get(self, c_client, provided_id, c_buf, c_status):
+        t0 = time.monotonic()
+        self._target.Pex_Get(c_client, provided_id, c_buf, c_status)
+        res = self._buffer_data(c_buf).decode() if self._target.Pex_Status_OK(c_status) else None
+        self._record("get", {"provided_id": provided_id.decode()}, t0, c_status, res)
+
+    def Pex_Ingest(self, c_client, provided_id, c_ft, c_status):
+        t0 = time.monotonic()
+        self._target.Pex_Ingest(c_client, provided_id, c_ft, c_status)
+        self._record("ingest", {"provided_id": provided_id.decode()}, t0, c_status)
+
+    def Pex_Archive(self, c_client, provided_id, ft_types, c_status):
+        t0 = time.monotonic()
+        self._target.Pex_Archive(c_client, provided_id, ft_types, c_status)
+        self._record("archive", {"provided_id": provided_id.decode()}, t0, c_status)
+
+
+class _RecordingInstalled(_Installed):
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        self._lib.close()
+
+
+def _request_key(op, req):
+    if op == "start":
+        return req.get("ft") or req.get("isrc"), req.get("type")
+    if op == "check":
+        return _check_key(req.get("lookup_ids", ()))
+    if op == "list":
+        return req.get("after", ""), req.get("limit")
+    return req.get("provided_id")
+
+
+class ReplayLib(FakeLib):
+    """
+    ReplayLib serves the responses recorded by :class:`RecordingLib`
+    offline. A call is answered with the recorded response of the same
+    request (same fingerprint or ISRC, lookup IDs, list cursor or provided
+    ID) if there is one, otherwise with the next recorded response of the
+    same operation, so the recorded traffic shape is preserved even when the
+    requests differ. Every call takes its recorded duration multiplied by
+    time_scale; use 0 to replay as fast as possible.
+
+        replay = pex.recording.ReplayLib("traffic.jsonl.gz", time_scale=0.5)
+        with replay.installed():
+            client = pex.PexSearchClient("id", "secret")
+            ...
+
+    Operations that weren't recorded at all are served by :class:`FakeLib`,
+    configured with the remaining keyword arguments.
+    """
+
+    def __init__(self, path, time_scale=1.0, **kwargs):
+        """
+        Constructor.
+
+        :param str path: path of a log written by :class:`RecordingLib`.
+        :param float time_scale: multiplier of the recorded call durations.
+        """
+        super().__init__(**kwargs)
+        self._time_scale = time_scale
+        self._by_key = {}
+        self._by_op = {}
+        self._replayed = 0
+        self._load(path)
+
+    def _load(self, path):
+        with _open(path, "r") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("format") != _FORMAT:
+                raise ValueError("{} is not a recording".format(path))
+            for line in f:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                op = rec["op"]
+                self._by_key.setdefault((op, _request_key(op, rec["req"])), deque()).append(rec)
+                self._by_op.setdefault(op, []).append(rec)
+        self._next = dict.fromkeys(self._by_op, 0)
+
+    @property
+    def replayed(self):
+        """
+        Number of calls answered with a recorded response.
+
+        :type: int
+        """
+        return self._replayed
+
+    def _replay(self, op, req, c_status):
+        # Returns the record used to answer the call, or None if the
+        # operation wasn't recorded.
+        records = self._by_op.get(op)
+        if not records:
+            return None
+        with self._state_lock:
+            self._calls[op] += 1
+            self._replayed += 1
+            same = self._by_key.get((op, _request_key(op, req)))
+            if same:
+                rec = same[0]
+                # Keep the last response of a request around for repeated
+                # calls.
+                if len(same) > 1:
+                    same.popleft()
+            else:
+                rec = records[self._next[op] % len(records)]
+                self._next[op] += 1
+            if rec["code"] != Code.OK.value:
+                self._failures[op] += 1
+        if self._time_scale:
+            time.sleep(rec["d"] * self._time_scale)
+        if rec["code"] != Code.OK.value:
+            self._fail(c_status, rec["code"], rec.get("msg", ""), rec.get("retry", False))
+        else:
+            self._fail(c_status, Code.OK, "", False)
+        return rec
+
+    def Pex_StartSearchRequest_SetFingerprint(self, c_req, c_buf, c_status):
+        super().Pex_StartSearchRequest_SetFingerprint(c_req, c_buf, c_status)
+        st = self._state(c_req)
+        st["ft"] = hashlib.sha256(st["ft"]).hexdigest()
+
+    def Pex_StartSearchRequest_SetISRC(self, c_req, isrc, ft_types):
+        self._state(c_req)["isrc"] = isrc.decode()
+
+    def Pex_StartSearch(self, c_client, c_req, c_res, c_status):
+        rec = self._replay("start", self._state(c_req), c_status)
+        if rec is None:
+            return super().Pex_StartSearch(c_client, c_req, c_res, c_status)
+        self._state(c_res)["lookup_ids"] = rec.get("res") or []
+
+    def Pex_CheckSearch(self, c_client, c_req, c_res, c_status):
+        rec = self._replay("check", self._state(c_req), c_status)
+        if rec is None:
+            return super().Pex_CheckSearch(c_client, c_req, c_res, c_status)
+        if rec.get("res") is not None:
+            self._state(c_res)["json"] = rec["res"].encode()
+
+    def Pex_List(self, c_client, c_req, c_res, c_status):
+        rec = self._replay("list", self._state(c_req), c_status)
+        if rec is None:
+            return super().Pex_List(c_client, c_req, c_res, c_status)
+        if rec.get("res") is not None:
+            self._state(c_res)["json"] = rec["res"].encode()
+
+    def Pex_Get(self, c_client, provided_id, c_buf, c_status):
+        rec = self._replay("get", {"provided_id": provided_id.decode()}, c_status)
+        if rec is None:
+            return super().Pex_Get(c_client, provided_id, c_buf, c_status)
+        if rec.get("res") is not None:
+            self._state(c_buf)["data"] = rec["res"].encode()
+
+    def Pex_Ingest(self, c_client, provided_id, c_ft, c_status):
+        if self._replay("ingest", {"provided_id": provided_id.decode()}, c_status) is None:
+            super().Pex_Ingest(c_client, provided_id, c_ft, c_status)
+
+    def Pex_Archive(self, c_client, provided_id, ft_types, c_status):
+        if self._replay("archive", {"provided_id": provided_id.decode()}, c_status) is None:
+            super().Pex_Archive(c_client, provided_id, ft_types, c_status)
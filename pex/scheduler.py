@@ -0,0 +1,199 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import heapq
+import itertools
+import threading
+import time
+from enum import IntEnum
+
+from pex.deadline import _deadline_exceeded
+from pex.stats import LatencyRecorder
+
+
+class Priority(IntEnum):
+    """
+    Priority is the default set of request classes of a :class:`Scheduler`.
+    """
+
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class _Class(object):
+    def __init__(self, name, weight):
+        self.name = name
+        self.weight = float(weight)
+        self.last_finish = 0.0
+        self.queued = 0
+        self.dispatched = 0
+        self.expired = 0
+        self.wait = LatencyRecorder()
+
+
+class _Waiter(object):
+    __slots__ = ("start", "event", "granted", "cancelled")
+
+    def __init__(self, start):
+        self.start = start
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class Scheduler(object):
+    """
+    Scheduler orders the calls a client makes to the native library by
+    priority class. All the calls of a process are serialized by the SDK's
+    native lock in arrival order, so a burst of batch work delays every
+    interactive request queued behind it. With a scheduler, the
+    fingerprinting, search start and result retrieval calls of the client
+    first wait for one of the scheduler's slots, which are handed out by
+    weighted fair queuing: while several classes have calls waiting, each
+    class gets a share of the slots proportional to its weight, and a call of
+    a class with a higher weight overtakes the backlog of the other classes.
+
+        scheduler = pex.Scheduler({pex.Priority.INTERACTIVE: 8, pex.Priority.BATCH: 1})
+        client = pex.PexSearchClient(CLIENT_ID, CLIENT_SECRET, scheduler=scheduler)
+
+        with scheduler.priority(pex.Priority.BATCH):
+            future = client.start_search(req)
+
+    Calls made outside of a priority block belong to the default class. A
+    search future keeps the class of the call that started the search.
+    Calls of clients without the scheduler aren't ordered by it.
+    """
+
+    def __init__(self, weights=None, default=Priority.INTERACTIVE, slots=1):
+        """
+        Constructor.
+
+        :param dict weights: class -> weight, {INTERACTIVE: 8, BATCH: 1} by default.
+        :param default: class of the calls made outside of a priority block.
+        :param int slots: number of calls let through at the same time.
+        """
+        if weights is None:
+            weights = {Priority.INTERACTIVE: 8, Priority.BATCH: 1}
+        if default not in weights:
+            raise ValueError("unknown default class: {}".format(default))
+        self._classes = {name: _Class(name, w) for name, w in weights.items()}
+        self._default = default
+        self._free = slots
+        self._vtime = 0.0
+        self._heap = []
+        self._seq = itertools.count()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def priority(self, name):
+        """
+        Returns a context manager that puts the calls made by the current
+        thread inside the block into the given class.
+        """
+        if name not in self._classes:
+            raise ValueError("unknown class: {}".format(name))
+        return _PriorityBlock(self._local, name)
+
+    def _current(self):
+        return getattr(self._local, "name", self._default)
+
+    def _run(self, name, deadline, fn, *args):
+        self._acquire(name, deadline)
+        try:
+            return fn(*args)
+        finally:
+            self._release()
+
+    def _acquire(self, name, deadline=None):
+        cls = self._classes[name]
+        enqueued = time.monotonic()
+        with self._lock:
+            # Weighted fair queuing: the call is tagged with the virtual
+            # time at which it would finish if the class got its weighted
+            # share (its start tag plus 1 / weight), and the waiting call
+            # with the lowest finish tag goes first. The virtual time
+            # follows the start tag of the call last dispatched.
+            start = max(self._vtime, cls.last_finish)
+            cls.last_finish = start + 1.0 / cls.weight
+            if self._free > 0:
+                self._free -= 1
+                self._vtime = start
+                cls.dispatched += 1
+                cls.wait.record(0.0)
+                return
+            waiter = _Waiter(start)
+            heapq.heappush(self._heap, (cls.last_finish, next(self._seq), waiter, cls))
+            cls.queued += 1
+
+        timeout = None if deadline is None else deadline.remaining()
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.granted:
+                    waiter.cancelled = True
+                    cls.queued -= 1
+                    cls.expired += 1
+                    raise _deadline_exceeded()
+        cls.wait.record(time.monotonic() - enqueued)
+
+    def _release(self):
+        with self._lock:
+            while self._heap:
+                _, _, waiter, cls = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                cls.queued -= 1
+                cls.dispatched += 1
+                self._vtime = waiter.start
+                waiter.event.set()
+                return
+            self._free += 1
+
+    def queue_depth(self, name):
+        """
+        Number of calls of the class waiting for a slot.
+
+        :rtype: int
+        """
+        return self._classes[name].queued
+
+    def stats(self, ps=(50, 90, 99)):
+        """
+        Returns, for every class, the current queue depth, the number of
+        calls dispatched and of calls whose deadline expired while waiting,
+        and the percentiles of the time spent waiting for a slot.
+
+        :rtype: dict
+        """
+        return {
+            name: {
+                "weight": cls.weight,
+                "queue_depth": cls.queued,
+                "dispatched": cls.dispatched,
+                "expired": cls.expired,
+                "wait": cls.wait.summary(ps),
+            }
+            for name, cls in self._classes.items()
+        }
+
+    def __repr__(self):
+        return "Scheduler(queued={})".format(
+            {name: cls.queued for name, cls in self._classes.items()}
+        )
+
+
+class _PriorityBlock(object):
+    def __init__(self, local, name):
+        self._local = local
+        self._name = name
+        self._prev = None
+
+    def __enter__(self):
+        self._prev = getattr(self._local, "name", None)
+        self._local.name = self._name
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._prev is None:
+            del self._local.name
+        else:
+            self._local.name = self._prev
@@ -0,0 +1,116 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import threading
+import time
+
+from pex.deadline import _deadline_exceeded
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.started_at = time.monotonic()
+
+    def wait(self, deadline=None):
+        if deadline is None:
+            self.done.wait()
+        elif not self.done.wait(deadline.remaining()):
+            raise _deadline_exceeded()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight(object):
+    """
+    SingleFlight deduplicates identical searches that are in flight at the
+    same time. While a search with the same fingerprint (or ISRC) and search
+    type is being started or its result hasn't been retrieved yet, another
+    request for it doesn't start a new search but receives the same future.
+    Concurrent calls to get() on that future then share a single result
+    retrieval and all the callers receive the same result or error. Pass it
+    to the client constructor to enable it:
+
+        single_flight = pex.SingleFlight()
+        client = pex.PexSearchClient(CLIENT_ID, CLIENT_SECRET, single_flight=single_flight)
+
+    Searches whose result is never retrieved stop being shared after max_age
+    seconds.
+    """
+
+    def __init__(self, max_age=300):
+        self._max_age = max_age
+        self._inflight = {}
+        self._requests = 0
+        self._coalesced = 0
+        self._lock = threading.Lock()
+
+    def _do(self, key, start, deadline=None):
+        with self._lock:
+            self._requests += 1
+            call = self._inflight.get(key)
+            if call is not None and time.monotonic() - call.started_at > self._max_age:
+                call = None
+            if call is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._inflight[key] = call
+                leader = True
+
+        if not leader:
+            return call.wait(deadline)
+
+        try:
+            call.result = start()
+        except Exception as err:
+            call.error = err
+            self._forget(key, call)
+        else:
+            call.result._add_done_callback(lambda: self._forget(key, call))
+        call.done.set()
+        return call.wait()
+
+    def _forget(self, key, call):
+        with self._lock:
+            if self._inflight.get(key) is call:
+                del self._inflight[key]
+
+    @property
+    def requests(self):
+        """
+        Number of searches requested through the client.
+
+        :type: int
+        """
+        return self._requests
+
+    @property
+    def coalesced(self):
+        """
+        Number of requested searches that were served by a search already in
+        flight.
+
+        :type: int
+        """
+        return self._coalesced
+
+    @property
+    def dedup_ratio(self):
+        """
+        Fraction of requested searches that didn't have to be started.
+
+        :type: float
+        """
+        return self._coalesced / self._requests if self._requests else 0.0
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def __repr__(self):
+        return "SingleFlight(inflight={}, requests={}, coalesced={})".format(
+            len(self), self._requests, self._coalesced
+        )
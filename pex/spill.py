@@ -0,0 +1,258 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import os
+import struct
+import threading
+from collections import deque, namedtuple
+
+from pex.fingerprint import Fingerprint
+
+
+SpillItem = namedtuple("SpillItem", ["key", "fingerprint", "offset"])
+SpillItem.__doc__ = """
+An item returned by :meth:`SpillQueue.get`: the key and fingerprint it was
+put with, and its position in the log, used to acknowledge it.
+"""
+
+# Record header: length of the key and of the fingerprint, and the
+# fingerprint types (-1 if unknown).
+_HEADER = struct.Struct(">IIi")
+
+
+class SpillQueue(object):
+    """
+    SpillQueue is a FIFO queue of fingerprints between the fingerprinting
+    stage of a pipeline and its network stage (ingesting or searching). It
+    never blocks the producer: every fingerprint is appended to a log file,
+    and the head of the queue is also kept in memory up to max_memory bytes.
+    When the network stage falls behind, the fingerprints over the cap are
+    only kept in the log and read back from it in order, so the memory stays
+    capped while fingerprinting continues at full speed.
+
+        queue = pex.SpillQueue("/var/lib/app/fingerprints.spill")
+
+        # fingerprinting threads
+        queue.put(asset_id, client.fingerprint_file(path))
+
+        # network threads
+        while True:
+            item = queue.get()
+            client.ingest(item.key, item.fingerprint)
+            queue.ack(item)
+
+    The queue survives process restarts: items are acknowledged once
+    processed, and a queue reopened on the same path delivers the items
+    that weren't acknowledged, including the ones delivered but not
+    acknowledged before the restart. The log is truncated whenever all of
+    its items are acknowledged.
+    """
+
+    def __init__(self, path, max_memory=64 << 20, sync=False):
+        """
+        Constructor.
+
+        :param str path: path of the log file, created if it doesn't exist.
+        :param int max_memory: maximum size in bytes of the fingerprints kept in memory.
+        :param bool sync: fsync the log after every put and the acknowledged
+                          offset after every ack.
+        """
+        self._path = path
+        self._ack_path = path + ".ack"
+        self._max_memory = max_memory
+        self._sync = sync
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._memory = deque()
+        self._memory_bytes = 0
+        self._spilled = 0
+        self._puts = 0
+
+        self._acked = _read_offset(self._ack_path)
+        self._pending_acks = set()
+        self._writer = open(path, "ab")
+        self._end = self._recover()
+        self._read_offset = self._acked
+        self._count = self._scan_count()
+        self._reader = open(path, "rb")
+
+    def _recover(self):
+        # Truncates a record torn by a crash at the end of the log.
+        size = os.path.getsize(self._path)
+        if self._acked > size:
+            self._acked = 0
+        end = self._acked
+        with open(self._path, "rb") as f:
+            f.seek(end)
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                n = _record_size(header)
+                if end + n > size:
+                    break
+                f.seek(n - _HEADER.size, os.SEEK_CUR)
+                end += n
+        if end != size:
+            self._writer.truncate(end)
+        return end
+
+    def _scan_count(self):
+        count = 0
+        with open(self._path, "rb") as f:
+            pos = self._acked
+            while pos < self._end:
+                f.seek(pos)
+                pos += _record_size(f.read(_HEADER.size))
+                count += 1
+        self._spilled = count
+        return count
+
+    def put(self, key, ft):
+        """
+        Appends a fingerprint to the queue. Never blocks on the consumers.
+
+        :param str key: identifies the fingerprint, e.g. a provided ID or a path.
+        :param Fingerprint ft: fingerprint.
+        """
+        key_bytes = key.encode()
+        ft_types = -1 if ft.ft_types is None else int(ft.ft_types)
+        data = _HEADER.pack(len(key_bytes), len(ft._ft), ft_types) + key_bytes + ft._ft
+        with self._cond:
+            if self._closed:
+                raise ValueError("put on a closed queue")
+            offset = self._end
+            self._writer.write(data)
+            self._writer.flush()
+            if self._sync:
+                os.fsync(self._writer.fileno())
+            self._end += len(data)
+            self._count += 1
+            self._puts += 1
+            # Items are kept in memory only while no earlier item was
+            # spilled, so that the memory holds the head of the queue.
+            if self._spilled == 0 and self._memory_bytes + len(ft._ft) <= self._max_memory:
+                self._memory.append(SpillItem(key, ft, offset))
+                self._memory_bytes += len(ft._ft)
+            else:
+                self._spilled += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Removes and returns the oldest item, waiting for one if the queue is
+        empty. Returns None if the queue is empty and closed, or once the
+        timeout expires.
+
+        :param float timeout: maximum number of seconds to wait.
+        :rtype: SpillItem
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._count or self._closed, timeout):
+                return None
+            if not self._count:
+                return None
+            self._count -= 1
+            if not self._memory:
+                self._spilled -= 1
+                return self._read()
+            # The items in memory precede the spilled ones.
+            item = self._memory.popleft()
+            self._memory_bytes -= len(item.fingerprint._ft)
+            self._read_offset = item.offset + _HEADER.size + len(item.key.encode()) + len(item.fingerprint._ft)
+            return item
+
+    def _read(self):
+        offset = self._read_offset
+        self._reader.seek(offset)
+        key_len, ft_len, ft_types = _HEADER.unpack(self._reader.read(_HEADER.size))
+        key = self._reader.read(key_len).decode()
+        ft = Fingerprint(self._reader.read(ft_len), None if ft_types < 0 else ft_types)
+        self._read_offset = offset + _HEADER.size + key_len + ft_len
+        return SpillItem(key, ft, offset)
+
+    def ack(self, item):
+        """
+        Acknowledges that an item was processed, so that it isn't delivered
+        again after a restart. Items may be acknowledged in any order; the
+        acknowledged offset advances over the oldest contiguous ones.
+
+        :param SpillItem item: item returned by :meth:`get`.
+        """
+        with self._cond:
+            self._pending_acks.add(item.offset)
+            acked = self._acked
+            while acked in self._pending_acks:
+                self._pending_acks.remove(acked)
+                self._reader.seek(acked)
+                acked += _record_size(self._reader.read(_HEADER.size))
+            if acked == self._acked:
+                return
+            if acked == self._end and not self._pending_acks:
+                # Everything is processed, start over with an empty log.
+                self._writer.truncate(0)
+                self._end = self._read_offset = acked = 0
+                self._spilled = 0
+            self._acked = acked
+            _write_offset(self._ack_path, acked, self._sync)
+
+    def close(self):
+        """
+        Marks the end of the input: once the queue is drained :meth:`get`
+        returns None instead of waiting.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return self._count
+
+    def stats(self):
+        """
+        Returns the number of items queued, held in memory and spilled to
+        the log, the bytes held in memory, the size of the log and the
+        number of items put since the queue was opened.
+
+        :rtype: dict
+        """
+        with self._cond:
+            return {
+                "queued": self._count,
+                "in_memory": len(self._memory),
+                "spilled": self._spilled,
+                "memory_bytes": self._memory_bytes,
+                "log_bytes": self._end,
+                "puts": self._puts,
+            }
+
+    def __del__(self):
+        for f in (getattr(self, "_writer", None), getattr(self, "_reader", None)):
+            if f is not None:
+                f.close()
+
+    def __repr__(self):
+        return "SpillQueue(path={}, queued={})".format(self._path, self._count)
+
+
+def _record_size(header):
+    key_len, ft_len, _ = _HEADER.unpack(header)
+    return _HEADER.size + key_len + ft_len
+
+
+def _read_offset(path):
+    try:
+        with open(path) as f:
+            return int(f.read() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_offset(path, offset, sync):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(str(offset))
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,84 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import math
+import random
+import threading
+
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile (0-100) of the given values using the
+    nearest-rank method, or None if there are no values.
+
+    :param list values: samples, don't need to be sorted.
+    :param float p: percentile to compute.
+    :rtype: float
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(math.ceil(p / 100.0 * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+class LatencyRecorder(object):
+    """
+    Thread-safe collector of latency samples. Once more than max_samples
+    values are recorded it keeps a uniform random sample (reservoir) of them,
+    so memory stays bounded during long runs.
+    """
+
+    def __init__(self, max_samples=100000):
+        self._max_samples = max_samples
+        self._samples = []
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._count += 1
+            self._total += seconds
+            self._max = max(self._max, seconds)
+            if len(self._samples) < self._max_samples:
+                self._samples.append(seconds)
+            else:
+                i = random.randrange(self._count)
+                if i < self._max_samples:
+                    self._samples[i] = seconds
+
+    @property
+    def count(self):
+        """
+        Number of samples recorded so far.
+
+        :type: int
+        """
+        return self._count
+
+    def percentile(self, p):
+        with self._lock:
+            samples = list(self._samples)
+        return percentile(samples, p)
+
+    def summary(self, ps=(50, 90, 99)):
+        """
+        Returns a dict with the sample count, mean, max and the requested
+        percentiles (keys like "p50").
+
+        :rtype: dict
+        """
+        with self._lock:
+            samples = list(self._samples)
+            count = self._count
+            total = self._total
+            maximum = self._max
+        res = {
+            "count": count,
+            "mean": total / count if count else None,
+            "max": maximum if count else None,
+        }
+        for p in ps:
+            res["p{}".format(p)] = percentile(samples, p)
+        return res
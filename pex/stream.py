@@ -0,0 +1,306 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from pex.export import MATCH_TYPES, NO_MATCH, _iter_segments
+from pex.fingerprint import FingerprintType
+from pex.pex_search import PexSearchClient, PexSearchRequest, PexSearchType
+from pex.private_search import PrivateSearchRequest
+from pex.stats import LatencyRecorder
+
+
+StreamMatch = namedtuple(
+    "StreamMatch",
+    ["asset_id", "match_type", "stream_start", "stream_end", "asset_start", "asset_end"],
+)
+StreamMatch.__doc__ = """
+A matched segment of a stream. The stream offsets are in seconds since the
+start of the stream, the asset offsets are the ones reported by the search.
+"""
+
+StreamWindow = namedtuple(
+    "StreamWindow",
+    ["index", "start", "end", "result", "error", "matches", "latency"],
+)
+StreamWindow.__doc__ = """
+A window of the stream yielded by :meth:`StreamMonitor.run` once it was
+searched. Start and end are the stream offsets of the window in seconds,
+exactly one of result and error is set, matches is a list of
+:class:`StreamMatch` and latency is the number of seconds from the moment the
+last byte of the window was read until its result was retrieved.
+"""
+
+_STOP = object()
+
+
+class StreamMonitor(object):
+    """
+    StreamMonitor searches a continuous media stream, e.g. a live broadcast.
+    The stream is cut into overlapping windows of a fixed duration, every
+    window is fingerprinted with fingerprint_buffer on a pool of workers and
+    searched, and the matches are reported with their offsets in the stream:
+
+        monitor = pex.StreamMonitor(client, bytes_per_second=16000, window=10, overlap=5)
+        for window in monitor.run(stream):
+            for match in window.matches:
+                print(match.asset_id, match.stream_start, match.stream_end)
+
+    The windows are cut at byte offsets computed from bytes_per_second, so
+    the stream must have a constant bitrate and be in a format that can be
+    cut at arbitrary positions, e.g. ADTS AAC or MPEG-TS. The number of
+    searches in flight is bounded by max_in_flight. If the monitor falls
+    behind the stream, reading blocks, unless drop_when_behind is set, in
+    which case windows are skipped and counted as dropped.
+    """
+
+    def __init__(
+        self,
+        client,
+        bytes_per_second,
+        window=10.0,
+        overlap=5.0,
+        fingerprint_workers=2,
+        max_in_flight=8,
+        max_pending=4,
+        drop_when_behind=False,
+        read_size=65536,
+        ft_types=FingerprintType.ALL,
+        type=PexSearchType.IDENTIFY_MUSIC,
+    ):
+        """
+        Constructor.
+
+        :param client: either a PexSearchClient or a PrivateSearchClient.
+        :param int bytes_per_second: bitrate of the stream in bytes per second.
+        :param float window: duration of a window in seconds, must be longer than 1 second.
+        :param float overlap: number of seconds consecutive windows share.
+        :param int fingerprint_workers: size of the fingerprinting pool.
+        :param int max_in_flight: maximum number of searches started but not retrieved yet.
+        :param int max_pending: number of windows waiting to be fingerprinted before reading blocks or drops.
+        :param bool drop_when_behind: skip windows instead of blocking when the monitor falls behind.
+        :param int read_size: number of bytes read from the stream at once.
+        :param int ft_types: fingerprint types to generate and search with.
+        :param PexSearchType type: type of the pex search, ignored for private search.
+        """
+        if window <= 1:
+            raise ValueError("window must be longer than 1 second")
+        if not 0 <= overlap < window:
+            raise ValueError("overlap must be between 0 and the window duration")
+        self._client = client
+        self._is_pex = isinstance(client, PexSearchClient)
+        self._bytes_per_second = bytes_per_second
+        self._window_bytes = int(window * bytes_per_second)
+        self._step_bytes = int((window - overlap) * bytes_per_second)
+        self._fingerprint_workers = fingerprint_workers
+        self._max_in_flight = max_in_flight
+        self._drop_when_behind = drop_when_behind
+        self._read_size = read_size
+        self._ft_types = ft_types
+        self._type = type
+
+        self._windows = queue.Queue(max_pending)
+        self._searches = queue.Queue()
+        self._output = queue.Queue()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+        self._fingerprinting = fingerprint_workers
+        self._collecting = max_in_flight
+
+        self._read = 0
+        self._cut = 0
+        self._dropped = 0
+        self._failed = 0
+        self._inflight_now = 0
+        self._latency = LatencyRecorder()
+        self._fingerprint_latency = LatencyRecorder()
+        self._search_latency = LatencyRecorder()
+
+    def run(self, stream):
+        """
+        Reads the stream until it ends on a background thread and yields a
+        :class:`StreamWindow` for every searched window as soon as its result
+        is available, i.e. not necessarily in stream order. A monitor can
+        only be run once.
+
+        :param stream: file-like object with a read() method or an iterable of byte chunks.
+        :rtype: Iterator[StreamWindow]
+        """
+        threads = [threading.Thread(target=self._feed, args=(stream,), daemon=True)]
+        for _ in range(self._fingerprint_workers):
+            threads.append(threading.Thread(target=self._fingerprint, daemon=True))
+        for _ in range(self._max_in_flight):
+            threads.append(threading.Thread(target=self._collect, daemon=True))
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                res = self._output.get()
+                if res is _STOP:
+                    return
+                if isinstance(res, BaseException):
+                    raise res
+                yield res
+        finally:
+            self._closed.set()
+
+    def stats(self, ps=(50, 90, 99)):
+        """
+        Returns the number of bytes read, windows cut, dropped and failed,
+        the number of searches in flight and the latency percentiles of the
+        windows end to end ("latency"), of fingerprinting and of the searches.
+
+        :rtype: dict
+        """
+        return {
+            "bytes": self._read,
+            "windows": self._cut,
+            "dropped": self._dropped,
+            "failed": self._failed,
+            "in_flight": self._inflight_now,
+            "latency": self._latency.summary(ps),
+            "fingerprint_latency": self._fingerprint_latency.summary(ps),
+            "search_latency": self._search_latency.summary(ps),
+        }
+
+    def _chunks(self, stream):
+        if hasattr(stream, "read"):
+            while True:
+                chunk = stream.read(self._read_size)
+                if not chunk:
+                    return
+                yield chunk
+        else:
+            yield from stream
+
+    def _feed(self, stream):
+        buf = bytearray()
+        offset = 0  # stream offset of buf[0]
+        fresh = False  # whether buf holds bytes not searched yet
+        try:
+            for chunk in self._chunks(stream):
+                if self._closed.is_set():
+                    return
+                buf += chunk
+                self._read += len(chunk)
+                fresh = True
+                while len(buf) >= self._window_bytes:
+                    self._emit(offset, bytes(buf[:self._window_bytes]))
+                    del buf[:self._step_bytes]
+                    offset += self._step_bytes
+                    fresh = len(buf) > self._window_bytes - self._step_bytes
+            # The tail of the stream is searched if it holds new data and is
+            # long enough to be fingerprinted.
+            if fresh and len(buf) > self._bytes_per_second:
+                self._emit(offset, bytes(buf))
+        except Exception as err:
+            self._output.put(err)
+        finally:
+            for _ in range(self._fingerprint_workers):
+                self._put(self._windows, _STOP)
+
+    def _emit(self, offset, data):
+        window = [self._cut, offset / self._bytes_per_second,
+                  (offset + len(data)) / self._bytes_per_second, data, time.monotonic()]
+        self._cut += 1
+        if self._drop_when_behind:
+            try:
+                self._windows.put_nowait(window)
+            except queue.Full:
+                self._dropped += 1
+        else:
+            self._put(self._windows, window)
+
+    def _fingerprint(self):
+        while not self._closed.is_set():
+            window = self._windows.get()
+            if window is _STOP:
+                break
+            index, start, end, data, read_at = window
+            try:
+                t0 = time.monotonic()
+                ft = self._client.fingerprint_buffer(data, self._ft_types)
+                self._fingerprint_latency.record(time.monotonic() - t0)
+                if self._is_pex:
+                    req = PexSearchRequest(ft, self._type)
+                else:
+                    req = PrivateSearchRequest(ft)
+                self._acquire()
+                t0 = time.monotonic()
+                try:
+                    future = self._client.start_search(req)
+                except BaseException:
+                    self._release()
+                    raise
+            except Exception as err:
+                self._finish(window, None, err)
+                continue
+            self._searches.put((window, future, t0))
+
+        with self._lock:
+            self._fingerprinting -= 1
+            last = self._fingerprinting == 0
+        if last:
+            for _ in range(self._max_in_flight):
+                self._searches.put(_STOP)
+
+    def _collect(self):
+        while True:
+            job = self._searches.get()
+            if job is _STOP:
+                break
+            window, future, t0 = job
+            try:
+                result = future.get()
+            except Exception as err:
+                self._finish(window, None, err)
+            else:
+                self._search_latency.record(time.monotonic() - t0)
+                self._finish(window, result, None)
+            finally:
+                self._release()
+
+        with self._lock:
+            self._collecting -= 1
+            last = self._collecting == 0
+        if last:
+            self._output.put(_STOP)
+
+    def _acquire(self):
+        self._in_flight.acquire()
+        with self._lock:
+            self._inflight_now += 1
+
+    def _release(self):
+        with self._lock:
+            self._inflight_now -= 1
+        self._in_flight.release()
+
+    def _finish(self, window, result, error):
+        index, start, end, _, read_at = window
+        latency = time.monotonic() - read_at
+        self._latency.record(latency)
+        matches = []
+        if error is not None:
+            with self._lock:
+                self._failed += 1
+        else:
+            for _, asset_id, code, q_start, q_end, a_start, a_end in _iter_segments(result):
+                if code == NO_MATCH:
+                    continue
+                matches.append(StreamMatch(
+                    asset_id, MATCH_TYPES[code], start + q_start, start + q_end, a_start, a_end,
+                ))
+        self._output.put(StreamWindow(index, start, end, result, error, matches, latency))
+
+    def _put(self, q, item):
+        while not self._closed.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
@@ -0,0 +1,545 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+
+from pex.errors import Error
+from pex.fingerprint import FingerprintType
+
+
+WorkItem = namedtuple("WorkItem", ["provided_id", "path", "attempts"])
+WorkItem.__doc__ = """
+A unit of work handed out by :class:`WorkQueue`: fingerprint the media file at
+path and ingest it under provided_id. Attempts is the number of times the item
+failed or its lease expired before.
+"""
+
+# Item states of the backends.
+_PENDING = "pending"
+_LEASED = "leased"
+_DONE = "done"
+_FAILED = "failed"
+
+
+class SQLiteWorkQueueBackend(object):
+    """
+    Stores the work items in an SQLite database. Suitable for workers on one
+    host, or on several hosts if the database lives on a filesystem with
+    reliable locking.
+
+    Backends implement add, lease, extend, complete, fail, counts and
+    completions, see the methods of this class.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " provided_id TEXT PRIMARY KEY,"
+            " path TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " worker TEXT,"
+            " lease_until REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " completed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS items_state ON items (state, lease_until)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS items_completed_at ON items (completed_at)")
+
+    def _transaction(self, fn, *args):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                res = fn(*args)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return res
+
+    def add(self, items):
+        """
+        Adds (provided_id, path) pairs, ignoring provided IDs already known.
+        Returns the number of items added.
+        """
+        def add():
+            cur = self._db.executemany(
+                "INSERT OR IGNORE INTO items (provided_id, path, state) VALUES (?, ?, ?)",
+                ((pid, path, _PENDING) for pid, path in items),
+            )
+            return cur.rowcount
+        return self._transaction(add)
+
+    def lease(self, worker, n, lease_until, max_attempts):
+        """
+        Leases up to n pending items, or leased items whose lease expired, to
+        the worker. Returns a list of :class:`WorkItem`.
+        """
+        def lease():
+            now = time.time()
+            # Expired leases count as failed attempts.
+            self._db.execute(
+                "UPDATE items SET state = ?, attempts = attempts + 1, worker = NULL"
+                " WHERE state = ? AND lease_until < ?",
+                (_PENDING, _LEASED, now),
+            )
+            self._db.execute(
+                "UPDATE items SET state = ?, error = 'lease expired' WHERE state = ? AND attempts >= ?",
+                (_FAILED, _PENDING, max_attempts),
+            )
+            rows = self._db.execute(
+                "SELECT provided_id, path, attempts FROM items WHERE state = ? LIMIT ?",
+                (_PENDING, n),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE items SET state = ?, worker = ?, lease_until = ? WHERE provided_id = ?",
+                ((_LEASED, worker, lease_until, row[0]) for row in rows),
+            )
+            return [WorkItem(*row) for row in rows]
+        return self._transaction(lease)
+
+    def extend(self, worker, provided_ids, lease_until):
+        """
+        Extends the leases the worker still holds. Returns the provided IDs
+        whose lease was extended.
+        """
+        return self._update_leased(
+            worker, provided_ids, "lease_until = ?", (lease_until,)
+        )
+
+    def complete(self, worker, provided_ids):
+        """
+        Marks the items done if the worker still holds their lease. An item
+        is completed only once; returns the provided IDs completed by this
+        call.
+        """
+        return self._update_leased(
+            worker, provided_ids, "state = ?, completed_at = ?, lease_until = NULL",
+            (_DONE, time.time()),
+        )
+
+    def fail(self, worker, provided_ids, error, retry, max_attempts):
+        """
+        Releases the leases of failed items. They're retried until they failed
+        max_attempts times, unless retry is False. Returns the provided IDs
+        released by this call with the state they were moved to.
+        """
+        def fail():
+            released = []
+            for pid in provided_ids:
+                cur = self._db.execute(
+                    "UPDATE items SET"
+                    " state = CASE WHEN ? AND attempts + 1 < ? THEN ? ELSE ? END,"
+                    " attempts = attempts + 1, error = ?, worker = NULL, lease_until = NULL"
+                    " WHERE provided_id = ? AND state = ? AND worker = ?",
+                    (int(retry), max_attempts, _PENDING, _FAILED, error, pid, _LEASED, worker),
+                )
+                if cur.rowcount:
+                    state = self._db.execute(
+                        "SELECT state FROM items WHERE provided_id = ?", (pid,),
+                    ).fetchone()[0]
+                    released.append((pid, state))
+            return released
+        return self._transaction(fail)
+
+    def _update_leased(self, worker, provided_ids, assignments, params):
+        def update():
+            updated = []
+            now = time.time()
+            for pid in provided_ids:
+                cur = self._db.execute(
+                    "UPDATE items SET " + assignments +
+                    " WHERE provided_id = ? AND state = ? AND worker = ? AND lease_until >= ?",
+                    params + (pid, _LEASED, worker, now),
+                )
+                if cur.rowcount:
+                    updated.append(pid)
+            return updated
+        return self._transaction(update)
+
+    def counts(self):
+        """
+        Returns the number of items per state.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall()
+        counts = dict.fromkeys((_PENDING, _LEASED, _DONE, _FAILED), 0)
+        counts.update(rows)
+        return counts
+
+    def completions(self, since):
+        """
+        Returns the number of items completed since the given time, per
+        worker.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT worker, COUNT(*) FROM items WHERE state = ? AND completed_at >= ? GROUP BY worker",
+                (_DONE, since),
+            ).fetchall()
+        return dict(rows)
+
+
+class FileSystemWorkQueueBackend(object):
+    """
+    Stores every work item as a small file in a directory per state, on a
+    filesystem shared by the workers (e.g. NFS). State transitions are
+    atomic renames, so only one worker can lease, reclaim or complete an
+    item. The lease holder and expiry are encoded in the name of the leased
+    file.
+    """
+
+    def __init__(self, directory):
+        self._dir = directory
+        for state in (_PENDING, _LEASED, _DONE, _FAILED, "tmp"):
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+    def _path(self, state, name):
+        return os.path.join(self._dir, state, name)
+
+    @staticmethod
+    def _leased_name(pid, worker, lease_until):
+        return "{},{},{}".format(quote(pid, safe=""), quote(worker, safe=""), int(lease_until * 1000))
+
+    @staticmethod
+    def _parse_leased(name):
+        pid, worker, lease_until = name.rsplit(",", 2)
+        return unquote(pid), unquote(worker), int(lease_until) / 1000.0
+
+    def _read(self, path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, path, data):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def _rename(self, src, dst):
+        try:
+            os.rename(src, dst)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def add(self, items):
+        known = set(os.listdir(os.path.join(self._dir, _LEASED)))
+        known = {name.rsplit(",", 2)[0] for name in known}
+        for state in (_PENDING, _DONE, _FAILED):
+            known.update(os.listdir(os.path.join(self._dir, state)))
+        added = 0
+        for pid, path in items:
+            if quote(pid, safe="") in known:
+                continue
+            known.add(quote(pid, safe=""))
+            tmp = self._path("tmp", uuid.uuid4().hex)
+            self._write(tmp, {"provided_id": pid, "path": path, "attempts": 0})
+            os.rename(tmp, self._path(_PENDING, quote(pid, safe="")))
+            added += 1
+        return added
+
+    def _reclaim(self, max_attempts):
+        # Moves the items with an expired lease back to pending, through a
+        # private temporary name so that only one worker reclaims an item
+        # and nobody can lease it while its attempts are being updated.
+        now = time.time()
+        for name in os.listdir(os.path.join(self._dir, _LEASED)):
+            try:
+                pid, _, lease_until = self._parse_leased(name)
+            except ValueError:
+                continue
+            if lease_until >= now:
+                continue
+            tmp = self._path("tmp", uuid.uuid4().hex)
+            if not self._rename(self._path(_LEASED, name), tmp):
+                continue
+            data = self._read(tmp)
+            data["attempts"] += 1
+            state = _PENDING if data["attempts"] < max_attempts else _FAILED
+            if state == _FAILED:
+                data["error"] = "lease expired"
+            self._write(tmp, data)
+            os.rename(tmp, self._path(state, quote(pid, safe="")))
+
+    def lease(self, worker, n, lease_until, max_attempts):
+        self._reclaim(max_attempts)
+        # Workers try the pending items in random order so that they don't
+        # all race for the same ones.
+        names = os.listdir(os.path.join(self._dir, _PENDING))
+        random.shuffle(names)
+        items = []
+        for name in names:
+            if len(items) >= n:
+                break
+            pid = unquote(name)
+            dst = self._path(_LEASED, self._leased_name(pid, worker, lease_until))
+            if not self._rename(self._path(_PENDING, name), dst):
+                continue  # leased by another worker
+            data = self._read(dst)
+            items.append(WorkItem(pid, data["path"], data["attempts"]))
+        return items
+
+    def _find_leased(self, worker, pid):
+        # Returns the name of the leased file of the item if the worker holds
+        # an unexpired lease on it.
+        prefix = "{},{},".format(quote(pid, safe=""), quote(worker, safe=""))
+        now = time.time()
+        for name in os.listdir(os.path.join(self._dir, _LEASED)):
+            if name.startswith(prefix) and self._parse_leased(name)[2] >= now:
+                return name
+        return None
+
+    def extend(self, worker, provided_ids, lease_until):
+        extended = []
+        for pid in provided_ids:
+            name = self._find_leased(worker, pid)
+            dst = self._path(_LEASED, self._leased_name(pid, worker, lease_until))
+            if name is not None and self._rename(self._path(_LEASED, name), dst):
+                extended.append(pid)
+        return extended
+
+    def complete(self, worker, provided_ids):
+        completed = []
+        for pid in provided_ids:
+            name = self._find_leased(worker, pid)
+            dst = self._path(_DONE, quote(pid, safe=""))
+            if name is None or not self._rename(self._path(_LEASED, name), dst):
+                continue
+            data = self._read(dst)
+            data.update(worker=worker, completed_at=time.time())
+            self._write(dst, data)
+            completed.append(pid)
+        return completed
+
+    def fail(self, worker, provided_ids, error, retry, max_attempts):
+        released = []
+        for pid in provided_ids:
+            name = self._find_leased(worker, pid)
+            tmp = self._path("tmp", uuid.uuid4().hex)
+            if name is None or not self._rename(self._path(_LEASED, name), tmp):
+                continue
+            data = self._read(tmp)
+            data["attempts"] += 1
+            data["error"] = error
+            state = _PENDING if retry and data["attempts"] < max_attempts else _FAILED
+            self._write(tmp, data)
+            os.rename(tmp, self._path(state, quote(pid, safe="")))
+            released.append((pid, state))
+        return released
+
+    def counts(self):
+        return {
+            state: len(os.listdir(os.path.join(self._dir, state)))
+            for state in (_PENDING, _LEASED, _DONE, _FAILED)
+        }
+
+    def completions(self, since):
+        res = {}
+        done = os.path.join(self._dir, _DONE)
+        for name in os.listdir(done):
+            path = os.path.join(done, name)
+            try:
+                if os.stat(path).st_mtime < since:
+                    continue
+                data = self._read(path)
+            except (OSError, ValueError):
+                continue
+            if data.get("completed_at", 0) >= since:
+                res[data.get("worker")] = res.get(data.get("worker"), 0) + 1
+        return res
+
+
+WorkerReport = namedtuple("WorkerReport", ["completed", "failed", "retried", "lost", "seconds"])
+WorkerReport.__doc__ = """
+Summary of a :meth:`WorkQueue.process` run: the number of items completed
+by this worker, the number of items it moved to the failed state (their
+last attempt failed or the error wasn't retryable), the number of failed
+attempts returned to the queue to be retried, the number of items whose
+lease was lost before they were completed (another worker will redo them)
+and the duration of the run.
+"""
+
+
+class WorkQueue(object):
+    """
+    WorkQueue distributes fingerprinting and ingestion of media files over
+    several workers, on one or many hosts. Items are (provided_id, path)
+    pairs; every worker leases batches of items, fingerprints and ingests
+    them and marks them done. A lease that isn't completed or extended in
+    time expires and the items are handed out again, so the work of crashed
+    workers isn't lost. An item is completed exactly once: a worker that lost
+    its lease can't complete the item anymore. Since ingesting is keyed by
+    the provided ID, an item redone after an expired lease overwrites the
+    same asset.
+
+        queue = pex.WorkQueue(pex.SQLiteWorkQueueBackend("/shared/work.db"))
+        queue.add((asset_id, path) for asset_id, path in catalog)
+
+        # on every node
+        queue.process(pex.PrivateSearchClient(CLIENT_ID, CLIENT_SECRET))
+
+    Items are retried until they failed max_attempts times, or failed with a
+    non-retryable error.
+    """
+
+    def __init__(self, backend, lease_seconds=300, max_attempts=3):
+        """
+        Constructor.
+
+        :param backend: :class:`SQLiteWorkQueueBackend`, :class:`FileSystemWorkQueueBackend`
+                        or any object implementing the same methods.
+        :param float lease_seconds: duration of a lease.
+        :param int max_attempts: number of times an item is tried.
+        """
+        self._backend = backend
+        self._lease_seconds = lease_seconds
+        self._max_attempts = max_attempts
+
+    def add(self, items):
+        """
+        Adds (provided_id, path) pairs to the queue. Items with a provided ID
+        already in the queue, in any state, are ignored.
+
+        :rtype: int
+        :return: number of items added.
+        """
+        return self._backend.add(list(items))
+
+    def lease(self, worker, n):
+        """
+        Leases up to n items to the worker.
+
+        :rtype: List[WorkItem]
+        """
+        return self._backend.lease(worker, n, time.time() + self._lease_seconds, self._max_attempts)
+
+    def extend(self, worker, provided_ids):
+        """
+        Renews the leases of the worker on the items.
+
+        :rtype: List[str]
+        :return: provided IDs of the leases renewed, the other ones were lost.
+        """
+        return self._backend.extend(worker, provided_ids, time.time() + self._lease_seconds)
+
+    def complete(self, worker, provided_ids):
+        """
+        Marks items done.
+
+        :rtype: List[str]
+        :return: provided IDs completed, the other ones were lost or already done.
+        """
+        return self._backend.complete(worker, provided_ids)
+
+    def fail(self, worker, provided_ids, error, retry=True):
+        """
+        Returns failed items to the queue, or marks them failed once they've
+        been tried max_attempts times or if retry is False.
+
+        :rtype: List[str]
+        """
+        return [pid for pid, _ in self._backend.fail(worker, provided_ids, error, retry, self._max_attempts)]
+
+    def stats(self, window=60):
+        """
+        Returns the number of items per state and the throughput (items
+        completed per second) of all the workers together and of each
+        worker over the last window seconds.
+
+        :rtype: dict
+        """
+        completions = self._backend.completions(time.time() - window)
+        return {
+            "counts": self._backend.counts(),
+            "throughput": sum(completions.values()) / window,
+            "workers": {worker: n / window for worker, n in completions.items()},
+        }
+
+    def process(
+        self, client, worker=None, batch_size=16, max_workers=4,
+        ft_types=FingerprintType.ALL, stop_when_empty=True, poll_interval=5,
+    ):
+        """
+        Leases batches of items and fingerprints and ingests them with the
+        client until the queue is empty. The leases are renewed while a batch
+        is being processed.
+
+        :param PrivateSearchClient client: client to fingerprint and ingest with.
+        :param str worker: unique name of the worker, defaults to the host name and process ID.
+        :param int batch_size: number of items leased at once.
+        :param int max_workers: number of items processed concurrently.
+        :param int ft_types: fingerprint types to generate and ingest.
+        :param bool stop_when_empty: return once there's nothing to lease, or keep polling.
+        :param float poll_interval: seconds between polls of an empty queue.
+        :rtype: WorkerReport
+        """
+        if worker is None:
+            worker = "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        started = time.monotonic()
+        completed = failed = retried = lost = 0
+
+        def run(item):
+            try:
+                ft = client.fingerprint_file(item.path, ft_types)
+                client.ingest(item.provided_id, ft)
+            except Exception as err:
+                return item, err
+            return item, None
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            while True:
+                items = self.lease(worker, batch_size)
+                if not items:
+                    if stop_when_empty:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                held = [item.provided_id for item in items]
+                stop = threading.Event()
+                renewer = threading.Thread(target=self._renew, args=(worker, held, stop), daemon=True)
+                renewer.start()
+                try:
+                    results = list(executor.map(run, items))
+                finally:
+                    stop.set()
+                    renewer.join()
+
+                ok = [item.provided_id for item, err in results if err is None]
+                done = self.complete(worker, ok)
+                completed += len(done)
+                lost += len(ok) - len(done)
+                for item, err in results:
+                    if err is None:
+                        continue
+                    retry = not isinstance(err, Error) or err.is_retryable
+                    released = self._backend.fail(
+                        worker, [item.provided_id], str(err), retry, self._max_attempts,
+                    )
+                    if not released:
+                        lost += 1
+                    elif released[0][1] == _FAILED:
+                        failed += 1
+                    else:
+                        retried += 1
+
+        return WorkerReport(completed, failed, retried, lost, time.monotonic() - started)
+
+    def _renew(self, worker, held, stop):
+        interval = self._lease_seconds / 3.0
+        while not stop.wait(interval):
+            self.extend(worker, held)
+
+    def __repr__(self):
+        return "WorkQueue(counts={})".format(self._backend.counts())
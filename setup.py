@@ -10,4 +10,7 @@ setup(
     author_email="info@pex.com",
     url="https://github.com/Pexeso/pex-sdk-py",
     packages=find_packages(),
+    extras_require={
+        "numpy": ["numpy"],
+    },
 )
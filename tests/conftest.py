@@ -0,0 +1,7 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import os
+
+# The tests drive the clients against pex.fakelib, they don't need the
+# native library.
+os.environ.setdefault("PEX_SDK_NO_CORE_LIB", "1")
@@ -0,0 +1,83 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import pytest
+
+import pex
+from pex.fakelib import FakeLib
+from pex.lib import _accounting, _lib, _Pex_Buffer
+
+
+@pytest.fixture(autouse=True)
+def accounting():
+    prev = (_accounting.enabled, _accounting.debug)
+    yield
+    pex.track_native_objects(*prev)
+
+
+def _buffer():
+    buf = _Pex_Buffer.new(_lib)
+    buf.init()
+    return buf
+
+
+def test_native_objects():
+    with FakeLib().installed() as fake:
+        pex.track_native_objects()
+        pex.reset_native_objects()
+        before = pex.native_objects().get("Pex_Buffer", {}).get("live", 0)
+        bufs = [_buffer() for _ in range(3)]
+        bufs.pop().free()
+        stats = pex.native_objects()["Pex_Buffer"]
+        assert stats["live"] == before + 2
+        assert (stats["allocated"], stats["freed"]) == (3, 1)
+        assert stats["high_water"] == before + 3
+
+        pex.reset_native_objects()
+        stats = pex.native_objects()["Pex_Buffer"]
+        assert (stats["allocated"], stats["freed"], stats["high_water"]) == (0, 0, before + 2)
+        for buf in bufs:
+            buf.free()
+        assert pex.native_objects()["Pex_Buffer"]["live"] == before
+    assert fake.live_objects == 0
+
+
+def test_native_object_sites():
+    with FakeLib().installed():
+        pex.track_native_objects(debug=True)
+        buf = _buffer()
+        sites = [site for name, site in pex.native_object_sites() if name == "Pex_Buffer"]
+        assert any("_buffer" in "".join(site) for site in sites)
+        buf.free()
+        assert not any("_buffer" in "".join(site) for _, site in pex.native_object_sites())
+
+
+def test_check_native_leaks():
+    with FakeLib().installed():
+        with pex.check_native_leaks():
+            _buffer().free()
+
+        leaked = []
+        with pytest.raises(RuntimeError) as exc:
+            with pex.check_native_leaks():
+                leaked.append(_buffer())
+        assert "1 native objects leaked" in str(exc.value)
+        assert "Pex_Buffer allocated at" in str(exc.value)
+
+        with pex.check_native_leaks(ignore=("Pex_Buffer",)):
+            leaked.append(_buffer())
+        for buf in leaked:
+            buf.free()
+
+
+@pytest.mark.parametrize("prev", [(False, False), (True, False), (True, True)])
+def test_check_native_leaks_restores_the_tracking(prev):
+    pex.track_native_objects(*prev)
+    with FakeLib().installed():
+        with pex.check_native_leaks():
+            assert (_accounting.enabled, _accounting.debug) == (True, True)
+        assert (_accounting.enabled, _accounting.debug) == prev
+
+        with pytest.raises(ValueError):
+            with pex.check_native_leaks():
+                raise ValueError()
+        assert (_accounting.enabled, _accounting.debug) == prev
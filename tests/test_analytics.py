@@ -0,0 +1,84 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import random
+
+import pytest
+
+import pex
+from pex.export import np
+
+
+def _result(lookup_id, assets):
+    matches = []
+    for asset_id, segments in assets.items():
+        matches.append({
+            "asset": {"id": asset_id},
+            "match_details": {"audio": {"segments": [
+                {"query_start": s, "query_end": e, "asset_start": s + 100, "asset_end": e + 100}
+                for s, e in segments
+            ]}},
+        })
+    return {"lookup_ids": [lookup_id], "matches": matches}
+
+
+VECTORIZED = [False] + ([True] if np is not None else [])
+
+
+@pytest.mark.parametrize("vectorized", VECTORIZED)
+def test_coverage(vectorized):
+    results = [
+        _result("l1", {1: [(0, 10), (5, 15), (20, 25)], 2: [(3, 4)]}),
+        _result("l2", {1: [(24, 30)]}),
+    ]
+    cov = pex.segment_coverage(results, vectorized=vectorized)
+    assert set(cov) == {"1", "2"}
+    assert cov["1"].segments == [(0, 15), (20, 30)]
+    assert cov["1"].matched_seconds == 25
+    assert cov["1"].longest_match == 15
+    assert cov["2"].segments == [(3, 4)]
+
+    cov = pex.segment_coverage(results, side="asset", vectorized=vectorized)
+    assert cov["1"].segments == [(100, 115), (120, 130)]
+
+
+@pytest.mark.parametrize("vectorized", VECTORIZED)
+def test_searches_without_matches_are_ignored(vectorized):
+    results = [_result("l1", {}), _result("l2", {1: [(0, 10)]}), _result("l3", {})]
+    batch = pex.ResultBatch.from_results(results)
+    assert batch.num_rows == 3
+    cov = pex.segment_coverage(batch, vectorized=vectorized)
+    assert list(cov) == ["1"]
+    assert cov["1"].segments == [(0, 10)]
+    assert pex.segment_coverage(_result("l1", {}), vectorized=vectorized) == {}
+    assert pex.segment_coverage(batch, match_types=["melody"], vectorized=vectorized) == {}
+
+
+def test_implementations_agree():
+    pytest.importorskip("numpy")
+    rnd = random.Random(1)
+    results = []
+    for i in range(50):
+        assets = {}
+        for asset_id in rnd.sample(range(20), 5):
+            segments = []
+            for _ in range(rnd.randint(1, 10)):
+                start = rnd.uniform(0, 300)
+                segments.append((start, start + rnd.uniform(0, 30)))
+            assets[asset_id] = segments
+        results.append(_result("l{}".format(i), assets))
+    batch = pex.ResultBatch.from_results(results)
+    python = pex.segment_coverage(batch, vectorized=False)
+    vectorized = pex.segment_coverage(batch, vectorized=True)
+    assert python.keys() == vectorized.keys()
+    for asset_id, cov in python.items():
+        other = vectorized[asset_id]
+        assert cov.matched_seconds == pytest.approx(other.matched_seconds)
+        assert cov.longest_match == pytest.approx(other.longest_match)
+        assert len(cov.segments) == len(other.segments)
+        for segment, other_segment in zip(cov.segments, other.segments):
+            assert segment == pytest.approx(other_segment)
+
+
+def test_merge_segments():
+    assert pex.merge_segments([(5, 6), (0, 2), (1, 3), (3, 4)]) == [(0, 4), (5, 6)]
+    assert pex.merge_segments([]) == []
@@ -0,0 +1,109 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import pex
+from pex.breaker import BreakerState
+from pex.deadline import _deadline_exceeded
+from pex.fakelib import FakeLib, constant
+
+
+def _ok():
+    return "ok"
+
+
+def _fail(code=pex.Code.CONNECTION_ERROR):
+    raise pex.Error(code, "boom", True)
+
+
+def _call(breaker, fn, *args):
+    try:
+        return breaker._run(fn, *args)
+    except pex.Error as err:
+        return err
+
+
+def test_opens_half_opens_and_closes():
+    changes = []
+    breaker = pex.CircuitBreaker(
+        min_calls=4, open_seconds=0.05, half_open_calls=2,
+        on_state_change=lambda old, new: changes.append(new),
+    )
+    for _ in range(2):
+        _call(breaker, _ok)
+    for _ in range(2):
+        _call(breaker, _fail)
+    assert breaker.state == BreakerState.OPEN
+
+    err = _call(breaker, _ok)
+    assert err.code == pex.Code.CONNECTION_ERROR and err.is_retryable
+
+    time.sleep(0.06)
+    assert breaker.state == BreakerState.HALF_OPEN
+    assert _call(breaker, _ok) == "ok"
+    assert _call(breaker, _ok) == "ok"
+    assert breaker.state == BreakerState.CLOSED
+    assert changes == [BreakerState.OPEN, BreakerState.HALF_OPEN, BreakerState.CLOSED]
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_probe_failure_reopens():
+    breaker = pex.CircuitBreaker(min_calls=1, open_seconds=0.05)
+    _call(breaker, _fail)
+    time.sleep(0.06)
+    assert breaker.state == BreakerState.HALF_OPEN
+    _call(breaker, _fail)
+    assert breaker.state == BreakerState.OPEN
+    assert breaker.stats()["opened"] == 2
+
+
+def test_other_errors_are_successes():
+    breaker = pex.CircuitBreaker(min_calls=1)
+    for _ in range(10):
+        _call(breaker, _fail, pex.Code.NOT_FOUND)
+    with pytest.raises(ValueError):
+        breaker._run(int, "x")
+    assert breaker.state == BreakerState.CLOSED
+    assert breaker.stats()["calls"] == 10
+    assert breaker.stats()["failures"] == 0
+
+
+def test_local_deadlines_are_not_failures():
+    breaker = pex.CircuitBreaker(min_calls=1)
+
+    def local():
+        raise _deadline_exceeded()
+
+    for _ in range(10):
+        _call(breaker, local)
+    assert breaker.state == BreakerState.CLOSED
+    assert breaker.stats()["failures"] == 0
+
+
+def test_rate_limited_client_with_healthy_backend(tmp_path):
+    # Searches time out waiting for the rate limiter, not for the backend.
+    breaker = pex.CircuitBreaker(min_calls=5)
+    limiter = pex.HostRateLimiter(os.path.join(str(tmp_path), "rate"), {"search": 5, "check": 5})
+    fake = FakeLib(latency={"check": constant(0.01)}, global_lock=False)
+    with fake.installed():
+        client = pex.PexSearchClient("id", "secret", breaker=breaker, rate_limiter=limiter)
+        ft = client.fingerprint_buffer(b"x")
+        futures = [client.start_search(pex.PexSearchRequest(ft)) for _ in range(10)]
+
+        def get(future):
+            try:
+                return future.get(deadline=0.3)
+            except pex.Error as err:
+                return err
+
+        with ThreadPoolExecutor(10) as executor:
+            results = list(executor.map(get, futures))
+
+    assert any(isinstance(r, pex.Error) for r in results)
+    assert sum(fake.failures.values()) == 0
+    assert breaker.stats()["failures"] == 0
+    assert breaker.state == BreakerState.CLOSED
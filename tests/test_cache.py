@@ -0,0 +1,91 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import time
+
+import pytest
+
+import pex
+from pex.cache import MemoryCacheBackend, DiskCacheBackend
+from pex.fakelib import FakeLib, FakeError
+from pex.fingerprint import Fingerprint
+
+
+@pytest.fixture(params=["memory", "disk"])
+def backend_factory(request, tmp_path):
+    path = str(tmp_path / "cache.db")
+    if request.param == "memory":
+        return lambda max_entries: MemoryCacheBackend(max_entries)
+    return lambda max_entries: DiskCacheBackend(path, max_entries)
+
+
+def test_hits_and_misses(backend_factory):
+    cache = pex.SearchCache(ttl=60, backend=backend_factory(10))
+    assert cache.get("a") is None
+    cache.put("a", {"matches": [1]})
+    assert cache.get("a") == {"matches": [1]}
+    assert (cache.hits, cache.misses, cache.hit_rate) == (1, 1, 0.5)
+
+
+def test_expired_results_are_dropped(backend_factory):
+    cache = pex.SearchCache(ttl=0.05, backend=backend_factory(10))
+    cache.put("a", {})
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_are_evicted(backend_factory):
+    backend = backend_factory(3)
+    cache = pex.SearchCache(ttl=60, backend=backend)
+    for key in "abc":
+        cache.put(key, {})
+        time.sleep(0.01)
+    cache.get("a")
+    cache.put("b", {"replaced": True})
+    cache.put("d", {})
+    assert len(cache) == 3
+    assert backend.evictions == 1
+    assert cache.get("c") is None
+    assert cache.get("a") == {} and cache.get("b") == {"replaced": True} and cache.get("d") == {}
+
+
+def test_disk_count_is_shared(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = DiskCacheBackend(path, max_entries=5)
+    for i in range(4):
+        first.set(str(i), "{}", time.time() + 60)
+    second = DiskCacheBackend(path, max_entries=5)
+    second.set("x", "{}", time.time() + 60)
+    second.set("y", "{}", time.time() + 60)
+    assert len(first) == len(second) == 5
+    assert second.evictions == 1
+    first.clear()
+    assert len(second) == 0
+
+
+def test_searches_are_keyed_by_fingerprint_content():
+    with FakeLib(global_lock=False).installed() as fake:
+        client = pex.PexSearchClient("id", "secret", cache=pex.SearchCache(ttl=60))
+        ft = client.fingerprint_buffer(b"x")
+        first = client.start_search(pex.PexSearchRequest(ft)).get()
+        # Same content in a different object: served from the cache.
+        copy = Fingerprint(bytes(ft._ft))
+        assert client.start_search(pex.PexSearchRequest(copy)).get() == first
+        assert fake.calls["start"] == 1
+
+        client.start_search(pex.PexSearchRequest(ft, pex.PexSearchType.FIND_MATCHES)).get()
+        client.start_search(pex.PexSearchRequest(Fingerprint(b"other"))).get()
+        assert fake.calls["start"] == 3
+
+
+def test_errors_are_not_cached():
+    errors = {"check": [FakeError(1.0, pex.Code.NOT_FOUND, False)]}
+    with FakeLib(errors=errors, global_lock=False).installed() as fake:
+        cache = pex.SearchCache(ttl=60)
+        client = pex.PexSearchClient("id", "secret", cache=cache)
+        ft = client.fingerprint_buffer(b"x")
+        for _ in range(2):
+            with pytest.raises(pex.Error):
+                client.start_search(pex.PexSearchRequest(ft)).get()
+        assert fake.calls["start"] == 2
+        assert len(cache) == 0
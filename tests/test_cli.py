@@ -0,0 +1,68 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import json
+
+import pytest
+
+from pex import __main__ as cli
+from pex.fakelib import FakeLib, uniform
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    paths = []
+    for i in range(30):
+        path = tmp_path / "f{}.mp4".format(i)
+        path.write_bytes(b"x" * 100)
+        paths.append(str(path))
+    lines = ["# comment", ""] + paths + ["isrc:US1234567890"]
+    path = tmp_path / "manifest.txt"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path), paths
+
+
+def _run(manifest, output, client):
+    # Random latencies make the results complete out of order.
+    fake = FakeLib(latency={"check": uniform(0, 0.02)}, global_lock=False, seed=1)
+    with fake.installed():
+        return cli.main([
+            manifest, "--output", output, "--client", client,
+            "--client-id", "id", "--client-secret", "secret",
+        ])
+
+
+def _read(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_every_item_has_one_record(manifest, tmp_path):
+    path, paths = manifest
+    output = str(tmp_path / "out.jsonl")
+    assert _run(path, output, "pex") == 0
+
+    records = _read(output)
+    assert sorted(r["item"] for r in records) == sorted(paths + ["isrc:US1234567890"])
+    assert all("result" in r for r in records)
+
+
+def test_isrc_with_private_client_fails_only_that_item(manifest, tmp_path):
+    path, paths = manifest
+    output = str(tmp_path / "out.jsonl")
+    assert _run(path, output, "private") == 1
+
+    records = _read(output)
+    assert len(records) == len(paths) + 1
+    failed = [r for r in records if "error" in r]
+    assert [r["item"] for r in failed] == ["isrc:US1234567890"]
+    assert failed[0]["error"]["code"] == "INVALID_INPUT"
+
+
+def test_checkpoint_skips_completed_items(manifest, tmp_path):
+    path, paths = manifest
+    output = str(tmp_path / "out.jsonl")
+    assert _run(path, output, "pex") == 0
+    assert _run(path, output, "pex") == 0
+
+    # The second run found every item in the checkpoint.
+    assert len(_read(output)) == len(paths) + 1
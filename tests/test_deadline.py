@@ -0,0 +1,109 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import time
+
+import pytest
+
+import pex
+from pex.breaker import BreakerState
+from pex.fakelib import FakeLib, FakeError, constant
+
+
+def _wait_for(cond, timeout=5):
+    until = time.monotonic() + timeout
+    while not cond() and time.monotonic() < until:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_expiry_while_waiting_for_the_lock():
+    fake = FakeLib()
+    with fake.installed():
+        client = pex.PrivateSearchClient("id", "secret")
+        ft = client.fingerprint_buffer(b"x")
+        objects = fake.live_objects
+
+        fake.Pex_Lock()
+        try:
+            with pytest.raises(pex.Error) as exc:
+                client.ingest("a", ft, deadline=0.1)
+        finally:
+            fake.Pex_Unlock()
+        assert exc.value.code == pex.Code.DEADLINE_EXCEEDED
+
+        # The abandoned call gives up once it gets the lock, without calling
+        # the backend, and frees its native objects.
+        assert _wait_for(lambda: fake.live_objects == objects)
+        assert fake.calls["ingest"] == 0
+
+
+def test_expiry_during_the_native_call():
+    fake = FakeLib(latency={"ingest": constant(0.3)})
+    with fake.installed():
+        client = pex.PrivateSearchClient("id", "secret")
+        ft = client.fingerprint_buffer(b"x")
+        started = time.monotonic()
+        with pytest.raises(pex.Error) as exc:
+            client.ingest("a", ft, deadline=0.1)
+        assert exc.value.code == pex.Code.DEADLINE_EXCEEDED
+        assert time.monotonic() - started < 0.25
+
+        # The native call can't be interrupted and completes in the background.
+        assert _wait_for(lambda: client.get_entry("a") is not None)
+        assert fake.calls["ingest"] == 1
+
+
+def test_expired_deadline_fails_without_calling():
+    with FakeLib().installed() as fake:
+        client = pex.PexSearchClient("id", "secret")
+        ft = client.fingerprint_buffer(b"x")
+        deadline = pex.Deadline(0)
+        with pytest.raises(pex.Error) as exc:
+            client.start_search(pex.PexSearchRequest(ft), deadline=deadline)
+        assert exc.value.code == pex.Code.DEADLINE_EXCEEDED
+        assert fake.calls["start"] == 0
+
+
+def test_breaker_ignores_local_deadlines():
+    breaker = pex.CircuitBreaker(min_calls=1)
+    fake = FakeLib(latency={"ingest": constant(0.2)})
+    with fake.installed():
+        client = pex.PrivateSearchClient("id", "secret", breaker=breaker)
+        ft = client.fingerprint_buffer(b"x")
+        for _ in range(3):
+            with pytest.raises(pex.Error):
+                client.ingest("a", ft, deadline=0.05)
+        assert breaker.stats()["failures"] == 0
+        assert breaker.state == BreakerState.CLOSED
+
+
+def test_breaker_counts_backend_deadlines():
+    breaker = pex.CircuitBreaker(min_calls=1)
+    errors = {"ingest": [FakeError(1.0, pex.Code.DEADLINE_EXCEEDED, True)]}
+    with FakeLib(errors=errors).installed():
+        client = pex.PrivateSearchClient("id", "secret", breaker=breaker)
+        with pytest.raises(pex.Error):
+            client.ingest("a", client.fingerprint_buffer(b"x"), deadline=5)
+    assert breaker.stats()["failures"] == 1
+    assert breaker.state == BreakerState.OPEN
+
+
+def test_abandoned_list_keeps_the_cursor():
+    fake = FakeLib()
+    with fake.installed():
+        client = pex.PrivateSearchClient("id", "secret")
+        ft = client.fingerprint_buffer(b"x")
+        for i in range(4):
+            client.ingest("id{}".format(i), ft)
+        lister = client.list_entries(pex.ListEntriesRequest(limit=2))
+
+        fake._latency["list"] = constant(0.2)
+        with pytest.raises(pex.Error):
+            lister.list(deadline=0.05)
+        time.sleep(0.3)
+        assert lister.end_cursor == ""
+
+        del fake._latency["list"]
+        first = lister.list()
+        second = lister.list()
+    assert [e["provided_id"] for e in first + second] == ["id0", "id1", "id2", "id3"]
@@ -0,0 +1,81 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import math
+
+import pytest
+
+import pex
+from pex.export import NO_MATCH, MATCH_TYPES
+
+
+def _result(lookup_id, matches):
+    return {"lookup_ids": [lookup_id], "matches": matches}
+
+
+def _match(asset_id, match_type, segments):
+    return {
+        "asset": {"id": asset_id},
+        "match_details": {match_type: {"segments": [
+            {"query": {"start": qs, "end": qe}, "asset": {"start": as_, "end": ae}}
+            for qs, qe, as_, ae in segments
+        ]}},
+    }
+
+
+RESULTS = [
+    _result("l1", [_match(1, "audio", [(0, 10, 5, 15), (20, 30, 25, 35)]), _match(2, "melody", [(3, 4, 0, 1)])]),
+    _result("l2", []),
+    {"lookup_ids": ["l3"], "matches": [{"provided_id": "p1", "match_details": {
+        "video": {"segments": [{"query_start": 1, "query_end": 2, "asset_start": 3, "asset_end": 4}]},
+    }}]},
+]
+
+
+def _rows(batch):
+    names = batch.column_names
+    return list(zip(*(batch.column(name) for name in names)))
+
+
+def test_results_are_flattened():
+    rows = _rows(pex.ResultBatch.from_results(RESULTS))
+    assert rows[:3] == [
+        ("l1", "1", MATCH_TYPES.index("audio"), 0, 10, 5, 15),
+        ("l1", "1", MATCH_TYPES.index("audio"), 20, 30, 25, 35),
+        ("l1", "2", MATCH_TYPES.index("melody"), 3, 4, 0, 1),
+    ]
+    # The search without matches is recorded with null fields.
+    lookup_id, asset_id, code, *offsets = rows[3]
+    assert (lookup_id, asset_id, code) == ("l2", "", NO_MATCH)
+    assert all(math.isnan(v) for v in offsets)
+    assert rows[4] == ("l3", "p1", MATCH_TYPES.index("video"), 1, 2, 3, 4)
+
+
+def test_sink_round_trip(tmp_path):
+    directory = str(tmp_path / "results")
+    with pex.ColumnarResultSink(directory, batch_size=2) as sink:
+        for result in RESULTS * 3:
+            sink.write(result)
+    assert sink.results_written == 9
+    assert sink.rows_written == 15
+
+    batches = list(pex.read_batches(directory))
+    assert len(batches) == sink.batches_written
+    rows = [row for batch in batches for row in _rows(batch)]
+    expected = _rows(pex.ResultBatch.from_results(RESULTS * 3))
+    assert len(rows) == len(expected)
+    for row, exp in zip(rows, expected):
+        assert row[:3] == exp[:3]
+        assert all(a == b or (math.isnan(a) and math.isnan(b)) for a, b in zip(row[3:], exp[3:]))
+
+    # A new sink on the same directory appends chunks.
+    with pex.ColumnarResultSink(directory) as sink:
+        sink.write(RESULTS[0])
+    assert sum(b.num_rows for b in pex.read_batches(directory)) == 18
+
+
+def test_to_numpy():
+    pytest.importorskip("numpy")
+    arr = pex.ResultBatch.from_results(RESULTS).to_numpy()
+    assert arr.shape == (5,)
+    assert list(arr["lookup_id"]) == ["l1", "l1", "l1", "l2", "l3"]
+    assert arr["match_type"][3] == NO_MATCH
@@ -0,0 +1,49 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import hashlib
+
+import pytest
+
+import pex
+
+
+def _fts(n):
+    types = (None, pex.FingerprintType.AUDIO, pex.FingerprintType.ALL)
+    return [pex.Fingerprint(("ft%d" % i).encode() * (i + 1), types[i % 3]) for i in range(n)]
+
+
+def test_fingerprint_digest():
+    a = pex.Fingerprint(b"data", pex.FingerprintType.AUDIO)
+    b = pex.Fingerprint(b"data")
+    assert a.digest == hashlib.sha256(b"data").hexdigest()
+    assert a == b and hash(a) == hash(b)
+    assert a != pex.Fingerprint(b"other")
+    assert len({a, b}) == 1
+
+
+def test_batch():
+    fts = _fts(10)
+    batch = pex.FingerprintBatch(fts[:5])
+    batch.extend(fts[5:])
+    assert len(batch) == 10
+    assert list(batch) == fts
+    assert [ft.ft_types for ft in batch] == [ft.ft_types for ft in fts]
+    assert batch[-1] == fts[-1]
+    assert list(batch[2:8:3]) == fts[2:8:3]
+    assert batch.nbytes >= sum(ft.size for ft in fts)
+    with pytest.raises(IndexError):
+        batch[10]
+
+
+def test_batch_serialization():
+    fts = _fts(10)
+    data = pex.FingerprintBatch(fts).to_bytes()
+    batch = pex.FingerprintBatch.from_bytes(data)
+    assert list(batch) == fts
+    assert [ft.ft_types for ft in batch] == [ft.ft_types for ft in fts]
+    assert len(pex.FingerprintBatch.from_bytes(pex.FingerprintBatch().to_bytes())) == 0
+
+    with pytest.raises(ValueError):
+        pex.FingerprintBatch.from_bytes(data[:-1])
+    with pytest.raises(ValueError):
+        pex.FingerprintBatch.from_bytes(b"not a batch at all")
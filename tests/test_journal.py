@@ -0,0 +1,86 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import pex
+from pex.fakelib import FakeLib, FakeError, uniform
+
+
+ITEMS = [("key{}".format(i), b"x" * (i + 1)) for i in range(20)]
+
+
+def _client():
+    return pex.PexSearchClient("id", "secret")
+
+
+def test_resume_after_a_crash(tmp_path):
+    path = str(tmp_path / "searches.journal")
+    journal = pex.SearchJournal(path)
+
+    with FakeLib(latency={"check": uniform(0, 0.02)}, global_lock=False, seed=1).installed():
+        results = journal.run(_client(), iter(ITEMS), start_workers=4, collect_workers=4)
+        consumed = [next(results).key for _ in range(5)]
+        # The process dies: the last result was delivered but not
+        # acknowledged by asking for the next one.
+        results.close()
+    pending = set(journal.pending())
+    assert pending
+    assert not pending & set(consumed[:4])
+
+    # A torn line written by the crash is ignored.
+    with open(path, "a") as f:
+        f.write('{"k":"key')
+
+    with FakeLib(global_lock=False).installed() as fake:
+        results = list(pex.SearchJournal(path).run(_client(), iter(ITEMS)))
+    keys = [res.key for res in results]
+    assert sorted(keys) == sorted(key for key, _ in ITEMS if key not in consumed[:4])
+    assert {res.key for res in results if res.resumed} == pending
+    assert all(res.error is None for res in results)
+    # Resumed searches are only retrieved.
+    assert fake.calls["start"] == fake.calls["fingerprint"] == len(results) - len(pending)
+    assert fake.calls["check"] == len(results)
+
+    with FakeLib(global_lock=False).installed() as fake:
+        assert list(pex.SearchJournal(path).run(_client(), iter(ITEMS))) == []
+    assert fake.calls["check"] == 0
+
+
+def test_failed_items_are_searched_again(tmp_path):
+    path = str(tmp_path / "searches.journal")
+    errors = {"check": [FakeError(1.0, pex.Code.NOT_FOUND, False)]}
+    with FakeLib(errors=errors, global_lock=False).installed():
+        results = list(pex.SearchJournal(path).run(_client(), iter(ITEMS[:5])))
+    assert all(res.error is not None for res in results)
+    assert len(pex.SearchJournal(path).pending()) == 5
+
+    # The first retry resumes the started searches and fails again, the
+    # next one starts them from scratch.
+    with FakeLib(errors=errors, global_lock=False).installed() as fake:
+        results = list(pex.SearchJournal(path).run(_client(), iter(ITEMS[:5])))
+    assert all(res.resumed for res in results)
+    assert fake.calls["start"] == 0
+    assert pex.SearchJournal(path).pending() == []
+
+    with FakeLib(global_lock=False).installed() as fake:
+        results = list(pex.SearchJournal(path).run(_client(), iter(ITEMS[:5])))
+    assert not any(res.resumed for res in results)
+    assert all(res.error is None for res in results)
+    assert fake.calls["start"] == 5
+
+
+def test_compact(tmp_path):
+    path = str(tmp_path / "searches.journal")
+    journal = pex.SearchJournal(path)
+    with FakeLib(global_lock=False).installed():
+        list(journal.run(_client(), iter(ITEMS[:10])))
+        results = journal.run(_client(), iter(ITEMS))
+        next(results)
+        results.close()
+    pending = sorted(journal.pending())
+    size = len(open(path).readlines())
+
+    journal.compact()
+    assert len(open(path).readlines()) < size
+    assert sorted(journal.pending()) == pending
+    with FakeLib(global_lock=False).installed():
+        keys = {res.key for res in journal.run(_client(), iter(ITEMS))}
+    assert not keys & {key for key, _ in ITEMS[:10]}
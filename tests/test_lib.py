@@ -0,0 +1,45 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import sys
+import threading
+
+from pex.fakelib import FakeLib
+from pex.lib import _lib, _set_lib
+
+
+def test_swapping_the_library_while_it_is_used():
+    libs = (FakeLib(), FakeLib())
+    stop = threading.Event()
+    errors = []
+
+    def use():
+        while not stop.is_set():
+            try:
+                assert _lib.Pex_Status_OK.__self__ in libs
+            except BaseException as err:
+                errors.append(err)
+                return
+
+    prev = _set_lib(libs[0])
+    interval = sys.getswitchinterval()
+    # Switch threads as often as possible to hit the swap in progress.
+    sys.setswitchinterval(1e-6)
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    try:
+        for t in threads:
+            t.start()
+        for i in range(20000):
+            _set_lib(libs[i % 2])
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        sys.setswitchinterval(interval)
+        _set_lib(prev)
+    assert not errors
+
+    _set_lib(libs[1])
+    try:
+        assert _lib.Pex_Status_OK.__self__ is libs[1]
+    finally:
+        _set_lib(prev)
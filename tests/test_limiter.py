@@ -0,0 +1,94 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import pex
+from pex.fakelib import FakeLib, constant
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+
+
+def _overloaded():
+    raise pex.Error(pex.Code.RESOURCE_EXHAUSTED, "overloaded", True)
+
+
+def _concurrently(fn, n, workers):
+    def call(_):
+        try:
+            return fn()
+        except pex.Error as err:
+            return err
+
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(call, range(n)))
+
+
+def test_limit_grows_while_used():
+    limiter = pex.AdaptiveLimiter(initial=2, max_limit=6, tolerance=10)
+    _concurrently(lambda: limiter._run(None, _sleep, 0.005), 200, 16)
+    assert limiter.limit == 6
+    assert limiter.stats()["increases"] == 4
+    assert limiter.stats()["decreases"] == 0
+    assert [limit for _, limit in limiter.limit_history] == [3, 4, 5, 6]
+
+
+def test_limit_does_not_grow_while_unused():
+    limiter = pex.AdaptiveLimiter(initial=4, tolerance=100)
+    for _ in range(50):
+        limiter._run(None, _sleep, 0.005)
+    assert limiter.limit == 4
+
+
+def test_overload_cuts_the_limit():
+    limiter = pex.AdaptiveLimiter(initial=16, backoff=0.5)
+    with pytest.raises(pex.Error):
+        limiter._run(None, _overloaded)
+    assert limiter.limit == 8
+    assert limiter.stats()["overloads"] == 1
+
+    # Calls started before the decrease don't cut it again.
+    started = time.monotonic() - 1
+    limiter._acquire()
+    limiter._release("op", started, True)
+    assert limiter.limit == 8
+
+
+def test_slow_calls_cut_the_limit():
+    limiter = pex.AdaptiveLimiter(initial=8, tolerance=2)
+    for _ in range(5):
+        limiter._run(None, _sleep, 0.01)
+    limiter._run(None, _sleep, 0.1)
+    assert limiter.limit == 4
+    assert limiter.stats()["decreases"] == 1
+
+
+def test_min_limit_and_waiting_for_a_slot():
+    limiter = pex.AdaptiveLimiter(initial=1, min_limit=1)
+    with pytest.raises(pex.Error):
+        limiter._run(None, _overloaded)
+    assert limiter.limit == 1
+
+    limiter._acquire()
+    with pytest.raises(pex.Error) as exc:
+        limiter._acquire(pex.Deadline(0.05))
+    assert exc.value.code == pex.Code.DEADLINE_EXCEEDED
+
+
+def test_native_lock_contention_is_not_latency():
+    # The fake backend always answers in 20ms, but the calls queue for the
+    # native lock: their wall time grows with the concurrency while the time
+    # spent in the native call doesn't.
+    limiter = pex.AdaptiveLimiter(initial=8, tolerance=4)
+    with FakeLib(latency={"start": constant(0.02), "check": constant(0.02)}).installed():
+        client = pex.PexSearchClient("id", "secret", limiter=limiter)
+        ft = client.fingerprint_buffer(b"x")
+        futures = [client.start_search(pex.PexSearchRequest(ft)) for _ in range(40)]
+        results = _concurrently(lambda: futures.pop().get(), 40, 8)
+    assert all(isinstance(r, dict) for r in results)
+    assert limiter.stats()["decreases"] == 0
+    assert limiter.limit >= 8
@@ -0,0 +1,28 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import pex
+from pex.fakelib import FakeLib, FakeError
+
+
+def test_isrc_searches_are_deduplicated():
+    isrcs = ["US{:010d}".format(i % 20) for i in range(50)]
+    with FakeLib(global_lock=False, seed=1).installed() as fake:
+        client = pex.PexSearchClient("id", "secret")
+        results = list(client.start_isrc_searches(iter(isrcs), max_workers=4))
+
+    assert sorted(isrc for isrc, _ in results) == sorted(set(isrcs))
+    assert all(isinstance(res, dict) for _, res in results)
+    assert fake.calls["start"] == 20
+    assert fake.calls["check"] == 20
+
+
+def test_isrc_search_errors_are_per_isrc():
+    errors = {"check": [FakeError(0.5, pex.Code.NOT_FOUND, False)]}
+    with FakeLib(errors=errors, global_lock=False, seed=1).installed() as fake:
+        client = pex.PexSearchClient("id", "secret")
+        results = dict(client.start_isrc_searches("US{:010d}".format(i) for i in range(40)))
+
+    assert len(results) == 40
+    failed = [res for res in results.values() if isinstance(res, pex.Error)]
+    assert len(failed) == fake.failures["check"] > 0
+    assert all(err.code == pex.Code.NOT_FOUND for err in failed)
@@ -0,0 +1,86 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import time
+
+import pytest
+
+import pex
+from pex.fakelib import FakeLib, FakeError, constant, uniform
+from pex.pipeline import SearchPipeline
+
+
+def test_results_match_items():
+    fake = FakeLib(latency={"check": uniform(0, 0.01)}, global_lock=False, seed=1)
+    with fake.installed():
+        client = pex.PexSearchClient("id", "secret")
+        ft = client.fingerprint_buffer(b"x")
+        items = [b"a" * i for i in range(1, 41)] + [ft, pex.ISRCSearchRequest("US1234567890")]
+        pipeline = SearchPipeline(client, fingerprint_workers=2, start_workers=4, collect_workers=4)
+        results = list(pipeline.run(iter(items)))
+
+    assert sorted(r.index for r in results) == list(range(len(items)))
+    for r in results:
+        assert r.item is items[r.index]
+        assert r.error is None
+        assert r.result is not None
+    stats = pipeline.stats
+    assert stats["fingerprint"].processed == 40
+    assert stats["start"].processed == 42
+    assert stats["collect"].processed == 42
+
+
+def test_errors_are_per_item():
+    errors = {"check": [FakeError(0.5, pex.Code.NOT_FOUND, False)]}
+    fake = FakeLib(errors=errors, global_lock=False, seed=1)
+    with fake.installed():
+        client = pex.PrivateSearchClient("id", "secret")
+        items = [b"a" * i for i in range(1, 41)] + [pex.ISRCSearchRequest("US1234567890")]
+        results = list(SearchPipeline(client).run(items))
+
+    assert len(results) == len(items)
+    failed = [r for r in results if r.error is not None]
+    assert len(failed) == fake.failures["check"] + 1
+    isrc = [r for r in failed if r.index == len(items) - 1]
+    assert isrc[0].error.code == pex.Code.INVALID_INPUT
+    assert all(r.result is None for r in failed)
+
+
+def test_input_errors_are_raised():
+    def items():
+        yield b"a"
+        raise OSError("manifest unreadable")
+
+    with FakeLib(global_lock=False).installed():
+        client = pex.PexSearchClient("id", "secret")
+        with pytest.raises(OSError):
+            list(SearchPipeline(client).run(items()))
+
+
+def test_breaking_early_stops_the_workers():
+    fake = FakeLib(latency={"check": uniform(0, 0.01)}, global_lock=False)
+    with fake.installed():
+        client = pex.PexSearchClient("id", "secret")
+        pipeline = SearchPipeline(client, fingerprint_workers=2, start_workers=2, collect_workers=2, queue_size=1)
+        results = pipeline.run(b"a" * i for i in range(1, 1000))
+        for _ in results:
+            break
+        results.close()
+
+        for t in pipeline._threads:
+            t.join(timeout=5)
+        assert not any(t.is_alive() for t in pipeline._threads)
+    assert fake.calls["fingerprint"] < 999
+
+
+def test_close_waits_for_the_calls_in_progress():
+    fake = FakeLib(latency={"start": constant(0.05)}, global_lock=False)
+    with fake.installed():
+        client = pex.PexSearchClient("id", "secret")
+        pipeline = SearchPipeline(client, start_workers=4, collect_workers=1)
+        results = pipeline.run(pex.PexSearchRequest(pex.Fingerprint(b"x%d" % i)) for i in range(100))
+        next(results)
+        pipeline.close(wait=True)
+        calls = dict(fake.calls)
+        assert not any(t.is_alive() for t in pipeline._threads[1:])
+        time.sleep(0.1)
+    assert fake.calls == calls
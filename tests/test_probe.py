@@ -0,0 +1,119 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import struct
+
+import pytest
+
+import pex
+from pex.fakelib import FakeLib
+
+
+def _box(typ, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), typ) + payload
+
+
+def _mp4(codecs=(b"avc1", b"mp4a"), timescale=1000, duration=10000, moov_last=False):
+    ftyp = _box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2")
+    mvhd = _box(b"mvhd", struct.pack(">IIIII", 0, 0, 0, timescale, duration) + bytes(80))
+    traks = b""
+    for fmt in codecs:
+        stsd = _box(b"stsd", struct.pack(">II", 0, 1) + _box(fmt, bytes(16)))
+        traks += _box(b"trak", _box(b"mdia", _box(b"minf", _box(b"stbl", stsd))))
+    moov = _box(b"moov", mvhd + traks)
+    mdat = _box(b"mdat", bytes(1000))
+    if moov_last:
+        return ftyp + mdat + moov
+    return ftyp + moov + mdat
+
+
+def _adts(frames=100, sf_index=4):
+    # 44.1kHz, 1024 samples per frame, 200 bytes per frame.
+    length = 200
+    header = bytes((
+        0xff, 0xf1, 0x40 | (sf_index << 2), 0x80 | (length >> 11),
+        (length >> 3) & 0xff, ((length & 0x07) << 5) | 0x1f, 0xfc,
+    ))
+    return (header + bytes(length - 7)) * frames
+
+
+def _ts(packets=10):
+    return (b"\x47" + bytes(187)) * packets
+
+
+def test_probe_mp4():
+    info = pex.probe_buffer(_mp4())
+    assert info.container == "mp4"
+    assert info.codecs == ("h264", "aac")
+    assert info.duration == pytest.approx(10.0)
+
+
+def test_probe_mp4_with_moov_at_the_end(tmp_path):
+    path = tmp_path / "movie.mp4"
+    data = _mp4(codecs=(b"hvc1",), moov_last=True)
+    path.write_bytes(data)
+    assert pex.probe_file(str(path)) == pex.MediaInfo("mp4", ("h265",), 10.0, len(data))
+
+
+def test_probe_adts():
+    data = _adts(frames=100)
+    info = pex.probe_buffer(data)
+    assert info.container == "adts"
+    assert info.codecs == ("aac",)
+    assert info.duration == pytest.approx(100 * 1024 / 44100)
+
+
+def test_probe_adts_after_id3_tag():
+    tag = b"ID3\x04\x00\x00\x00\x00\x00\x0a" + bytes(10)
+    assert pex.probe_buffer(tag + _adts()).container == "adts"
+
+
+def test_probe_mpegts():
+    info = pex.probe_buffer(_ts())
+    assert (info.container, info.duration) == ("mpegts", None)
+
+
+def test_probe_other_files():
+    assert pex.probe_buffer(b"%PDF-1.7" + bytes(100)).container == "none"
+    assert pex.probe_buffer(b"\x89PNG\r\n\x1a\n" + bytes(100)).container == "none"
+    assert pex.probe_buffer(b"something else").container is None
+    assert pex.probe_buffer(b"") == pex.MediaInfo(None, (), 0.0, 0)
+
+
+@pytest.mark.parametrize("data", [_mp4(), _mp4(codecs=(b"mp4a",)), _adts(frames=100), _ts(), b"unknown format"])
+def test_validator_accepts(data):
+    validator = pex.MediaValidator()
+    assert validator.check_buffer(data).size == len(data)
+    assert validator.stats()["rejected"] == 0
+
+
+@pytest.mark.parametrize("data, reason", [
+    (b"", "empty"),
+    (b"%PDF-1.7" + bytes(100), "not media"),
+    (_mp4(codecs=(b"vp09",)), "unsupported codec"),
+    (_mp4(duration=500), "too short"),
+    (_adts(frames=10), "too short"),
+])
+def test_validator_rejects(data, reason):
+    validator = pex.MediaValidator()
+    with pytest.raises(pex.Error) as exc:
+        validator.check_buffer(data)
+    assert exc.value.code == pex.Code.INVALID_INPUT
+    assert not exc.value.is_retryable
+    assert validator.stats()["rejected_by_reason"] == {reason: 1}
+
+
+def test_validator_missing_file_is_left_to_the_fingerprinter(tmp_path):
+    assert pex.MediaValidator().check_file(str(tmp_path / "missing.mp4")) is None
+
+
+def test_rejected_inputs_dont_reach_the_fingerprinter():
+    with FakeLib().installed() as fake:
+        validator = pex.MediaValidator()
+        client = pex.PexSearchClient("id", "secret", validator=validator)
+        client.fingerprint_buffer(_mp4())
+        with pytest.raises(pex.Error):
+            client.fingerprint_buffer(b"%PDF-1.7" + bytes(100))
+
+    assert fake.calls["fingerprint"] == 1
+    stats = validator.stats()
+    assert (stats["checked"], stats["rejected"], stats["fingerprinted"]) == (2, 1, 1)
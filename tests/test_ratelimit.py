@@ -0,0 +1,88 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import json
+import multiprocessing
+import time
+
+import pytest
+
+import pex
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "quota")
+
+
+def _timed(limiter, op, n):
+    started = time.monotonic()
+    for _ in range(n):
+        limiter._acquire(op)
+    return time.monotonic() - started
+
+
+def test_burst_then_rate(path):
+    limiter = pex.HostRateLimiter(path, {"search": 20}, burst={"search": 5})
+    assert _timed(limiter, "search", 5) < 0.05
+    # The bucket is empty, the next tokens come at 20 per second.
+    assert 0.45 <= _timed(limiter, "search", 10) < 0.8
+    stats = limiter.stats()["search"]
+    assert stats["throttled"] >= 9
+    assert stats["resets"] == 0
+
+
+def test_refill(path):
+    limiter = pex.HostRateLimiter(path, {"check": 50})
+    _timed(limiter, "check", 50)
+    time.sleep(0.5)
+    assert _timed(limiter, "check", 20) < 0.1
+
+
+def test_buckets_are_per_operation(path):
+    limiter = pex.HostRateLimiter(path, {"search": 1})
+    limiter._acquire("search")
+    assert _timed(limiter, "ingest", 100) < 0.1
+    with pytest.raises(ValueError):
+        pex.HostRateLimiter(path, {"unknown": 1})
+
+
+def test_deadline_shorter_than_the_wait(path):
+    limiter = pex.HostRateLimiter(path, {"search": 1})
+    limiter._acquire("search")
+    with pytest.raises(pex.Error) as exc:
+        limiter._acquire("search", pex.Deadline(0.1))
+    assert exc.value.code == pex.Code.DEADLINE_EXCEEDED
+    # The token wasn't reserved: the next one is still due in a second.
+    tokens, _ = json.load(open(path))["search"]
+    assert tokens == pytest.approx(0, abs=0.2)
+
+
+@pytest.mark.parametrize("content", [b"", b"   ", b"{\"search\": [1.0,", b"[1, 2]", b"{\"search\": \"x\"}", b"\x00\xff"])
+def test_unreadable_state_is_reset(path, content):
+    with open(path, "wb") as f:
+        f.write(content)
+    limiter = pex.HostRateLimiter(path, {"search": 10})
+    limiter._acquire("search")
+    assert limiter.stats()["search"]["resets"] == (0 if not content.strip() else 1)
+    tokens, _ = json.load(open(path))["search"]
+    assert tokens == pytest.approx(9, abs=0.1)
+
+
+def _worker(path, n, out):
+    limiter = pex.HostRateLimiter(path, {"search": 20}, burst={"search": 1})
+    for _ in range(n):
+        limiter._acquire("search")
+    out.put(time.time())
+
+
+def test_processes_share_the_buckets(path):
+    out = multiprocessing.Queue()
+    started = time.time()
+    procs = [multiprocessing.Process(target=_worker, args=(path, 10, out)) for _ in range(2)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    finished = max(out.get() for _ in procs)
+    # 20 tokens at 20 per second, one of them from the initial burst.
+    assert finished - started >= 0.9
@@ -0,0 +1,76 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import pytest
+
+import pex
+from pex.fakelib import FakeLib, FakeError
+from pex.reconcile import _IDSet
+
+
+def test_id_set():
+    ids = _IDSet(["a", "b", "b", "c"] + ["id{}".format(i) for i in range(10000)])
+    assert len(ids) == 10003
+    assert not ids.is_marked("a")
+    assert ids.mark("a") and ids.is_marked("a")
+    assert ids.mark("id9999")
+    assert not ids.mark("missing") and not ids.is_marked("missing")
+    assert not ids.is_marked("b")
+
+
+def _catalog(client, ids):
+    ft = client.fingerprint_buffer(b"x")
+    for provided_id in ids:
+        client.ingest(provided_id, ft)
+    return ft
+
+
+def _listed(client):
+    lister = client.list_entries(pex.ListEntriesRequest(limit=1000))
+    ids = set()
+    while lister.has_next_page:
+        ids.update(e["provided_id"] for e in lister.list())
+    return ids
+
+
+def test_missing_and_extra_entries():
+    with FakeLib(global_lock=False).installed() as fake:
+        client = pex.PrivateSearchClient("id", "secret")
+        # 300 extra entries, more than the report samples, go through the
+        # temporary file.
+        ft = _catalog(client, ["keep{}".format(i) for i in range(50)] + ["old{}".format(i) for i in range(300)])
+        desired = ["keep{}".format(i) for i in range(50)] + ["new{}".format(i) for i in range(150)]
+
+        dry = client.reconcile(desired, dry_run=True, page_size=64)
+        assert (dry.desired, dry.listed, dry.to_ingest, dry.to_archive) == (200, 350, 150, 300)
+        assert (dry.ingested, dry.archived) == (0, 0)
+        assert len(dry.ingest_sample) == len(dry.archive_sample) == 100
+        assert all(i.startswith("old") for i in dry.archive_sample)
+        assert all(i.startswith("new") for i in dry.ingest_sample)
+        assert len(_listed(client)) == 350
+
+        report = client.reconcile(lambda: iter(desired), lambda provided_id: ft, page_size=64)
+        assert (report.ingested, report.archived, report.failed) == (150, 300, 0)
+        assert _listed(client) == set(desired)
+
+        again = client.reconcile(desired, lambda provided_id: ft)
+        assert (again.to_ingest, again.to_archive) == (0, 0)
+
+
+def test_failures_are_counted():
+    errors = {"archive": [FakeError(1.0, pex.Code.CONNECTION_ERROR, True)]}
+    with FakeLib(errors=errors, global_lock=False).installed():
+        client = pex.PrivateSearchClient("id", "secret")
+        ft = _catalog(client, ["old{}".format(i) for i in range(120)])
+        report = client.reconcile(["new"], lambda provided_id: ft)
+    assert (report.ingested, report.archived, report.failed) == (1, 0, 120)
+    assert len(report.failures) == 100
+    assert all(isinstance(err, pex.Error) for _, err in report.failures)
+
+
+def test_desired_must_be_iterable_twice():
+    with FakeLib(global_lock=False).installed():
+        client = pex.PrivateSearchClient("id", "secret")
+        with pytest.raises(ValueError):
+            client.reconcile(iter(["a"]), dry_run=True)
+        with pytest.raises(ValueError):
+            client.reconcile(["a"])
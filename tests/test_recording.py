@@ -0,0 +1,61 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import pytest
+
+import pex
+from pex.fakelib import FakeLib
+from pex.recording import RecordingLib, ReplayLib
+
+
+def _traffic(client):
+    # Runs a bit of everything against the client and returns what it got.
+    out = []
+    fts = [client.fingerprint_buffer(("media%d" % i).encode()) for i in range(3)]
+    for ft in fts:
+        out.append(client.start_search(pex.PrivateSearchRequest(ft)).get())
+    client.ingest("asset-1", fts[0])
+    client.ingest("asset-2", fts[1])
+    client.archive("asset-2")
+    out.append(client.get_entry("asset-1"))
+    out.append(client.list_entries(pex.ListEntriesRequest()).list())
+    try:
+        client.get_entry("asset-2")
+    except pex.Error as err:
+        out.append((err.code, err.is_retryable))
+    return out
+
+
+@pytest.mark.parametrize("name", ["traffic.jsonl", "traffic.jsonl.gz"])
+def test_replay_returns_the_recorded_responses(tmp_path, name):
+    path = str(tmp_path / name)
+    with FakeLib(matches=(1, 3), seed=1).installed():
+        with RecordingLib(path).installed() as recording:
+            recorded = _traffic(pex.PrivateSearchClient("id", "secret"))
+    assert recording.records == 12
+    assert recorded[-1] == (pex.Code.NOT_FOUND, False)
+
+    with ReplayLib(path, time_scale=0).installed() as replay:
+        replayed = _traffic(pex.PrivateSearchClient("id", "secret"))
+    assert replayed == recorded
+    assert replay.replayed == recording.records
+
+
+def test_unrecorded_requests_get_the_next_recorded_response(tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    with FakeLib(matches=(1, 1), seed=1).installed():
+        with RecordingLib(path).installed():
+            client = pex.PrivateSearchClient("id", "secret")
+            recorded = client.start_search(pex.PrivateSearchRequest(client.fingerprint_buffer(b"a"))).get()
+
+    with ReplayLib(path, time_scale=0).installed() as replay:
+        client = pex.PrivateSearchClient("id", "secret")
+        replayed = client.start_search(pex.PrivateSearchRequest(client.fingerprint_buffer(b"b"))).get()
+    assert replayed == recorded
+    assert replay.calls["start"] == replay.calls["check"] == 1
+
+
+def test_replay_rejects_other_files(tmp_path):
+    path = tmp_path / "other.jsonl"
+    path.write_text('{"op": "start"}\n')
+    with pytest.raises(ValueError):
+        ReplayLib(str(path))
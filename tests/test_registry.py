@@ -0,0 +1,77 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import time
+import uuid
+
+import pytest
+
+import pex
+from pex.fakelib import FakeLib, FakeError, constant
+
+
+def _credentials():
+    # The registry is process-wide, every test uses its own credentials.
+    return "id-" + uuid.uuid4().hex, "secret"
+
+
+def _delta(before, after):
+    return {k: after[k] - before[k] for k in ("inits", "failures", "shared", "reused")}
+
+
+def test_shared_clients_initialize_once():
+    creds = _credentials()
+    before = pex.client_init_stats()
+    with FakeLib().installed() as fake:
+        a = pex.PexSearchClient(*creds, shared=True)
+        b = pex.PexSearchClient(*creds, shared=True)
+        private = pex.PrivateSearchClient(*creds, shared=True)
+        own = pex.PexSearchClient(*creds)
+        b.fingerprint_buffer(b"x")
+
+    assert fake.calls["init"] == 3
+    assert a._c_client is b._c_client
+    assert private._c_client is not a._c_client
+    assert own._c_client is not a._c_client
+    assert a.init_seconds == b.init_seconds
+    assert _delta(before, pex.client_init_stats()) == {"inits": 3, "failures": 0, "shared": 2, "reused": 1}
+
+
+def test_failed_initialization_is_not_shared():
+    creds = _credentials()
+    errors = {"init": [FakeError(1.0, pex.Code.UNAUTHENTICATED, False)]}
+    before = pex.client_init_stats()
+    with FakeLib(errors=errors).installed():
+        with pytest.raises(pex.Error) as exc:
+            pex.PexSearchClient(*creds, shared=True)
+    assert exc.value.code == pex.Code.UNAUTHENTICATED
+
+    with FakeLib().installed() as fake:
+        pex.PexSearchClient(*creds, shared=True)
+    assert fake.calls["init"] == 1
+    assert _delta(before, pex.client_init_stats()) == {"inits": 2, "failures": 1, "shared": 1, "reused": 0}
+
+
+def test_background_init():
+    with FakeLib(latency={"init": constant(0.2)}).installed() as fake:
+        t0 = time.monotonic()
+        client = pex.PexSearchClient(*_credentials(), background_init=True)
+        assert time.monotonic() - t0 < 0.1
+        assert client.init_seconds is None
+        assert not client.wait_ready(0.01)
+
+        # Calls wait for the initialization.
+        client.fingerprint_buffer(b"x")
+        assert client.wait_ready(0)
+        assert client.init_seconds >= 0.2
+    assert fake.calls["init"] == 1
+
+
+def test_background_init_error_is_raised_by_the_calls():
+    errors = {"init": [FakeError(1.0, pex.Code.UNAUTHENTICATED, False)]}
+    with FakeLib(errors=errors).installed():
+        client = pex.PexSearchClient(*_credentials(), background_init=True, shared=True)
+        with pytest.raises(pex.Error):
+            client.wait_ready()
+        with pytest.raises(pex.Error) as exc:
+            client.start_search(pex.PexSearchRequest(pex.Fingerprint(b"x"))).get()
+    assert exc.value.code == pex.Code.UNAUTHENTICATED
@@ -0,0 +1,91 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import threading
+import time
+
+import pytest
+
+import pex
+
+
+def _wait_for(cond, timeout=5):
+    until = time.monotonic() + timeout
+    while not cond() and time.monotonic() < until:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_backlogged_classes_share_slots_by_weight():
+    scheduler = pex.Scheduler({"a": 3, "b": 1}, default="a")
+    order = []
+
+    def call(name):
+        scheduler._acquire(name)
+        order.append(name)
+        scheduler._release()
+
+    scheduler._acquire("a")
+    threads = [threading.Thread(target=call, args=(name,)) for name in ["a", "b"] * 40]
+    for t in threads:
+        t.start()
+    assert _wait_for(lambda: scheduler.queue_depth("a") + scheduler.queue_depth("b") == 80)
+    scheduler._release()
+    for t in threads:
+        t.join()
+
+    # While both classes are backlogged, a gets 3 slots for every one of b.
+    for n in (4, 20, 40):
+        assert order[:n].count("a") == 3 * order[:n].count("b")
+    stats = scheduler.stats()
+    assert stats["a"]["dispatched"] == 41 and stats["b"]["dispatched"] == 40
+    assert stats["a"]["queue_depth"] == stats["b"]["queue_depth"] == 0
+
+
+def test_idle_class_does_not_bank_credit():
+    scheduler = pex.Scheduler({"a": 1, "b": 1}, default="a")
+    for _ in range(10):
+        scheduler._acquire("a")
+        scheduler._release()
+
+    order = []
+
+    def call(name):
+        scheduler._acquire(name)
+        order.append(name)
+        scheduler._release()
+
+    scheduler._acquire("a")
+    threads = [threading.Thread(target=call, args=(name,)) for name in ["a", "b"] * 5]
+    for t in threads:
+        t.start()
+    assert _wait_for(lambda: scheduler.queue_depth("a") + scheduler.queue_depth("b") == 10)
+    scheduler._release()
+    for t in threads:
+        t.join()
+    # b, idle so far, alternates with a instead of going first 10 times.
+    assert order[:4].count("b") <= 3
+
+
+def test_deadline_expires_while_queued():
+    scheduler = pex.Scheduler()
+    scheduler._acquire(pex.Priority.INTERACTIVE)
+    with pytest.raises(pex.Error) as exc:
+        scheduler._acquire(pex.Priority.BATCH, pex.Deadline(0.05))
+    assert exc.value.code == pex.Code.DEADLINE_EXCEEDED
+    assert scheduler.stats()[pex.Priority.BATCH]["expired"] == 1
+    assert scheduler.queue_depth(pex.Priority.BATCH) == 0
+
+    # The expired call doesn't hold the slot.
+    scheduler._release()
+    scheduler._acquire(pex.Priority.BATCH, pex.Deadline(0.05))
+    scheduler._release()
+
+
+def test_priority_block():
+    scheduler = pex.Scheduler()
+    assert scheduler._current() == pex.Priority.INTERACTIVE
+    with scheduler.priority(pex.Priority.BATCH):
+        assert scheduler._current() == pex.Priority.BATCH
+    assert scheduler._current() == pex.Priority.INTERACTIVE
+    with pytest.raises(ValueError):
+        scheduler.priority("unknown")
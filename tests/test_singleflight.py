@@ -0,0 +1,63 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pex
+from pex.fakelib import FakeLib, FakeError, constant
+
+
+def _concurrently(fn, n=10):
+    def call(_):
+        try:
+            return fn()
+        except pex.Error as err:
+            return err
+
+    with ThreadPoolExecutor(n) as executor:
+        return list(executor.map(call, range(n)))
+
+
+def test_identical_searches_share_one_start_and_check():
+    latency = {"start": constant(0.1), "check": constant(0.1)}
+    with FakeLib(latency=latency, global_lock=False).installed() as fake:
+        single_flight = pex.SingleFlight()
+        client = pex.PexSearchClient("id", "secret", single_flight=single_flight)
+        ft = client.fingerprint_buffer(b"x")
+        futures = _concurrently(lambda: client.start_search(pex.PexSearchRequest(ft)))
+        results = _concurrently(lambda: futures[0].get())
+
+    assert all(f is futures[0] for f in futures)
+    assert all(r == results[0] for r in results)
+    assert fake.calls["start"] == 1
+    assert fake.calls["check"] == 1
+    assert (single_flight.requests, single_flight.coalesced) == (10, 9)
+    assert len(single_flight) == 0
+
+
+def test_start_errors_reach_every_waiter_and_are_not_kept():
+    errors = {"start": [FakeError(1.0, pex.Code.CONNECTION_ERROR, True)]}
+    with FakeLib(latency={"start": constant(0.1)}, errors=errors, global_lock=False).installed() as fake:
+        single_flight = pex.SingleFlight()
+        client = pex.PexSearchClient("id", "secret", single_flight=single_flight)
+        ft = client.fingerprint_buffer(b"x")
+        errs = _concurrently(lambda: client.start_search(pex.PexSearchRequest(ft)))
+        assert fake.calls["start"] == 1
+        assert all(isinstance(e, pex.Error) and e.code == pex.Code.CONNECTION_ERROR for e in errs)
+
+        # The failed search isn't shared anymore, the next request starts again.
+        assert len(single_flight) == 0
+        _concurrently(lambda: client.start_search(pex.PexSearchRequest(ft)), n=1)
+        assert fake.calls["start"] == 2
+
+
+def test_check_errors_reach_every_waiter_and_are_retried():
+    errors = {"check": [FakeError(1.0, pex.Code.CONNECTION_ERROR, True)]}
+    with FakeLib(latency={"check": constant(0.1)}, errors=errors, global_lock=False).installed() as fake:
+        client = pex.PexSearchClient("id", "secret", single_flight=pex.SingleFlight())
+        future = client.start_search(pex.PexSearchRequest(client.fingerprint_buffer(b"x")))
+        errs = _concurrently(future.get)
+        assert fake.calls["check"] == 1
+        assert all(isinstance(e, pex.Error) for e in errs)
+
+        _concurrently(future.get, n=1)
+        assert fake.calls["check"] == 2
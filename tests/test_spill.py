@@ -0,0 +1,103 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import os
+import threading
+
+import pytest
+
+from pex.fingerprint import Fingerprint, FingerprintType
+from pex.spill import SpillQueue
+
+
+def _ft(i, ft_types=None):
+    return Fingerprint(("ft%d" % i).encode() * 10, ft_types)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "queue.spill")
+
+
+def test_fifo_across_memory_and_log(path):
+    queue = SpillQueue(path, max_memory=100)
+    for i in range(20):
+        queue.put(str(i), _ft(i))
+    stats = queue.stats()
+    assert stats["queued"] == 20
+    assert stats["in_memory"] < 20 and stats["spilled"] > 0
+
+    items = [queue.get() for _ in range(20)]
+    assert [item.key for item in items] == [str(i) for i in range(20)]
+    assert [item.fingerprint for item in items] == [_ft(i) for i in range(20)]
+    assert queue.get(timeout=0) is None
+
+
+def test_fingerprint_types_survive_spilling(path):
+    queue = SpillQueue(path, max_memory=0)
+    queue.put("a", _ft(0, FingerprintType.AUDIO | FingerprintType.MELODY))
+    queue.put("b", _ft(1))
+    assert queue.stats()["in_memory"] == 0
+    assert queue.get().fingerprint.ft_types == FingerprintType.AUDIO | FingerprintType.MELODY
+    assert queue.get().fingerprint.ft_types is None
+
+
+def test_unacknowledged_items_are_redelivered(path):
+    queue = SpillQueue(path, max_memory=100)
+    for i in range(10):
+        queue.put(str(i), _ft(i, FingerprintType.VIDEO))
+    items = [queue.get() for _ in range(6)]
+    # Out of order: the acknowledged offset only covers 0 and 1.
+    for i in (0, 1, 3, 4):
+        queue.ack(items[i])
+    del queue
+
+    queue = SpillQueue(path)
+    keys = []
+    while True:
+        item = queue.get(timeout=0)
+        if item is None:
+            break
+        assert item.fingerprint.ft_types == FingerprintType.VIDEO
+        keys.append(item.key)
+        queue.ack(item)
+    assert keys == [str(i) for i in range(2, 10)]
+    assert os.path.getsize(path) == 0
+
+
+def test_torn_record_is_dropped(path):
+    queue = SpillQueue(path)
+    queue.put("a", _ft(0))
+    queue.put("b", _ft(1))
+    del queue
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    queue = SpillQueue(path)
+    assert len(queue) == 1
+    assert queue.get().key == "a"
+    queue.put("c", _ft(2))
+    assert queue.get().key == "c"
+
+
+def test_close_ends_consumers(path):
+    queue = SpillQueue(path, max_memory=100)
+    got = []
+
+    def consume():
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            got.append(item.key)
+            queue.ack(item)
+
+    threads = [threading.Thread(target=consume) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for i in range(200):
+        queue.put(str(i), _ft(i))
+    queue.close()
+    for t in threads:
+        t.join()
+    assert sorted(got, key=int) == [str(i) for i in range(200)]
+    assert queue.stats()["queued"] == 0
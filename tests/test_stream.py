@@ -0,0 +1,32 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import io
+
+import pex
+from pex.export import MATCH_TYPES
+from pex.fakelib import FakeLib
+
+
+def _run(fake, seconds=30):
+    with fake.installed():
+        client = pex.PexSearchClient("id", "secret")
+        monitor = pex.StreamMonitor(client, bytes_per_second=100, window=10, overlap=5)
+        return sorted(monitor.run(io.BytesIO(b"x" * 100 * seconds)), key=lambda w: w.index)
+
+
+def test_windows_cover_the_stream():
+    windows = _run(FakeLib(matches=(1, 3), global_lock=False, seed=1))
+    assert [(w.start, w.end) for w in windows] == [(0, 10), (5, 15), (10, 20), (15, 25), (20, 30)]
+    for w in windows:
+        assert w.error is None
+        assert w.matches
+        for m in w.matches:
+            assert m.asset_id
+            assert m.match_type in MATCH_TYPES
+            assert w.start <= m.stream_start <= m.stream_end
+
+
+def test_no_matches_give_no_stream_matches():
+    windows = _run(FakeLib(matches=(0, 0), global_lock=False))
+    assert windows
+    assert all(w.error is None and w.matches == [] for w in windows)
@@ -0,0 +1,95 @@
+# Copyright 2023 Pexeso Inc. All rights reserved.
+
+import os
+import time
+
+import pytest
+
+import pex
+from pex.fakelib import FakeLib, FakeError
+from pex.workqueue import WorkQueue, SQLiteWorkQueueBackend, FileSystemWorkQueueBackend
+
+
+@pytest.fixture(params=["sqlite", "fs"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteWorkQueueBackend(str(tmp_path / "queue.db"))
+    return FileSystemWorkQueueBackend(str(tmp_path / "queue"))
+
+
+def _files(tmp_path, n):
+    items = []
+    for i in range(n):
+        path = tmp_path / "f{}".format(i)
+        path.write_bytes(b"x" * 100)
+        items.append(("id/{}".format(i), str(path)))
+    return items
+
+
+def test_add_is_idempotent(backend):
+    queue = WorkQueue(backend)
+    assert queue.add([("a", "p1"), ("b", "p2")]) == 2
+    assert queue.add([("a", "p1"), ("c", "p3")]) == 1
+    assert queue.stats()["counts"]["pending"] == 3
+
+
+def test_expired_leases_are_handed_out_again(backend):
+    queue = WorkQueue(backend, lease_seconds=0.2)
+    queue.add([("a", "p1"), ("b", "p2")])
+    leased = [item.provided_id for item in queue.lease("w1", 5)]
+    assert sorted(leased) == ["a", "b"]
+    assert queue.lease("w2", 5) == []
+    assert queue.complete("w2", leased) == []
+
+    time.sleep(0.3)
+    assert queue.complete("w1", leased) == []
+    items = queue.lease("w2", 5)
+    assert sorted(item.provided_id for item in items) == ["a", "b"]
+    assert all(item.attempts == 1 for item in items)
+    assert sorted(queue.complete("w2", leased)) == ["a", "b"]
+    assert queue.complete("w2", leased) == []
+    assert queue.stats()["counts"]["done"] == 2
+
+
+def test_fail_retries_until_max_attempts(backend):
+    queue = WorkQueue(backend, max_attempts=2)
+    queue.add([("a", "p1")])
+    assert queue.fail("w1", ["a"], "boom") == []
+    for _ in range(2):
+        queue.lease("w1", 1)
+        assert queue.fail("w1", ["a"], "boom") == ["a"]
+    assert queue.lease("w1", 1) == []
+    assert queue.stats()["counts"]["failed"] == 1
+
+
+def test_process_completes_every_item(backend, tmp_path):
+    queue = WorkQueue(backend)
+    queue.add(_files(tmp_path, 50))
+    with FakeLib(global_lock=False).installed() as fake:
+        report = queue.process(pex.PrivateSearchClient("id", "secret"), batch_size=8)
+    assert report.completed == 50
+    assert (report.failed, report.retried, report.lost) == (0, 0, 0)
+    assert fake.calls["ingest"] == 50
+    assert queue.stats()["counts"]["done"] == 50
+
+
+def test_process_counts_final_failures(backend, tmp_path):
+    queue = WorkQueue(backend, max_attempts=3)
+    queue.add(_files(tmp_path, 10))
+    errors = {"ingest": [FakeError(1.0, pex.Code.CONNECTION_ERROR, True)]}
+    with FakeLib(errors=errors, global_lock=False).installed():
+        report = queue.process(pex.PrivateSearchClient("id", "secret"), batch_size=4)
+    assert report.completed == 0
+    assert report.failed == 10
+    assert report.retried == 20
+    assert queue.stats()["counts"]["failed"] == 10
+
+
+def test_process_does_not_retry_permanent_errors(backend, tmp_path):
+    queue = WorkQueue(backend, max_attempts=3)
+    queue.add(_files(tmp_path, 10))
+    errors = {"ingest": [FakeError(1.0, pex.Code.INVALID_INPUT, False)]}
+    with FakeLib(errors=errors, global_lock=False).installed() as fake:
+        report = queue.process(pex.PrivateSearchClient("id", "secret"), batch_size=4)
+    assert (report.failed, report.retried) == (10, 0)
+    assert fake.calls["ingest"] == 10